@@ -0,0 +1,131 @@
+import os
+import io
+import glob
+import time
+import multiprocessing
+from contextlib import redirect_stdout, redirect_stderr
+import main
+import GdocxStyle
+import GdocxDocPool
+import GdocxCommon
+
+'''
+Batch conversion of many sources with a pool of worker processes.
+
+Sources are given either by a glob of .txt files or by a manifest file,
+each line of which is:
+    INPUT_PATH [OUTPUT_PATH]
+Empty lines and lines starting with # are skipped. Relative paths of
+a manifest are resolved against its directory. If output path isn't given,
+output is put next to the input, or into outdir if it's provided.
+
+Workers initialize the module, default styles and the template of blank
+documents (see GdocxDocPool) once and convert many files. Every file is
+converted with a new context (see GdocxContext), so output is the same as
+of standalone python3 main.py run.
+'''
+
+class BatchResult:
+    def __init__(self, inpath: str, outpath: str):
+        self.inpath = inpath
+        self.outpath = outpath
+        self.ok = False
+        self.seconds = 0.0
+        self.error = None
+
+    def __str__(self):
+        if self.ok:
+            return f"OK   {self.seconds:8.2f}s  '{self.inpath}' -> '{self.outpath}'"
+        return f"FAIL {self.seconds:8.2f}s  '{self.inpath}': {self.error}"
+
+def default_outpath(inpath: str, outdir: str | None) -> str:
+    name = os.path.splitext(os.path.basename(inpath))[0] + ".docx"
+    if outdir is None:
+        return os.path.join(os.path.dirname(inpath), name)
+    return os.path.join(outdir, name)
+
+def read_manifest(path: str, outdir: str | None) -> list[(str, str)]:
+    base = os.path.dirname(path)
+    jobs = []
+    with open(path, "r") as file:
+        for line in file:
+            line = line.strip()
+            if line == "" or line.startswith("#"):
+                continue
+            paths = line.split()
+            inpath = os.path.join(base, paths[0])
+            if len(paths) > 1:
+                outpath = os.path.join(base, paths[1])
+            else:
+                outpath = default_outpath(inpath, outdir)
+            jobs.append((inpath, outpath))
+    return jobs
+
+# Returns pairs of absolute input and output paths.
+# batch is either a glob of sources or a path to manifest
+def collect_jobs(batch: str, outdir: str | None = None) -> list[(str, str)]:
+    if outdir is not None:
+        outdir = GdocxCommon.AbsPath(outdir)
+
+    if glob.has_magic(batch):
+        inpaths = sorted(glob.glob(batch))
+        jobs = [(inpath, default_outpath(inpath, outdir)) for inpath in inpaths]
+    else:
+        jobs = read_manifest(batch, outdir)
+
+    jobs = [(GdocxCommon.AbsPath(inpath), GdocxCommon.AbsPath(outpath)) for inpath, outpath in jobs]
+
+    inpaths_by_outpath = {}
+    for inpath, outpath in jobs:
+        other = inpaths_by_outpath.setdefault(outpath, inpath)
+        if other != inpath:
+            raise Exception(f"'{other}' and '{inpath}' would both be converted into '{outpath}'")
+    return jobs
+
+def init_worker(init_kwargs: dict[str, object], default_styles_path: str):
+    main.init_gostdocx(**init_kwargs)
+    # forked workers already have default styles of the parent
+    if GdocxStyle.DefaultStylesPath != default_styles_path:
+        GdocxStyle.init_default_styles(default_styles_path)
+    # template of blank documents is built once per worker, and the next
+    # blank document is made in advance, while the worker waits for a file
+    GdocxDocPool.set_pool_size(1)
+    GdocxDocPool.pool_for().fill()
+    # every file would overwrite the same trace
+    main.PROFILE_PATH = None
+
+def convert(job: (str, str)) -> BatchResult:
+    inpath, outpath = job
+    result = BatchResult(inpath, outpath)
+    output = io.StringIO()
+
+    start = time.perf_counter()
+    try:
+        # errors of handlers are printed and followed by exit(1)
+        with redirect_stdout(output), redirect_stderr(output):
+            main.process_txt(inpath, outpath)
+        result.ok = True
+    except SystemExit:
+        errors = [line for line in output.getvalue().splitlines() if line.startswith("ERROR")]
+        result.error = errors[-1] if len(errors) != 0 else "conversion exited"
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    result.seconds = time.perf_counter() - start
+    return result
+
+# Converts all jobs with jobs_count worker processes, yields BatchResult
+# as files are converted, in order of jobs
+def run_batch(jobs: list[(str, str)],
+    jobs_count: int,
+    init_kwargs: dict[str, object],
+    default_styles_path: str
+):
+    if jobs_count <= 1:
+        init_worker(init_kwargs, default_styles_path)
+        for job in jobs:
+            yield convert(job)
+        return
+
+    with multiprocessing.Pool(jobs_count, init_worker, (init_kwargs, default_styles_path)) as pool:
+        for result in pool.imap(convert, jobs):
+            yield result
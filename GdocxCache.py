@@ -0,0 +1,437 @@
+import io
+import os
+import json
+import hashlib
+import docx
+from lxml import etree
+from docx.oxml import parse_xml
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+import GdocxTree
+import GdocxCommon
+import GdocxImage
+import GdocxRender
+from GdocxState import GdocxState
+
+'''
+Incremental rendering: cache of rendered fragments of a source on disk.
+
+Segment of the tree (see GdocxTree) is split into fragments: consecutive
+top-level nodes up to a top-level macro (page-break, table, image, ...),
+at most MAX_FRAGMENT_NODES of them. Segments already end at doc macros.
+Nodes which can't be cached are fragments of their own, so that they don't
+keep their neighbours from the cache. Macros which add runs to the last
+paragraph (image-caption, run-styled, ...) belong to the fragment of the
+previous node, since they change its paragraph. If the last paragraph is
+still outside the fragment (e.g. previous node is a table), the fragment
+isn't stored.
+
+Fragment's key covers:
+    1. content hashes of its nodes (text and args of the whole subtree)
+        and options of parsing;
+    2. hashes of files of image, json-reader and table-csv macros;
+    3. styles of the document and Style values of the context;
+    4. numbering of images and numbered macros entering the fragment.
+
+Entry of a fragment keeps the XML of body elements it rendered, images
+it added and numbering after it. On hit, XML is spliced into the document:
+images are added to the package again and ids of relationships and
+drawings are renumbered, so the document is the same as if the fragment
+was rendered.
+
+Entries and images are touched when they're used. After a build, if the
+cache takes more than its max_bytes on disk, least recently used files
+are removed, except those the build used (see FragmentCache.prune).
+
+Fragments with macros which change anything else are always rendered:
+load-style changes styles of the document, doc ends the segment, chdir
+changes current dir, echo prints, other registered macros are unknown.
+'''
+
+VERSION = 1
+
+CACHEABLE_MACRO_NAMES = {
+    "page-break",
+    "unordered-list",
+    "unordered-list-item",
+    "paragraph-styled",
+    "ordered-list",
+    "ordered-list-item",
+    "image",
+    "image-caption",
+    "table",
+    "table-cell",
+    "table-csv",
+    "json-reader",
+    "json-field",
+    "run-styled",
+    "image-number-as-run",
+    "next-image-number-as-run",
+    "space",
+    "numbered",
+}
+
+# Macros which add runs to the last paragraph, which may be rendered
+# by the previous fragment
+ATTACHING_MACRO_NAMES = {
+    "image-caption",
+    "run-styled",
+    "json-field",
+    "image-number-as-run",
+    "next-image-number-as-run",
+    "space",
+}
+
+# Index of arg which is a path to file, by macro name
+FILE_ARGS = {
+    "image": 0,
+    "json-reader": 0,
+    "table-csv": 0,
+}
+
+# Top-level nodes of a fragment, so that an edit of a long run of text
+# doesn't render all of it again
+MAX_FRAGMENT_NODES = 64
+
+# Size of the cache on disk, see FragmentCache.prune
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+RELATIONSHIP_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+
+class Fragment:
+    def __init__(self):
+        self.nodes = []
+        self.cacheable = True
+        # has macros which add runs to the last paragraph
+        self.attaching = False
+        # paths of files from args, relative to ctx.cwd
+        self.files: list[str] = []
+
+    def add(self, node):
+        self.nodes.append(node)
+        for child, _ in GdocxTree.walk([node]):
+            if not isinstance(child, GdocxTree.MacroNode):
+                continue
+            if child.name not in CACHEABLE_MACRO_NAMES or not child.closed:
+                self.cacheable = False
+            if child.name in ATTACHING_MACRO_NAMES:
+                self.attaching = True
+            index = FILE_ARGS.get(child.name)
+            if index is not None and len(child.args) > index:
+                self.files.append(child.args[index])
+
+def is_attaching(node) -> bool:
+    for child, _ in GdocxTree.walk([node]):
+        if isinstance(child, GdocxTree.MacroNode) and child.name in ATTACHING_MACRO_NAMES:
+            return True
+    return False
+
+def split_fragments(nodes: list) -> list[Fragment]:
+    fragments = []
+    # fragment which the next node joins, None after a top-level macro
+    joinable = None
+    for node in nodes:
+        if is_attaching(node):
+            if len(fragments) == 0:
+                # attaches to a paragraph from outside of the segment
+                fragments.append(Fragment())
+                fragments[-1].cacheable = False
+            fragments[-1].add(node)
+        else:
+            fragment = Fragment()
+            fragment.add(node)
+            if not fragment.cacheable:
+                fragments.append(fragment)
+                joinable = None
+                continue
+            if joinable is None or not joinable.cacheable or len(joinable.nodes) >= MAX_FRAGMENT_NODES:
+                joinable = Fragment()
+                fragments.append(joinable)
+            joinable.add(node)
+        if isinstance(node, GdocxTree.MacroNode):
+            joinable = None
+    return fragments
+
+# Hashes of files by (path, mtime, size), so that unchanged files
+# are not read again by rebuilds of watch mode
+FileDigests: dict[tuple[str, int, int], str] = {}
+
+def file_digest(path: str) -> str | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = (path, st.st_mtime_ns, st.st_size)
+    digest = FileDigests.get(key)
+    if digest is None:
+        with open(path, "rb") as file:
+            digest = hashlib.sha1(file.read()).hexdigest()
+        FileDigests[key] = digest
+    return digest
+
+def styles_digest(doc: docx.document.Document) -> str:
+    return hashlib.sha1(etree.tostring(doc.styles.element)).hexdigest()
+
+def numbering_state(state: GdocxState) -> dict[str, object]:
+    ctx = state.ctx
+    return {
+        "image_free_number": ctx.image_free_number,
+        "number_dicts": ctx.number_dicts,
+        "prev_in_macro_names": ctx.prev_in_macro_names,
+    }
+
+# Returns None if some file of the fragment doesn't exist
+def fragment_key(state: GdocxState, fragment: Fragment, styles_key: str) -> str | None:
+    ctx = state.ctx
+    files = []
+    for path in fragment.files:
+        digest = file_digest(ctx.use_path(path))
+        if digest is None:
+            return None
+        files.append(digest)
+
+    h = hashlib.sha1()
+    h.update(json.dumps([
+        VERSION,
+        docx.__version__,
+        [ctx.strip_indent, ctx.skip_empty, ctx.indent_string],
+        styles_key,
+        vars(ctx.style),
+        GdocxImage.options_key(ctx),
+        files,
+        numbering_state(state),
+    ], sort_keys = True).encode())
+    for node in fragment.nodes:
+        h.update(node.hash)
+    return h.hexdigest()
+
+class FragmentCache:
+    def __init__(self, dirpath: str, max_bytes: int = MAX_CACHE_BYTES):
+        self.dirpath = os.path.abspath(dirpath)
+        self.images_dir = os.path.join(self.dirpath, "images")
+        self.max_bytes = max_bytes
+        # paths of files used since the last prune
+        self.used: set[str] = set()
+        os.makedirs(self.images_dir, exist_ok = True)
+
+    # mtime is the time of last use, for prune
+    def touch(self, path: str):
+        self.used.add(path)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.dirpath, key + ".json")
+
+    def image_path(self, digest: str) -> str:
+        return os.path.join(self.images_dir, digest)
+
+    def load(self, key: str) -> dict[str, object] | None:
+        try:
+            with open(self.entry_path(key), "r") as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        self.touch(self.entry_path(key))
+        return entry
+
+    def read_image(self, digest: str) -> bytes:
+        with open(self.image_path(digest), "rb") as file:
+            blob = file.read()
+        self.touch(self.image_path(digest))
+        return blob
+
+    def store(self, key: str, entry: dict[str, object], blobs: dict[str, bytes]):
+        for digest, blob in blobs.items():
+            if os.path.exists(self.image_path(digest)):
+                self.touch(self.image_path(digest))
+            else:
+                GdocxCommon.write_atomic(self.image_path(digest), blob)
+                self.used.add(self.image_path(digest))
+        GdocxCommon.write_atomic(self.entry_path(key), json.dumps(entry).encode())
+        self.used.add(self.entry_path(key))
+
+    # Removes least recently used entries and images until the cache fits
+    # into max_bytes, files used since the last prune are kept. An entry
+    # whose image is removed is a miss. Returns number of removed files
+    def prune(self) -> int:
+        files = []
+        total = 0
+        for dirpath in (self.dirpath, self.images_dir):
+            with os.scandir(dirpath) as entries:
+                for entry in entries:
+                    if not entry.is_file():
+                        continue
+                    st = entry.stat()
+                    total += st.st_size
+                    if entry.path not in self.used:
+                        files.append((st.st_mtime_ns, st.st_size, entry.path))
+        self.used = set()
+
+        removed = 0
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+# sectPr which ends the body, or None
+def body_sect_pr(body):
+    last = next(body.iterchildren(reversed = True), None)
+    if last is not None and last.tag == qn('w:sectPr'):
+        return last
+    return None
+
+# Last body element before sectPr, None if there are none
+def last_body_element(body):
+    sect_pr = body_sect_pr(body)
+    if sect_pr is not None:
+        return sect_pr.getprevious()
+    return next(body.iterchildren(reversed = True), None)
+
+def body_elements_after(body, anchor) -> list:
+    elements = anchor.itersiblings() if anchor is not None else body.iterchildren()
+    return [element for element in elements if element.tag != qn('w:sectPr')]
+
+def rid_number(rid: str) -> int:
+    digits = rid[3:]
+    return int(digits) if digits.isdigit() else 0
+
+# Entry of rendered elements, None if they can't be spliced back
+def make_entry(state: GdocxState, elements: list, last_before) -> (dict[str, object] | None, dict[str, bytes]):
+    related_parts = state.doc.part.related_parts
+    images = {}
+    blobs = {}
+    for element in elements:
+        for child in element.iter():
+            for name, rid in child.attrib.items():
+                if not name.startswith(RELATIONSHIP_NS):
+                    continue
+                if name != qn('r:embed') or rid not in related_parts:
+                    return None, {}
+                if rid not in images:
+                    blob = related_parts[rid].blob
+                    digest = hashlib.sha1(blob).hexdigest()
+                    images[rid] = digest
+                    blobs[digest] = blob
+
+    last = None
+    last_after = state.doc_receiver.last
+    if last_after is not last_before:
+        indexes = [index for index, element in enumerate(elements) if element is last_after._p]
+        if len(indexes) == 0:
+            return None, {}
+        last = indexes[0]
+
+    exit_state = numbering_state(state)
+    exit_state["current_macro_name"] = state.current_macro_name
+    entry = {
+        "elements": [etree.tostring(element, encoding = "unicode") for element in elements],
+        # in order of creation of relationships, which is order of rendering
+        "images": sorted(images.items(), key = lambda item: rid_number(item[0])),
+        "last": last,
+        "exit": exit_state,
+    }
+    return entry, blobs
+
+def render_and_store(state: GdocxState, cache: FragmentCache, fragment: Fragment, key: str):
+    body = state.doc.element.body
+    anchor = last_body_element(body)
+    last_before = state.doc_receiver.last
+    last_before_xml = None
+    if fragment.attaching and last_before is not None:
+        last_before_xml = etree.tostring(last_before._p)
+
+    GdocxRender.render_nodes(state, fragment.nodes)
+
+    # fragment changed a paragraph rendered before it
+    if last_before_xml is not None and etree.tostring(last_before._p) != last_before_xml:
+        return
+
+    entry, blobs = make_entry(state, body_elements_after(body, anchor), last_before)
+    if entry is not None:
+        cache.store(key, entry, blobs)
+
+# Returns False if entry can't be used
+def splice(state: GdocxState, cache: FragmentCache, entry: dict[str, object]) -> bool:
+    try:
+        blobs = {digest: cache.read_image(digest) for _, digest in entry["images"]}
+    except OSError:
+        return False
+
+    doc = state.doc
+    elements = [parse_xml(xml) for xml in entry["elements"]]
+
+    rids = {}
+    for old_rid, digest in entry["images"]:
+        rids[old_rid], _ = doc.part.get_or_add_image(io.BytesIO(blobs[digest]))
+
+    # ids of drawings are renumbered in order of their creation
+    doc_prs = []
+    for element in elements:
+        for blip in element.iter(qn('a:blip')):
+            blip.set(qn('r:embed'), rids[blip.get(qn('r:embed'))])
+        doc_prs += element.iter(qn('wp:docPr'))
+    doc_prs.sort(key = lambda doc_pr: int(doc_pr.get('id')))
+    for doc_pr in doc_prs:
+        doc_pr.set('id', '0')
+
+    body = doc.element.body
+    sect_pr = body_sect_pr(body)
+    for element in elements:
+        if sect_pr is not None:
+            sect_pr.addprevious(element)
+        else:
+            body.append(element)
+
+    for doc_pr in doc_prs:
+        doc_pr.set('id', str(doc.part.next_id))
+
+    ctx = state.ctx
+    exit_state = entry["exit"]
+    ctx.image_free_number = exit_state["image_free_number"]
+    ctx.number_dicts = exit_state["number_dicts"]
+    ctx.prev_in_macro_names = exit_state["prev_in_macro_names"]
+    state.current_macro_name = exit_state["current_macro_name"]
+    if entry["last"] is not None:
+        state.doc_receiver.set_last_paragraph(Paragraph(elements[entry["last"]], doc._body))
+    return True
+
+# Renders segment like GdocxRender.render_segment, taking fragments
+# from cache where possible. Counts are added to ctx.cache_stats
+def render_segment(state: GdocxState, segment: GdocxTree.Segment, cache: FragmentCache):
+    stats = state.ctx.cache_stats
+    styles_key = None
+
+    for fragment in split_fragments(segment.children):
+        key = None
+        if fragment.cacheable:
+            if styles_key is None:
+                styles_key = styles_digest(state.doc)
+            key = fragment_key(state, fragment, styles_key)
+
+        if key is None:
+            stats["uncached"] += 1
+            GdocxRender.render_nodes(state, fragment.nodes)
+            # load-style may have changed styles
+            styles_key = None
+            continue
+
+        entry = cache.load(key)
+        if entry is not None and splice(state, cache, entry):
+            stats["hits"] += 1
+            continue
+
+        stats["misses"] += 1
+        render_and_store(state, cache, fragment, key)
+
+def format_stats(stats: dict[str, int]) -> str:
+    return f"Cache: {stats['hits']} hits, {stats['misses']} misses, {stats['uncached']} not cacheable"
@@ -0,0 +1,260 @@
+import os
+import argparse
+import GdocxTree
+import GdocxParsing
+from GdocxTree import ParseError
+
+'''
+Validation of a source without building a document.
+
+Doesn't import python-docx, so it can be used in pre-commit hooks:
+    python3 GdocxCheck.py -i YOUR_FILE.txt -s -se
+
+It finds unknown macros, bad arguments, wrong nesting, content inside
+macros which don't accept it, unclosed macros and missing files. Relative
+paths are resolved the same way as during conversion, following chdir macros.
+All errors are collected with their line numbers.
+
+Rules for every macro of GdocxHandler are in MACRO_SPECS. Macros which are
+registered in addition to them can be passed as extra_macro_names, their
+arguments and content are not checked.
+'''
+
+class MacroSpec:
+    def __init__(self,
+        min_args: int = 0,
+        accepts_text: bool = False,
+        parent: str | None = None,
+        # checks arguments, appends errors: (checker, node, args) -> None
+        check_args = None,
+        # indexes of args which are paths to files
+        file_args: list[int] = [],
+        # sets receiver for macros inside
+        is_receiver: bool = False,
+    ):
+        self.min_args = min_args
+        self.accepts_text = accepts_text
+        self.parent = parent
+        self.check_args = check_args
+        self.file_args = file_args
+        self.is_receiver = is_receiver
+
+def check_int(checker: 'Checker', node: GdocxTree.MacroNode, index: int, what: str) -> int | None:
+    try:
+        value = int(node.args[index])
+    except ValueError:
+        checker.error(node.lineno, f"{node.name} {what} (= {node.args[index]}) must be an integer")
+        return None
+    if value < 0:
+        checker.error(node.lineno, f"{node.name} {what} (= {value}) must not be negative")
+        return None
+    return value
+
+def check_image_args(checker: 'Checker', node: GdocxTree.MacroNode):
+    for index, what in [(1, "width"), (2, "height")]:
+        if len(node.args) <= index or node.args[index] == "None":
+            continue
+        try:
+            float(node.args[index])
+        except ValueError:
+            checker.error(node.lineno, f"{node.name} {what} (= {node.args[index]}) must be a number of Cm or None")
+
+def check_table_args(checker: 'Checker', node: GdocxTree.MacroNode):
+    check_int(checker, node, 0, "rows")
+    check_int(checker, node, 1, "cols")
+
+def check_table_cell_args(checker: 'Checker', node: GdocxTree.MacroNode):
+    row = check_int(checker, node, 0, "row")
+    col = check_int(checker, node, 1, "col")
+    table = checker.parent_node()
+    if table is None or table.name != "table" or len(table.args) < 2:
+        return
+    try:
+        rows = int(table.args[0])
+        cols = int(table.args[1])
+    except ValueError:
+        return
+    if row is not None and row >= rows:
+        checker.error(node.lineno, f"{node.name} row (= {row}) number must be between 0 and {rows - 1} inclusive")
+    if col is not None and col >= cols:
+        checker.error(node.lineno, f"{node.name} col (= {col}) number must be between 0 and {cols - 1} inclusive")
+
+def check_table_csv_args(checker: 'Checker', node: GdocxTree.MacroNode):
+    if len(node.args) > 2:
+        check_int(checker, node, 2, "header-rows")
+
+def check_space_args(checker: 'Checker', node: GdocxTree.MacroNode):
+    if len(node.args) > 0:
+        check_int(checker, node, 0, "count")
+
+def check_numbered_args(checker: 'Checker', node: GdocxTree.MacroNode):
+    if len(node.args) > 1 and node.args[0] == "True" and len(node.args) != 2:
+        checker.error(node.lineno, f"{node.name} if 1'st arg == True, the 2nd (macro_name) must be provided. Do not provide any more args.")
+
+def check_json_reader_args(checker: 'Checker', node: GdocxTree.MacroNode):
+    if len(node.args) > 1:
+        check_int(checker, node, 1, "record")
+
+def check_json_field_args(checker: 'Checker', node: GdocxTree.MacroNode):
+    receiver = checker.receiver_node()
+    if receiver is None or receiver.name != "json-reader":
+        checker.error(node.lineno, f"{node.name} can only be used inside json-reader")
+
+MACRO_SPECS: dict[str, MacroSpec] = {
+    "echo": MacroSpec(),
+    "chdir": MacroSpec(min_args = 1),
+    "page-break": MacroSpec(),
+    "unordered-list": MacroSpec(),
+    "unordered-list-item": MacroSpec(accepts_text = True, parent = "unordered-list"),
+    "paragraph-styled": MacroSpec(min_args = 1, accepts_text = True),
+    "load-style": MacroSpec(min_args = 1, file_args = [0]),
+    "ordered-list": MacroSpec(),
+    "ordered-list-item": MacroSpec(accepts_text = True, parent = "ordered-list"),
+    "image": MacroSpec(min_args = 1, check_args = check_image_args, file_args = [0]),
+    "image-caption": MacroSpec(accepts_text = True),
+    "table": MacroSpec(min_args = 2, check_args = check_table_args),
+    "table-cell": MacroSpec(min_args = 2, accepts_text = True, parent = "table",
+        check_args = check_table_cell_args, is_receiver = True),
+    "table-csv": MacroSpec(min_args = 1, check_args = check_table_csv_args, file_args = [0]),
+    "doc": MacroSpec(min_args = 1, file_args = [0]),
+    "json-reader": MacroSpec(min_args = 1, check_args = check_json_reader_args, file_args = [0], is_receiver = True),
+    "json-field": MacroSpec(min_args = 1, check_args = check_json_field_args),
+    "run-styled": MacroSpec(accepts_text = True),
+    "image-number-as-run": MacroSpec(),
+    "next-image-number-as-run": MacroSpec(),
+    "space": MacroSpec(check_args = check_space_args),
+    "numbered": MacroSpec(check_args = check_numbered_args, is_receiver = True),
+}
+
+class Checker:
+    def __init__(self, cwd: str, extra_macro_names: list[str] = []):
+        self.errors: list[ParseError] = []
+        # current dir as it'll be during conversion
+        self.cwd = cwd
+        self.extra_macro_names = set(extra_macro_names)
+        # enclosing macro nodes
+        self.stack: list[GdocxTree.MacroNode] = []
+
+    def error(self, lineno: int, msg: str):
+        self.errors.append(ParseError(lineno, msg))
+
+    def parent_node(self) -> GdocxTree.MacroNode | None:
+        if len(self.stack) < 2:
+            return None
+        return self.stack[-2]
+
+    # Closest enclosing macro which sets state.receiver
+    def receiver_node(self) -> GdocxTree.MacroNode | None:
+        for node in reversed(self.stack[:-1]):
+            spec = MACRO_SPECS.get(node.name)
+            if spec is not None and spec.is_receiver:
+                return node
+        return None
+
+    def check_tree(self, tree: GdocxTree.Tree):
+        self.errors += tree.errors
+        for segment in tree.segments:
+            self.check_segment(segment)
+        if tree.stopped_at is not None:
+            self.error(tree.stopped_at, "End of macro outside of any macro, the rest of the file is ignored")
+        self.errors.sort(key = lambda error: error.lineno)
+
+    def check_segment(self, segment: GdocxTree.Segment):
+        # stack of children iterators, parallel to self.stack
+        iters = [iter(segment.children)]
+        self.stack = []
+
+        while len(iters) != 0:
+            child = next(iters[-1], None)
+            if child is None:
+                iters.pop()
+                if len(self.stack) != 0:
+                    self.exit_macro(self.stack.pop())
+                continue
+
+            if isinstance(child, GdocxTree.TextNode):
+                self.check_text(child)
+                continue
+
+            self.stack.append(child)
+            self.enter_macro(child)
+            iters.append(iter(child.children))
+
+    def check_text(self, node: GdocxTree.TextNode):
+        if len(self.stack) == 0:
+            return
+        macro = self.stack[-1]
+        spec = MACRO_SPECS.get(macro.name)
+        if spec is not None and not spec.accepts_text:
+            self.error(node.lineno, f"You must not place content inside {macro.name}")
+
+    def enter_macro(self, node: GdocxTree.MacroNode):
+        spec = MACRO_SPECS.get(node.name)
+        if spec is None:
+            if node.name not in self.extra_macro_names:
+                self.error(node.lineno, "Couldn't find macro: %s" % node.name)
+            return
+
+        if len(node.args) < spec.min_args:
+            self.error(node.lineno, f"{node.name} must have at least {spec.min_args} args")
+            return
+
+        if spec.parent is not None:
+            parent = self.parent_node()
+            if parent is None or parent.name != spec.parent:
+                self.error(node.lineno, f"{node.name} macro must be inside {spec.parent} macro")
+
+        if spec.check_args is not None:
+            spec.check_args(self, node)
+
+        for index in spec.file_args:
+            path = os.path.join(self.cwd, node.args[index])
+            if not os.path.isfile(path):
+                self.error(node.lineno, f"{node.name}: file {node.args[index]} doesn't exist")
+
+    def exit_macro(self, node: GdocxTree.MacroNode):
+        if not node.closed:
+            self.error(node.lineno, f"{node.name} macro is never closed, it won't be finalized")
+            return
+
+        # chdir changes directory when it's finalized
+        if node.name == "chdir" and len(node.args) != 0:
+            path = os.path.join(self.cwd, node.args[0])
+            if not os.path.isdir(path):
+                self.error(node.lineno, f"{node.name}: directory {node.args[0]} doesn't exist")
+            else:
+                self.cwd = os.path.normpath(path)
+
+# Returns all errors of the source, empty list if there are none
+def check_txt(filepath: str,
+    strip_indent: bool = False,
+    skip_empty: bool = False,
+    indent_string: str | None = None,
+    extra_macro_names: list[str] = [],
+    cwd: str | None = None
+) -> list[ParseError]:
+    with open(filepath, "r") as file:
+        tree = GdocxTree.parse(file.read(), strip_indent, skip_empty, indent_string)
+    if cwd is None:
+        cwd = os.getcwd()
+    checker = Checker(cwd, extra_macro_names)
+    checker.check_tree(tree)
+    return checker.errors
+
+if __name__ == "__main__":
+    prs = argparse.ArgumentParser(prog = "GdocxCheck", description = "Checks .txt source without converting it")
+    prs.add_argument('-i', '--input', help="Path to source file", type=str, required=True)
+    prs.add_argument('-s', '--strip-indent', help="strip indents of nested macros", action="store_true")
+    prs.add_argument('-se', '--skip-empty', help="skip empty lines", action="store_true")
+    prs.add_argument('-il', '--indent-length', help="Length of indent sequence", type=int, default=GdocxParsing.INDENT_DEFAULT_LENGTH)
+    prs.add_argument('-ic', '--indent-char', help="Indent character", type=str, default=GdocxParsing.INDENT_DEFAULT_CHAR)
+    prs.add_argument('-id', '--input_dir', help="Directory against which paths in the source are resolved", type=str)
+    args = prs.parse_args()
+
+    errors = check_txt(args.input, args.strip_indent, args.skip_empty,
+        args.indent_char * args.indent_length, cwd = args.input_dir)
+    for error in errors:
+        print(error)
+    if len(errors) != 0:
+        exit(1)
+    print(f"'{args.input}': no errors found")
@@ -1,4 +1,7 @@
 import os
+import tempfile
+import threading
+from collections import OrderedDict
 
 class GdocxWarning:
     FMT = "WARNING: line %d: %s"
@@ -12,3 +15,77 @@ Warnings: list[GdocxWarning] = []
 
 def AbsPath(path):
     return os.path.join(os.getcwd(), path)
+
+# Directory of the tool's caches kept between runs
+def user_cache_dir(name: str) -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cache_home, "gostdocx", name)
+
+# Writes through a temporary file, so that concurrent readers
+# never see a partly written file
+def write_atomic(path: str, data: bytes):
+    fd, tmp_path = tempfile.mkstemp(dir = os.path.dirname(path))
+    with os.fdopen(fd, "wb") as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+# Objects made from files by load(path), by absolute path. Entry is used
+# while the file's mtime and size are the same. Sizes of files are counted
+# against max_bytes, least recently used entries are evicted. Cached objects
+# are shared, so they must not be changed
+class FileCache:
+    def __init__(self, max_bytes: int, load):
+        self.max_bytes = max_bytes
+        self.load = load
+        self.bytes = 0
+        # path -> (mtime_ns, size, object)
+        self.entries: OrderedDict[str, tuple[int, int, object]] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path: str) -> object:
+        return self.get_entry(path)[0]
+
+    # Returns (object, whether it's shared with the cache)
+    def get_entry(self, path: str) -> (object, bool):
+        st = os.stat(path)
+        value = self.lookup(path, st)
+        if value is not None:
+            return value, True
+
+        value = self.load(path)
+        if st.st_size > self.max_bytes:
+            return value, False
+        self.add(path, st, value)
+        return value, True
+
+    # Loads the file into the cache ahead of get, see GdocxPrefetch
+    def warm(self, path: str):
+        st = os.stat(path)
+        if st.st_size <= self.max_bytes and self.lookup(path, st) is None:
+            self.add(path, st, self.load(path))
+
+    def lookup(self, path: str, st: os.stat_result) -> object | None:
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None or entry[:2] != (st.st_mtime_ns, st.st_size):
+                return None
+            self.entries.move_to_end(path)
+            return entry[2]
+
+    def add(self, path: str, st: os.stat_result, value: object):
+        with self.lock:
+            self.remove(path)
+            self.entries[path] = (st.st_mtime_ns, st.st_size, value)
+            self.bytes += st.st_size
+            while self.bytes > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+
+    def remove(self, path: str):
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
@@ -0,0 +1,131 @@
+import os
+from typing import Type, Any
+import GdocxParsing
+
+'''
+State of one conversion.
+
+Everything a conversion reads or changes beyond its document lives here:
+options of parsing, current dir of chdir macros, Style values changed by
+load-style, numbering of images and numbered macros, profiler. Create new
+context for every conversion, then conversions don't interfere and can run
+concurrently in one process.
+
+Handlers reach it through state.ctx. Relative paths of macros must be
+resolved with ctx.abspath, not against the process' current dir. Paths of
+files which are read must go through ctx.use_path, which also records them
+in ctx.dependencies with their stamps taken before they're read (see
+GdocxWatch).
+'''
+
+# Identity of a file's content which is cheap to get, None if it doesn't exist
+def file_stamp(path: str) -> tuple[int, int, int] | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+class GdocxContext:
+    def __init__(self, **kwargs):
+        self.indent_string = kwargs.get('indent_string', GdocxParsing.INDENT_STRING)
+        if self.indent_string is None:
+            self.indent_string = GdocxParsing.INDENT_DEFAULT_CHAR * GdocxParsing.INDENT_DEFAULT_LENGTH
+        self.strip_indent = bool(kwargs.get('strip_indent', GdocxParsing.STRIP_INDENT))
+        self.skip_empty = bool(kwargs.get('skip_empty', GdocxParsing.SKIP_EMPTY))
+        self.skip_numbering = bool(kwargs.get('skip_numbering', False))
+        # handlers registered in addition to GdocxState.default_handlers
+        self.handlers: list[Type[Any]] = kwargs.get('handlers', [])
+
+        # directory against which relative paths are resolved, chdir macro changes it
+        self.cwd = os.path.abspath(kwargs.get('cwd', os.getcwd()))
+        # if set, only files inside this dir can be used (see GdocxServe)
+        self.root = kwargs.get('root')
+        if self.root is not None:
+            self.root = os.path.realpath(self.root)
+
+        # document with default styles, it's only read.
+        # None for GdocxStyle's one, see GdocxDocPool.new_document
+        self.default_styles_doc = kwargs.get('default_styles_doc')
+        # made on first use of self.style
+        self._style = None
+        self.style_values = kwargs.get('style_values')
+
+        # number of the next image-caption
+        self.image_free_number = 1
+        # numbers of numbered macro per nesting level, see NumberedReceiver
+        self.number_dicts: list[dict[str, int]] = []
+        self.prev_in_macro_names: list[str] = []
+
+        # pixels per inch images are downscaled to, 0 keeps them as they are.
+        # See GdocxImage
+        self.image_dpi = int(kwargs.get('image_dpi', 0))
+        self.image_stats = {"images": 0, "downscaled": 0, "cached": 0, "oversized": 0, "bytes_in": 0, "bytes_out": 0}
+
+        # data of json-reader macros by (path, record), see GdocxData
+        self.data_sources: dict[tuple[str, int | None], object] = {}
+
+        # files of macros are loaded ahead of rendering, see GdocxPrefetch
+        self.prefetch = bool(kwargs.get('prefetch', False))
+        # GdocxPrefetch.Prefetcher of the conversion in progress
+        self.prefetcher = None
+
+        # GdocxCache.FragmentCache, None if rendering isn't incremental
+        self.cache = kwargs.get('cache')
+        self.cache_stats = {"hits": 0, "misses": 0, "uncached": 0}
+
+        # level of compression of the output, see GdocxZip
+        self.compression = kwargs.get('compression', "default")
+
+        # document is written while it's rendered, see GdocxStream
+        self.stream = bool(kwargs.get('stream', False))
+        # GdocxStream.StreamWriter of the conversion in progress
+        self.stream_writer = None
+
+        # absolute paths of files and dirs the conversion read, in order of use
+        # path -> its file_stamp when the conversion first used it
+        self.dependencies: dict[str, tuple[int, int, int] | None] = {}
+
+        # message of the error which stopped conversion, see GdocxState.exit_with_error
+        self.error: str | None = None
+
+        # GdocxProfile.Profiler, None if profiling is off
+        self.profiler = kwargs.get('profiler')
+        # where to write Chrome trace of the conversion
+        self.profile_path = kwargs.get('profile_path')
+
+    # Style values of the conversion, load-style macro may change them.
+    # Made lazily, so that contexts which only check sources (see GdocxCheck)
+    # don't import GdocxStyle and python-docx with it
+    @property
+    def style(self):
+        if self._style is None:
+            import GdocxStyle
+            style_values = self.style_values
+            if style_values is None:
+                style_values = GdocxStyle.DefaultStyleValues
+            self._style = GdocxStyle.Style()
+            for name, value in style_values.items():
+                setattr(self._style, name, value)
+        return self._style
+
+    def abspath(self, path: str) -> str:
+        return os.path.join(self.cwd, path)
+
+    # Whether the conversion may use the file, symlinks are resolved
+    def allows_path(self, path: str) -> bool:
+        if self.root is None:
+            return True
+        path = os.path.realpath(self.abspath(path))
+        return os.path.commonpath([self.root, path]) == self.root
+
+    # Resolves path of a file (or dir) the conversion depends on
+    def use_path(self, path: str) -> str:
+        if not self.allows_path(path):
+            raise Exception(f"Path {path} is outside of the conversion's directory")
+        path = os.path.normpath(self.abspath(path))
+        if path not in self.dependencies:
+            # before the file is read, so that a change while it's converted
+            # is seen as a change
+            self.dependencies[path] = file_stamp(path)
+        return path
@@ -0,0 +1,92 @@
+import os
+import json
+from array import array
+import GdocxCommon
+
+'''
+Data sources of json-reader and json-field macros.
+
+A json file is parsed once and kept in JsonFiles while it isn't changed, so
+many json-reader macros of one file, and conversions of batch and daemon
+modes, share the parsed data. Files too large for JsonFiles are parsed once
+per conversion (see ctx.data_sources). Data is shared, so it must not be
+changed.
+
+JSON Lines files (.jsonl, .ndjson) have one record per line. json-reader
+takes the number of the record as its second argument:
+    (json-reader people.jsonl 42
+        ...
+    )
+Offsets of records are found once per file (see JsonLinesIndexes) without
+parsing them, then only the requested record is read and parsed.
+
+json-field takes a dotted path of the field: "a.b.0.c" is
+data["a"]["b"][0]["c"]. A key which itself contains dots is found too.
+'''
+
+JSON_LINES_EXTENSIONS = {".jsonl", ".ndjson"}
+
+def parse_json(path: str) -> object:
+    with open(path, "r") as file:
+        return json.load(file)
+
+# Offsets of non-empty lines of the file
+def index_json_lines(path: str) -> array:
+    offsets = array("q")
+    offset = 0
+    with open(path, "rb") as file:
+        for line in file:
+            if not line.isspace():
+                offsets.append(offset)
+            offset += len(line)
+    return offsets
+
+# Parsed data takes several times more memory than its file
+JsonFiles = GdocxCommon.FileCache(64 * 1024 * 1024, parse_json)
+# Index takes 8 bytes per record, so it's kept for large files too
+JsonLinesIndexes = GdocxCommon.FileCache(1024 * 1024 * 1024, index_json_lines)
+
+def is_json_lines(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in JSON_LINES_EXTENSIONS
+
+# Parses the file or indexes its records ahead of use, see GdocxPrefetch
+def warm(path: str):
+    if is_json_lines(path):
+        JsonLinesIndexes.warm(path)
+    else:
+        JsonFiles.warm(path)
+
+# Data of json-reader macro, parsed once per conversion
+def read(ctx, path: str, record: int | None = None) -> object:
+    key = (path, record)
+    if key not in ctx.data_sources:
+        ctx.data_sources[key] = load(path, record)
+    return ctx.data_sources[key]
+
+# The whole file, or one record of JSON Lines file
+def load(path: str, record: int | None = None) -> object:
+    if not is_json_lines(path):
+        return JsonFiles.get(path)
+
+    if record is None:
+        raise Exception(f"{os.path.basename(path)} is JSON Lines file, pass number of the record to json-reader")
+    offsets = JsonLinesIndexes.get(path)
+    if record < 0 or record >= len(offsets):
+        raise Exception(f"{os.path.basename(path)} has {len(offsets)} records, there's no record {record}")
+    with open(path, "rb") as file:
+        file.seek(offsets[record])
+        return json.loads(file.readline())
+
+def get_field(data: object, fieldname: str) -> object:
+    if isinstance(data, dict) and fieldname in data:
+        return data[fieldname]
+
+    value = data
+    for key in fieldname.split("."):
+        if isinstance(value, dict) and key in value:
+            value = value[key]
+        elif isinstance(value, list) and key.isdigit() and int(key) < len(value):
+            value = value[int(key)]
+        else:
+            raise Exception(f"json has no field {fieldname}: {key} not found")
+    return value
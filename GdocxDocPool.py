@@ -0,0 +1,117 @@
+import os
+import copy
+import threading
+from docx import Document
+import GdocxStyle
+import GdocxCommon
+
+'''
+Blank documents with default styles.
+
+Document() unzips and parses python-docx's template every time, and then
+default styles are installed into it. Instead, such a document is built
+once per default styles (the template of the pool) and new documents are
+its deep copies: parsed parts are copied, nothing is read or parsed again.
+
+A pool may also keep SIZE copies made in advance: after a document is taken,
+the pool is filled again in a background thread. It's useful for long-running
+processes (see GdocxServe and workers of GdocxBatch), which are idle between
+conversions. By default SIZE is 0 and documents are copied when they are
+needed.
+
+Documents appended by doc macros are parsed once as well and kept while
+their files don't change, every use gets a copy (see open_document).
+'''
+
+class DocumentPool:
+    # src is a document with default styles
+    def __init__(self, src: 'Document', size: int = 0):
+        self.template = Document()
+        GdocxStyle.use_default_styles(self.template, src)
+        self.size = size
+        self.ready = []
+        self.filling = False
+        self.lock = threading.Lock()
+
+    # template is only read, so copies may be made concurrently
+    def clone(self) -> 'Document':
+        return copy.deepcopy(self.template)
+
+    def get(self) -> 'Document':
+        doc = None
+        with self.lock:
+            if len(self.ready) != 0:
+                doc = self.ready.pop()
+        if doc is None:
+            doc = self.clone()
+        if self.size > 0:
+            self.fill_in_background()
+        return doc
+
+    # Makes copies until there are SIZE of them
+    def fill(self):
+        while True:
+            with self.lock:
+                if len(self.ready) >= self.size:
+                    self.filling = False
+                    return
+            doc = self.clone()
+            with self.lock:
+                self.ready.append(doc)
+
+    def fill_in_background(self):
+        with self.lock:
+            if self.filling or len(self.ready) >= self.size:
+                return
+            self.filling = True
+        threading.Thread(target = self.fill, daemon = True).start()
+
+# Pools by digest of default styles, see GdocxStyle.styles_digest
+Pools: dict[str, DocumentPool] = {}
+PoolsLock = threading.Lock()
+# Number of documents made in advance by every pool
+PoolSize = 0
+
+def set_pool_size(size: int):
+    global PoolSize
+    PoolSize = size
+    with PoolsLock:
+        for pool in Pools.values():
+            pool.size = size
+
+def pool_for(src: 'Document | None' = None) -> DocumentPool:
+    if src is None:
+        src = GdocxStyle.default_styles_doc()
+    digest = GdocxStyle.styles_digest(src)
+    with PoolsLock:
+        pool = Pools.get(digest)
+        if pool is None:
+            pool = DocumentPool(src, PoolSize)
+            Pools[digest] = pool
+    return pool
+
+# Blank document with styles of src, same as Document() with
+# GdocxStyle.use_default_styles(doc, src)
+def new_document(src: 'Document | None' = None) -> 'Document':
+    return pool_for(src).get()
+
+###########################   Appended documents   ###########################
+
+# Parsed documents of doc macros by absolute path, see GdocxCommon.FileCache
+class DocumentCache(GdocxCommon.FileCache):
+    def __init__(self, max_bytes: int):
+        super().__init__(max_bytes, Document)
+
+    # Returns a copy of the document, which may be changed
+    def get(self, path: str) -> 'Document':
+        doc, shared = self.get_entry(path)
+        if not shared:
+            return doc
+        return copy.deepcopy(doc)
+
+# Parsed documents take several times more memory than their files
+AppendedDocs = DocumentCache(64 * 1024 * 1024)
+
+# Document(path) of a file to be appended, parsed once while it's not changed
+def open_document(path: str) -> 'Document':
+    return AppendedDocs.get(path)
@@ -1,10 +1,13 @@
 import GdocxParsing
 import GdocxStyle
-import GdocxCommon
+import GdocxImage
+import GdocxPrefetch
+import GdocxData
+import GdocxTable
 import os.path
-import json
 from docx.shared import Cm
 from docx.table import _Cell
+from docx.enum.style import WD_STYLE_TYPE
 from docx.styles.style import ParagraphStyle, CharacterStyle
 from docx.text.paragraph import Paragraph
 from docx.text.run import Run
@@ -23,6 +26,13 @@ handler trait:
     finalize(self);
 '''
 
+'''
+Handlers must not keep anything in globals or class attributes and must not
+change process' current dir: everything a conversion changes lives in
+state.ctx (see GdocxContext), and relative paths are resolved with
+state.ctx.abspath, or state.ctx.use_path for files they read.
+'''
+
 '''
 Almost all handlers refer to state.receiver and not state.doc to
 append paragraphs. It serves as a proxy to state.doc.
@@ -36,6 +46,10 @@ receiver trait:
     add_run(self, text: str = '', style: str | CharacterStyle | None = None) -> Run;
 
     get_paragraphs(self) -> list[docx.Paragraph]
+
+    Returns the last paragraph added through the receiver (or None).
+    Unlike get_paragraphs()[-1] it must not rebuild list of all paragraphs
+    last_paragraph(self) -> docx.Paragraph | None
 '''
 
 class EchoHandler:
@@ -56,6 +70,7 @@ class ChdirHandler:
     NAME = "chdir"
 
     def __init__(self, state: 'GdocxState', macro_args: list[str]):
+        self.state = state
         self.ddir = macro_args[0]
         pass
 
@@ -63,9 +78,12 @@ class ChdirHandler:
         raise Exception(f"You must not place content inside {self.NAME}")
 
     def finalize(self):
-        import os
         print(f"Changing dir to {self.ddir}");
-        os.chdir(self.ddir)
+        ctx = self.state.ctx
+        path = ctx.use_path(self.ddir)
+        if not os.path.isdir(path):
+            raise Exception(f"{self.ddir} is not a directory")
+        ctx.cwd = path
         pass
 
 class PageBreakHandler:
@@ -79,7 +97,8 @@ class PageBreakHandler:
         raise Exception(f"You must not place content inside {self.NAME}")
 
     def finalize(self):
-        self.state.doc.add_page_break()
+        par = self.state.doc.add_page_break()
+        self.state.doc_receiver.set_last_paragraph(par)
 
 class UnorderedListHandler:
     NAME = "unordered-list"
@@ -108,7 +127,7 @@ class UnorderedListItemHandler:
 
     def process_line(self, line: str, info: GdocxParsing.LineInfo):
         if not self.is_first_line_processed:
-            line_stripped = GdocxStyle.Style.UNORDERED_LIST_PREFIX + info.line_stripped
+            line_stripped = self.state.ctx.style.UNORDERED_LIST_PREFIX + info.line_stripped
             self.is_first_line_processed = True
         self.cur_paragraph_lines.append(line_stripped)
 
@@ -144,7 +163,13 @@ class LoadStyleHandler:
         to_override = False
         if len(macro_args) > 1:
             to_override = bool(macro_args[1])
-        GdocxStyle.use_styles_from_file(macro_args[0], state.doc, to_override)
+        ctx = state.ctx
+        path = ctx.use_path(macro_args[0])
+        json_string = GdocxPrefetch.take(ctx, GdocxPrefetch.KIND_STYLES, path)
+        if json_string is None:
+            GdocxStyle.use_styles_from_file(path, state.doc, to_override, ctx.style)
+        else:
+            GdocxStyle.use_raw_styles(json_string, state.doc, to_override, ctx.style)
 
     def process_line(self, line: str, info: GdocxParsing.LineInfo):
         raise Exception("You must not place content inside ParseStyleDirective")
@@ -222,7 +247,8 @@ class ImageHandler:
     def finalize(self):
         par = self.state.receiver.add_paragraph(None, style = self.STYLE)
         run = par.add_run()
-        run.add_picture(self.path, self.width, self.height)
+        ctx = self.state.ctx
+        GdocxImage.add_picture(ctx, run, ctx.use_path(self.path), self.width, self.height)
 
 class ImageCaptionHandler:
     # Because GOST wants us to minimize distance between image and its caption,
@@ -231,58 +257,70 @@ class ImageCaptionHandler:
     STICK_TO_PREV_PARAGRAPH = True
     NAME = "image-caption"
     STYLE = "image-caption"
-    ItemFreeNumber = 1
 
     def __init__(self, state: 'GdocxState', macro_args: list[str]):
         self.state = state
         self.paragraph_lines = []
         self.is_first_line_processed = False
 
-        self.item_number = ImageCaptionHandler.ItemFreeNumber
-        ImageCaptionHandler.ItemFreeNumber += 1
+        self.item_number = state.ctx.image_free_number
+        state.ctx.image_free_number += 1
 
     def process_line(self, line: str, info: GdocxParsing.LineInfo):
         line_stripped = info.line_stripped
         if not self.is_first_line_processed:
             self.is_first_line_processed = True
-            line_stripped = GdocxStyle.Style.IMAGE_CAPTION_PREFIX + str(self.item_number) + GdocxStyle.Style.IMAGE_CAPTION_INFIX + info.line_stripped
+            style = self.state.ctx.style
+            line_stripped = style.IMAGE_CAPTION_PREFIX + str(self.item_number) + style.IMAGE_CAPTION_INFIX + info.line_stripped
 
         self.paragraph_lines.append(line_stripped)
 
     def finalize(self):
         content = ' '.join(self.paragraph_lines)
         if not self.STICK_TO_PREV_PARAGRAPH:
-            self.state.receiver.add_paragraph(content, style = GdocxStyle.Style.IMAGE_CAPTION)
+            self.state.receiver.add_paragraph(content, style = self.state.ctx.style.IMAGE_CAPTION)
         else:
             content = '\n' + content
-            self.state.receiver.get_paragraphs()[-1].add_run(content)
+            self.state.receiver.last_paragraph().add_run(content)
 
 class TableCellReceiver:
     NAME = "TableReceiver"
 
-    def __init__(self, cell: _Cell):
+    def __init__(self, cell: _Cell, table: 'TableHandler'):
         self.cell = cell
+        self.table = table
         self.first_par_added = False
+        self.last = None
 
+    # Style is set by its id, which the table resolves once per name
     def add_paragraph(self, text: str = '', style: str | ParagraphStyle | None = None) -> Paragraph:
         if not self.first_par_added:
-            self.cell.paragraphs[0].text = text
-            self.cell.paragraphs[0].style = style
+            # new cell always contains one empty paragraph. A cell given
+            # again by another table-cell has its paragraphs already,
+            # the first one is written over
+            par = self.cell.paragraphs[0]
+            par.text = text
             self.first_par_added = True
-            return self.cell.paragraphs[0]
-        return self.cell.add_paragraph(text, style)
+        else:
+            par = self.cell.add_paragraph(text)
+            self.last = par
+        par._p.style = self.table.style_id(style)
+        return par
 
     def add_run(self, text: str = '', style: str | CharacterStyle | None = None) -> Run:
         if not self.first_par_added:
-            run = self.cell.paragraphs[0].add_run(text, style)
             self.first_par_added = True
-            return run
-        else:
-            return self.cell.paragraphs[-1].add_run(text, style)
+            return self.cell.paragraphs[0].add_run(text, style)
+        return self.last_paragraph().add_run(text, style)
 
     def get_paragraphs(self):
         return self.cell.paragraphs
 
+    def last_paragraph(self) -> Paragraph | None:
+        if self.last is None:
+            self.last = self.cell.paragraphs[-1]
+        return self.last
+
 
 class TableHandler:
     NAME = "table"
@@ -295,6 +333,19 @@ class TableHandler:
 
         self.state = state
         self.table = self.state.doc.add_table(rows = self.rows, cols = self.cols)
+        # python-docx builds lists of rows and cells from xml on every
+        # access of table.rows[i].cells[j], so cells are indexed once
+        self.cells = [[_Cell(tc, self.table) for tc in tr.tc_lst] for tr in self.table._tbl.tr_lst]
+        # paragraph style name -> its id, looking it up takes longer than
+        # filling a cell
+        self.style_ids: dict[str, str | None] = {}
+
+    def style_id(self, style: str | ParagraphStyle | None) -> str | None:
+        if not isinstance(style, str):
+            return self.state.doc.part.get_style_id(style, WD_STYLE_TYPE.PARAGRAPH)
+        if style not in self.style_ids:
+            self.style_ids[style] = self.state.doc.part.get_style_id(style, WD_STYLE_TYPE.PARAGRAPH)
+        return self.style_ids[style]
 
     def process_line(self, line: str, info: GdocxParsing.LineInfo):
         raise Exception(f"You must not place content inside {self.NAME}")
@@ -328,8 +379,8 @@ class TableCellHandler:
 
         self.prev_receiver = state.receiver
 
-        cell = self.table.table.rows[rowindex].cells[colindex]
-        state.receiver = TableCellReceiver(cell)
+        cell = self.table.cells[rowindex][colindex]
+        state.receiver = TableCellReceiver(cell, self.table)
 
     def process_line(self, line: str, info: GdocxParsing.LineInfo):
         self.paragraph_lines.append(info.line_stripped)
@@ -340,14 +391,41 @@ class TableCellHandler:
             self.state.receiver.add_paragraph(par_content, style = self.STYLE)
         self.state.receiver = self.prev_receiver
 
+class TableCsvHandler:
+    NAME = "table-csv"
+    STYLE = TableCellHandler.STYLE
+
+    def __init__(self, state: 'GdocxState', macro_args: list[str]):
+        if len(macro_args) == 0:
+            raise Exception(f"{self.NAME} macro needs at least 1 argument")
+        style = macro_args[1] if len(macro_args) > 1 else self.STYLE
+        # rows repeated on every page
+        header_rows = 0
+        if len(macro_args) > 2:
+            if not macro_args[2].isdigit():
+                raise Exception(f"{self.NAME} header-rows (= {macro_args[2]}) must be a non-negative integer")
+            header_rows = int(macro_args[2])
+
+        self.state = state
+        path = state.ctx.use_path(macro_args[0])
+        GdocxTable.add_csv_table(state.doc, path, style, header_rows)
+
+    def process_line(self, line: str, info: GdocxParsing.LineInfo):
+        raise Exception(f"You must not place content inside {self.NAME}")
+
+    def finalize(self):
+        pass
+
 class AppendPageHandler:
     NAME = "doc"
 
     def __init__(self, state: 'GdocxState', macro_args: list[str]):
         if len(macro_args) == 0:
             raise Exception(f"{self.NAME} macro needs at least 1 argument")
+        if state.ctx.stream:
+            raise Exception(f"{self.NAME} macro can't be used with --stream")
 
-        path = GdocxCommon.AbsPath(macro_args[0])
+        path = state.ctx.use_path(macro_args[0])
         if not os.path.isfile(path):
             raise Exception(f"{path} is not a file. You must pass a file path to {self.NAME} macro")
 
@@ -388,9 +466,17 @@ class JsonReaderHandler:
 
         self.state = state
         self.jsonname = macro_args[0]
-        
-        jsonfile = open(self.jsonname, 'r')
-        self.json = json.loads(jsonfile.read())
+        # number of the record of JSON Lines file
+        record = None
+        if len(macro_args) > 1:
+            if not macro_args[1].isdigit():
+                raise Exception(f"{self.NAME} record (= {macro_args[1]}) must be a non-negative integer")
+            record = int(macro_args[1])
+
+        path = state.ctx.use_path(self.jsonname)
+        GdocxPrefetch.take(state.ctx, GdocxPrefetch.KIND_JSON, path)
+        # parsed json is shared with other json-reader macros of the file
+        self.json = GdocxData.read(state.ctx, path, record)
         self.prev_receiver = self.state.receiver
         self.state.receiver = JsonReaderReceiver(self)
 
@@ -401,7 +487,7 @@ class JsonReaderHandler:
         self.state.receiver = self.prev_receiver
 
     def get_json_field(self, fieldname):
-        return self.json[fieldname]
+        return GdocxData.get_field(self.json, fieldname)
 
 
 # This class is purely for restraining json-field, so that it knows
@@ -422,6 +508,9 @@ class JsonReaderReceiver:
     def get_paragraphs(self):
         return self.jsonhandler.prev_receiver.get_paragraphs()
 
+    def last_paragraph(self) -> Paragraph | None:
+        return self.jsonhandler.prev_receiver.last_paragraph()
+
 
 class JsonFieldHandler:
     NAME = "json-field"
@@ -441,7 +530,7 @@ class JsonFieldHandler:
     def finalize(self):
         recv = self.state.receiver
 
-        if len(recv.get_paragraphs()) == 0:
+        if recv.last_paragraph() is None:
             raise Exception(f"Before {self.NAME} insert at least one {ParStyleHandler.NAME} so that it's possible to attach the field's value to it")
 
         recv.add_run(
@@ -459,7 +548,7 @@ class NextImageNumberAsRunHandler:
         raise Exception(f"You must not place content inside {self.NAME}")
 
     def finalize(self):
-        self.state.receiver.add_run(str(ImageCaptionHandler.ItemFreeNumber))
+        self.state.receiver.add_run(str(self.state.ctx.image_free_number))
         pass
 
 class ImageNumberAsRunHandler:
@@ -473,7 +562,7 @@ class ImageNumberAsRunHandler:
         raise Exception(f"You must not place content inside {self.NAME}")
 
     def finalize(self):
-        self.state.receiver.add_run(str(ImageCaptionHandler.ItemFreeNumber - 1))
+        self.state.receiver.add_run(str(self.state.ctx.image_free_number - 1))
         pass
 
 class SpaceHandler:
@@ -536,24 +625,23 @@ class NumberedReceiver:
     NAME = "NumberedReceiver"
     START_NUMBER = 1
 
-    NUMBER_DICTS = []
-    PREV_IN_MACRO_NAMES = []
-
     def __init__(self, numbered_handler: 'NumberedHandler'):
         self.has_run = False
         self.numbered_handler = numbered_handler
+        # numbering is shared by all numbered macros of the conversion
+        self.ctx = numbered_handler.state.ctx
         self.in_macro_names = self.numbered_handler.in_macro_names
 
         first_unmatched_index = None
 
-        if len(self.in_macro_names) == 0 and len(NumberedReceiver.NUMBER_DICTS) == 0:
+        if len(self.in_macro_names) == 0 and len(self.ctx.number_dicts) == 0:
             self.set_empty_dicts_at(0, 1)
 
         for i in range(len(self.in_macro_names)):
-            if i == len(NumberedReceiver.PREV_IN_MACRO_NAMES):
+            if i == len(self.ctx.prev_in_macro_names):
                 first_unmatched_index = i
                 break
-            if self.in_macro_names[i] != NumberedReceiver.PREV_IN_MACRO_NAMES[i]:
+            if self.in_macro_names[i] != self.ctx.prev_in_macro_names[i]:
                 first_unmatched_index = i
                 break
 
@@ -561,7 +649,7 @@ class NumberedReceiver:
             return
 
         new_number_dicts_len = max(
-            len(NumberedReceiver.NUMBER_DICTS), len(self.in_macro_names))
+            len(self.ctx.number_dicts), len(self.in_macro_names))
         self.set_empty_dicts_at(first_unmatched_index, new_number_dicts_len)
 
 
@@ -578,6 +666,9 @@ class NumberedReceiver:
 
     def get_paragraphs(self):
         return self.numbered_handler.prev_receiver.get_paragraphs()
+
+    def last_paragraph(self) -> Paragraph | None:
+        return self.numbered_handler.prev_receiver.last_paragraph()
     
     def dispatch_on_name_and_transform(self, text: str):
         if self.numbered_handler.is_in_erasing_state:
@@ -589,50 +680,51 @@ class NumberedReceiver:
         prefix = None
         if len(self.in_macro_names) == 0:
             curhandler = self.numbered_handler.state.current_macro_name
-            prefix = NumberedReceiver.construct_prefix([curhandler])
-            NumberedReceiver.PREV_IN_MACRO_NAMES = [curhandler]
+            prefix = self.construct_prefix([curhandler])
+            self.ctx.prev_in_macro_names = [curhandler]
         else:
-            prefix = NumberedReceiver.construct_prefix(self.in_macro_names)
-            NumberedReceiver.PREV_IN_MACRO_NAMES = self.in_macro_names
+            prefix = self.construct_prefix(self.in_macro_names)
+            self.ctx.prev_in_macro_names = self.in_macro_names
 
         return prefix + " " + text
 
 
     def erase_macro_name(self, name):
-        for dic in NumberedReceiver.NUMBER_DICTS:
+        for dic in self.ctx.number_dicts:
             dic[name] = self.START_NUMBER
 
     def set_empty_dicts_at(self, start, end):
         for i in range(start, end):
-            if i == len(NumberedReceiver.NUMBER_DICTS):
-                NumberedReceiver.NUMBER_DICTS.append({})
+            if i == len(self.ctx.number_dicts):
+                self.ctx.number_dicts.append({})
             else:
-                NumberedReceiver.NUMBER_DICTS[i] = {}
+                self.ctx.number_dicts[i] = {}
 
-    @classmethod
-    def construct_prefix(cls, macro_names):
+    def construct_prefix(self, macro_names):
+        number_dicts = self.ctx.number_dicts
         assert(len(macro_names) > 0)
-        assert(len(macro_names) <= len(cls.NUMBER_DICTS))
+        assert(len(macro_names) <= len(number_dicts))
 
         res = ""
         for i in range(len(macro_names) - 1):
             macro_name = macro_names[i]
-            dic = cls.NUMBER_DICTS[i]
+            dic = number_dicts[i]
             num = dic.get(macro_name)
             if num is None:
-                num = cls.START_NUMBER
-                dic[macro_name] = cls.START_NUMBER
+                num = self.START_NUMBER
+                dic[macro_name] = self.START_NUMBER
             num -= 1
             res += str(num)
             res += "."
 
         macro_name = macro_names[-1]
-        dic = cls.NUMBER_DICTS[len(macro_names) - 1]
+        dic = number_dicts[len(macro_names) - 1]
         num = dic.get(macro_name)
         if num is None:
-            num = dic[macro_name] = cls.START_NUMBER
+            num = dic[macro_name] = self.START_NUMBER
         dic[macro_name] += 1
 
         res += str(num)
 
         return res
+
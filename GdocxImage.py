@@ -0,0 +1,199 @@
+import io
+import os
+import math
+import hashlib
+import threading
+import importlib.util
+from docx.image.image import Image
+from docx.image.constants import MIME_TYPE
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml.shape import CT_Inline
+from docx.shape import InlineShape
+import GdocxCommon
+import GdocxPrefetch
+
+'''
+Images of image macros, downscaled to the size they're shown at.
+
+Photos are often much larger than they're shown: a 4000 px wide photo shown
+at 8 cm needs about 950 px at 300 dpi. Pixels of an image are computed from
+its size in the document (given by width and height of the macro, or its
+natural size) and ctx.image_dpi. Larger JPEG and PNG images are resized and
+compressed again with Pillow, other images and images which aren't larger
+are embedded as they are. Size of the image in the document, its name and
+aspect ratio are the same as without downscaling.
+
+Pillow is optional: without it images are embedded as they are.
+
+Results are kept on disk by hash of the original file and the pixel size
+(see ProcessedImageCache), so an image is processed once across builds.
+A result which isn't smaller than the original isn't used. Images with the
+same content share one part of the package, as python-docx does.
+
+ctx.image_stats counts images and bytes saved, see format_stats.
+'''
+
+# Increment when processing changes, so that stale results are not used
+PROCESSED_IMAGES_VERSION = 1
+JPEG_QUALITY = 85
+EMU_PER_INCH = 914400
+
+# Content types which are downscaled and formats Pillow saves them in
+FORMATS = {
+    MIME_TYPE.JPEG: "JPEG",
+    MIME_TYPE.PNG: "PNG",
+}
+
+PILLOW_INSTALLED = importlib.util.find_spec("PIL") is not None
+PillowModule = None
+PillowLock = threading.Lock()
+
+# PIL.Image, imported on first use since it's slow to import
+def pillow():
+    global PillowModule
+    with PillowLock:
+        if PillowModule is None:
+            from PIL import Image as PillowModule
+    return PillowModule
+
+# Part of keys of cached fragments (see GdocxCache): downscaled images
+# differ from original ones
+def options_key(ctx) -> list[object]:
+    return [PROCESSED_IMAGES_VERSION, ctx.image_dpi if PILLOW_INSTALLED else 0]
+
+def default_image_cache_dir() -> str:
+    return GdocxCommon.user_cache_dir("images")
+
+# Processed images by key, see processed_key. Empty file means
+# that the original is kept, since processing didn't make it smaller
+class ProcessedImageCache:
+    def __init__(self, dirpath: str | None = None):
+        self.dirpath = dirpath
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.dirpath, key)
+
+    def load(self, key: str) -> bytes | None:
+        if self.dirpath is None:
+            return None
+        try:
+            with open(self.path(key), "rb") as file:
+                return file.read()
+        except OSError:
+            return None
+
+    # Cache on disk is optional, conversion goes on if it can't be written
+    def store(self, key: str, blob: bytes):
+        if self.dirpath is None:
+            return
+        try:
+            os.makedirs(self.dirpath, exist_ok = True)
+            GdocxCommon.write_atomic(self.path(key), blob)
+        except OSError:
+            pass
+
+# kept on disk only if a dir is set, see main.init_gostdocx
+ProcessedImages = ProcessedImageCache()
+
+# dirpath None turns off the cache on disk
+def set_image_cache_dir(dirpath: str | None):
+    ProcessedImages.dirpath = dirpath
+
+def processed_key(image: Image, size: tuple[int, int]) -> str:
+    h = hashlib.sha1()
+    h.update(f"{PROCESSED_IMAGES_VERSION}\0{JPEG_QUALITY}\0{size[0]}x{size[1]}\0".encode())
+    h.update(image.sha1.encode())
+    return h.hexdigest()
+
+# Pixels the image needs to be shown at cx x cy EMU
+def target_size(cx: int, cy: int, dpi: int) -> tuple[int, int]:
+    return (max(1, math.ceil(cx * dpi / EMU_PER_INCH)), max(1, math.ceil(cy * dpi / EMU_PER_INCH)))
+
+def downscale(blob: bytes, size: tuple[int, int], fmt: str, dpi: int) -> bytes:
+    PillowImage = pillow()
+    with PillowImage.open(io.BytesIO(blob)) as src:
+        exif = src.info.get("exif")
+        icc_profile = src.info.get("icc_profile")
+        # JPEG is decoded at a smaller scale right away
+        src.draft(src.mode, size)
+        img = src
+        if img.mode in ("P", "1"):
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+        img = img.resize(size, PillowImage.LANCZOS)
+
+    options = {"dpi": (dpi, dpi), "optimize": True}
+    if icc_profile is not None:
+        options["icc_profile"] = icc_profile
+    if fmt == "JPEG":
+        options["quality"] = JPEG_QUALITY
+        # orientation is kept in exif
+        if exif is not None:
+            options["exif"] = exif
+    out = io.BytesIO()
+    img.save(out, fmt, **options)
+    return out.getvalue()
+
+def image_from_blob(blob: bytes, filename: str) -> Image:
+    return Image._from_stream(io.BytesIO(blob), blob, filename)
+
+# Image of the file, downscaled if it's larger than needed, and its size
+# in the document in EMU
+def prepare(ctx, path: str, width, height) -> (Image, int, int):
+    stats = ctx.image_stats
+    stats["images"] += 1
+    blob = GdocxPrefetch.take(ctx, GdocxPrefetch.KIND_IMAGE, path)
+    if blob is None:
+        image = Image.from_file(path)
+    else:
+        image = image_from_blob(blob, os.path.basename(path))
+    cx, cy = image.scaled_dimensions(width, height)
+    if ctx.image_dpi <= 0 or image.content_type not in FORMATS:
+        return image, cx, cy
+
+    size = target_size(cx, cy, ctx.image_dpi)
+    if size[0] >= image.px_width and size[1] >= image.px_height:
+        return image, cx, cy
+    if not PILLOW_INSTALLED:
+        stats["oversized"] += 1
+        return image, cx, cy
+
+    key = processed_key(image, size)
+    processed = ProcessedImages.load(key)
+    cached = processed is not None
+    if not cached:
+        processed = downscale(image.blob, size, FORMATS[image.content_type], ctx.image_dpi)
+        if len(processed) >= len(image.blob):
+            processed = b""
+        ProcessedImages.store(key, processed)
+    if len(processed) == 0:
+        return image, cx, cy
+
+    stats["downscaled"] += 1
+    stats["cached"] += int(cached)
+    return image_from_blob(processed, image.filename), cx, cy
+
+# Same as run.add_picture(path, width, height), with the image downscaled.
+# Images with the same content share one part, the first one's name is used
+def add_picture(ctx, run, path: str, width = None, height = None) -> InlineShape:
+    image, cx, cy = prepare(ctx, path, width, height)
+
+    # as StoryPart.new_pic_inline does
+    part = run.part
+    image_parts = part.package.image_parts
+    image_part = image_parts._get_by_sha1(image.sha1)
+    if image_part is None:
+        # bytes are counted once per part, as they're written once
+        ctx.image_stats["bytes_in"] += os.path.getsize(path)
+        ctx.image_stats["bytes_out"] += len(image.blob)
+        image_part = image_parts._add_image_part(image)
+    rid = part.relate_to(image_part, RT.IMAGE)
+    inline = CT_Inline.new_pic_inline(part.next_id, rid, image_part.filename, cx, cy)
+    run._r.add_drawing(inline)
+    return InlineShape(inline)
+
+def format_stats(stats: dict[str, int]) -> str:
+    if stats["oversized"] != 0:
+        return f"images: {stats['oversized']} of {stats['images']} are larger than needed, install Pillow to downscale them"
+    saved = stats["bytes_in"] - stats["bytes_out"]
+    return (f"images: {stats['downscaled']} of {stats['images']} downscaled "
+        + f"({stats['cached']} cached), {saved / 1024 / 1024:.1f} MB saved")
@@ -0,0 +1,167 @@
+import hashlib
+import GdocxZip
+from lxml import etree
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml.ns import qn
+from docx.styles import BabelFish
+
+'''
+Merge of documents into the first one, in place of docxcompose's Composer.
+
+Composer reconciles styles, numbering, parts and relationships of every
+appended element and renumbers the whole body after every document, which
+makes documents with many doc macros slow. Segments of a source are made
+from the same template (see GdocxDocPool), so usually there's nothing to
+reconcile: their body elements are moved into the first document, images
+are added to its package once per content hash and relationship ids are
+remapped. Ids of bookmarks and drawings are renumbered once, on save.
+
+Document is merged natively if:
+    1. its styles are the same as styles of the first document and none
+        of its style ids would be mapped to other ones by name;
+    2. it doesn't use numbering, directly or through styles;
+    3. it has only one section;
+    4. its elements refer to no parts except images (a:blip/@r:embed),
+        and it has no footnotes and no custom properties.
+Other documents (e.g. .docx files of doc macros made elsewhere) are appended
+with Composer. The result is the same as if all of them were appended with it.
+'''
+
+RELATIONSHIP_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+STYLE_REF_TAGS = [qn('w:pStyle'), qn('w:rStyle'), qn('w:tblStyle')]
+
+class Merger:
+    # native False appends everything with Composer
+    def __init__(self, doc, native: bool = True):
+        self.doc = doc
+        self.native = native
+        self.composer = None
+        # computed for styles of self.doc, reset when Composer may change them
+        self.styles_key = None
+        self.remapped_style_ids: set[str] = set()
+        self.numbered_style_ids: set[str] = set()
+        # image parts of the package by sha1 of their blobs
+        self.images: dict[str, object] = {}
+        self.indexed_images = 0
+        self.stats = {"native": 0, "composer": 0}
+
+    def append(self, doc):
+        if self.native and self.can_append(doc):
+            self.append_native(doc)
+            self.stats["native"] += 1
+            return
+
+        if self.composer is None:
+            # imported here: it's slow to import and usually isn't needed
+            from docxcompose.composer import Composer
+            self.composer = Composer(self.doc)
+        self.composer.append(doc)
+        self.styles_key = None
+        self.stats["composer"] += 1
+
+    def save(self, filepath: str, compression: str = GdocxZip.DEFAULT):
+        # Composer renumbers after every document, for native ones it's done once
+        if self.stats["native"] != 0:
+            renumber(self.doc)
+        GdocxZip.save(self.doc, filepath, compression)
+
+    def index_styles(self):
+        styles = self.doc.styles.element
+        self.styles_key = styles_digest(styles)
+        # Composer maps style ids of appended document by name
+        id2name = {}
+        name2id = {}
+        self.numbered_style_ids = set()
+        for style in styles.style_lst:
+            name = BabelFish.internal2ui(style.name_val)
+            id2name[style.styleId] = name
+            name2id[name] = style.styleId
+            if len(style.xpath('.//w:numId')) != 0:
+                self.numbered_style_ids.add(style.styleId)
+        self.remapped_style_ids = {style_id for style_id, name in id2name.items() if name2id[name] != style_id}
+
+    def can_append(self, doc) -> bool:
+        if self.styles_key is None:
+            self.index_styles()
+        if styles_digest(doc.styles.element) != self.styles_key:
+            return False
+
+        try:
+            doc.part.package.part_related_by(RT.CUSTOM_PROPERTIES)
+            return False
+        except KeyError:
+            pass
+        if any(rel.reltype == RT.FOOTNOTES for rel in doc.part.rels.values()):
+            return False
+
+        body = doc.element.body
+        sect_prs = body.xpath('.//w:sectPr')
+        if len(sect_prs) != 1 or sect_prs[0].getparent() is not body:
+            return False
+
+        for element in body.iter():
+            tag = element.tag
+            if tag == qn('w:numId') or tag == qn('w:footnoteReference'):
+                return False
+            if tag in STYLE_REF_TAGS:
+                style_id = element.get(qn('w:val'))
+                if style_id in self.remapped_style_ids or style_id in self.numbered_style_ids:
+                    return False
+            for name in element.attrib:
+                if name.startswith('{' + RELATIONSHIP_NS + '}'):
+                    if name != qn('r:embed') or tag != qn('a:blip'):
+                        return False
+        return True
+
+    def append_native(self, doc):
+        body = self.doc.element.body
+        sect_pr = body.find(qn('w:sectPr'))
+        for element in list(doc.element.body):
+            if element.tag == qn('w:sectPr'):
+                continue
+            # appended documents aren't used afterwards, so elements are moved
+            if sect_pr is not None:
+                sect_pr.addprevious(element)
+            else:
+                body.append(element)
+            for blip in element.iter(qn('a:blip')):
+                rid = blip.get(qn('r:embed'))
+                if rid is None:
+                    continue
+                image_part = self.image_part(doc.part.related_parts[rid])
+                blip.set(qn('r:embed'), self.doc.part.relate_to(image_part, RT.IMAGE))
+
+    # Image part of self.doc with the same content as src_part, added if needed
+    def image_part(self, src_part):
+        image_parts = self.doc.part.package.image_parts
+        # parts may also be added by Composer and by rendering
+        for part in image_parts._image_parts[self.indexed_images:]:
+            self.images.setdefault(part.sha1, part)
+        self.indexed_images = len(image_parts._image_parts)
+
+        sha1 = src_part.sha1
+        part = self.images.get(sha1)
+        if part is None:
+            from docxcompose.image import ImageWrapper
+            part = image_parts._add_image_part(ImageWrapper(src_part))
+            self.images[sha1] = part
+            self.indexed_images += 1
+        return part
+
+def styles_digest(styles) -> str:
+    return hashlib.sha1(etree.tostring(styles)).hexdigest()
+
+# Same ids as Composer gives to bookmarks, drawings and pictures
+def renumber(doc):
+    body = doc.element.body
+    for tag in ('w:bookmarkStart', 'w:bookmarkEnd'):
+        for index, bookmark in enumerate(body.iter(qn(tag))):
+            bookmark.set(qn('w:id'), str(index))
+
+    parts = [rel.target_part for rel in doc.part.rels.values() if rel.reltype in (RT.HEADER, RT.FOOTER)]
+    for tag in ('wp:docPr', 'pic:cNvPr'):
+        elements = list(body.iter(qn(tag)))
+        for part in parts:
+            elements += part.element.iter(qn(tag))
+        for index, element in enumerate(elements):
+            element.set('id', str(index + 1))
@@ -1,3 +1,5 @@
+import re
+
 # Can modify
 COMMENT_START = "#"
 MACRO_START = "("
@@ -18,10 +20,12 @@ INFO_TYPE_PLAIN_LINE = 0
 INFO_TYPE_MACRO = 1
 INFO_TYPE_COMMENT = 2
 
-def lstrip_indent(line: str, indent: int):
-    indent_string_len = len(INDENT_STRING)
+def lstrip_indent(line: str, indent: int, indent_string: str | None = None):
+    if indent_string is None:
+        indent_string = INDENT_STRING
+    indent_string_len = len(indent_string)
     while(indent > 0):
-        if line.startswith(INDENT_STRING):
+        if line.startswith(indent_string):
             line = line[indent_string_len:]
         else:
             return line
@@ -29,11 +33,14 @@ def lstrip_indent(line: str, indent: int):
     return line
 
 class LineInfo:
-    def __init__(self, line: str, indent: int):
-        line = lstrip_indent(line, indent).rstrip('\n')
+    def __init__(self, line: str, indent: int, indent_string: str | None = None):
+        line = lstrip_indent(line, indent, indent_string).rstrip('\n')
         self.line_stripped = line
         self.is_escaped = is_escaped(line)
         self.is_empty = False
+        self.macro_type = None
+        # arguments of macro, parsed on first use of self.args
+        self._args = None
 
         if self.is_escaped:
             self.type = INFO_TYPE_PLAIN_LINE
@@ -42,6 +49,7 @@ class LineInfo:
 
         if is_macro(line):
             self.type = INFO_TYPE_MACRO
+            self.macro_type = get_macro_type(line)
         elif is_comment(line):
             self.type = INFO_TYPE_COMMENT
         else:
@@ -49,6 +57,12 @@ class LineInfo:
                 self.is_empty = True
             self.type = INFO_TYPE_PLAIN_LINE
 
+    @property
+    def args(self) -> list[str] | None:
+        if self._args is None and self.type == INFO_TYPE_MACRO and self.macro_type != MACRO_TYPE_END:
+            self._args = parse_macro_args(self.line_stripped)
+        return self._args
+
 def parse_line(line: str, indent: int) -> (str, LineInfo):
     line = line.rstrip('\n')
     return line, LineInfo(line, indent)
@@ -116,3 +130,106 @@ def parse_macro_args(line) -> list[str]:
             if i == line_len - 1:
                 args.append(line[word_start:line_len])
     return args
+
+################################   Tokenizer   #################################
+
+# Token of a source line. It's a LineInfo of the line with all the indents
+# stripped, see Token.info_at for lines indented deeper than macros nesting.
+# Tokens of repeated macro lines are shared, so they must not be modified
+# (except for the memoized view of info_at).
+class Token:
+    __slots__ = ('line', 'indent_string', 'depth', 'line_stripped', 'type',
+        'is_escaped', 'is_empty', 'macro_type', 'args', 'unindented')
+
+    def __init__(self, line: str, indent_string: str, depth: int, line_stripped: str, type: int):
+        self.line = line
+        self.indent_string = indent_string
+        self.depth = depth
+        self.line_stripped = line_stripped
+        self.type = type
+        self.is_escaped = False
+        self.is_empty = False
+        self.macro_type = None
+        self.args = None
+        # view of info_at(0), made on first use
+        self.unindented = None
+
+    # Returns LineInfo of the line with at most 'indent' indents stripped.
+    # A line indented deeper than that still starts with indent string, so
+    # it's plain text unless indent string itself starts a macro, comment or
+    # escape. Without strip indent, every indented line is viewed at 0
+    def info_at(self, indent: int) -> 'Token | LineInfo':
+        if indent >= self.depth:
+            return self
+        if indent == 0 and self.unindented is not None:
+            return self.unindented
+
+        indent_string = self.indent_string
+        if is_plain_indent(indent_string):
+            info = Token(self.line, indent_string, 0, self.line[indent * len(indent_string):], INFO_TYPE_PLAIN_LINE)
+        else:
+            info = LineInfo(self.line, indent, indent_string)
+        if indent == 0:
+            self.unindented = info
+        return info
+
+# indent string -> whether a line starting with it is plain text
+plain_indents: dict[str, bool] = {}
+
+def is_plain_indent(indent_string: str) -> bool:
+    plain = plain_indents.get(indent_string)
+    if plain is None:
+        plain = not (is_macro(indent_string) or is_comment(indent_string) or is_escaped(indent_string))
+        plain_indents[indent_string] = plain
+    return plain
+
+def compile_indent_re(indent_string: str | None) -> re.Pattern:
+    if not indent_string:
+        return re.compile('')
+    return re.compile('(?:%s)*' % re.escape(indent_string))
+
+# Reads the whole source in one pass.
+# Yields pairs of line number (starting from 1) and Token.
+def tokenize(text: str, indent_string: str | None = None):
+    if indent_string is None:
+        indent_string = INDENT_STRING
+    indent_len = len(indent_string) if indent_string else 0
+    match_indent = compile_indent_re(indent_string).match
+    # raw macro line -> its Token
+    macro_tokens: dict[str, Token] = {}
+
+    lines = text.split('\n')
+    # text ending with a newline doesn't have an empty last line
+    if len(lines) != 0 and lines[-1] == "":
+        lines.pop()
+
+    lineno = 0
+    for line in lines:
+        lineno += 1
+        token = macro_tokens.get(line)
+        if token is not None:
+            yield lineno, token
+            continue
+
+        depth = 0
+        body = line
+        if indent_len != 0 and line.startswith(indent_string):
+            indent_end = match_indent(line).end()
+            body = line[indent_end:]
+            depth = indent_end // indent_len
+
+        if body.startswith(ESCAPE_CHAR):
+            token = Token(line, indent_string, depth, body[len(ESCAPE_CHAR):], INFO_TYPE_PLAIN_LINE)
+            token.is_escaped = True
+        elif body.startswith(MACRO_START) or body.startswith(MACRO_END):
+            token = Token(line, indent_string, depth, body, INFO_TYPE_MACRO)
+            token.macro_type = get_macro_type(body)
+            if token.macro_type != MACRO_TYPE_END:
+                token.args = parse_macro_args(body)
+            macro_tokens[line] = token
+        elif body.startswith(COMMENT_START):
+            token = Token(line, indent_string, depth, body, INFO_TYPE_COMMENT)
+        else:
+            token = Token(line, indent_string, depth, body, INFO_TYPE_PLAIN_LINE)
+            token.is_empty = body == ""
+        yield lineno, token
@@ -0,0 +1,156 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from docx.image.image import Image
+import GdocxTree
+import GdocxCheck
+import GdocxProfile
+import GdocxDocPool
+import GdocxData
+from GdocxTree import ParseError
+
+'''
+Files of a source loaded ahead of rendering.
+
+Before rendering, the tree of the source is scanned for files of image,
+json-reader, load-style and doc macros, following chdir macros as
+conversion does. Missing files are reported then, before anything is
+rendered. The rest are loaded on a thread pool while the source is rendered:
+images are read and their headers parsed, json files are parsed (or indexed,
+see GdocxData), styles are read and documents are parsed into
+GdocxDocPool.AppendedDocs.
+
+Handlers take loaded files with take(ctx, kind, path), which waits for the
+file if it's still being loaded and raises the error of loading, if any.
+A loaded file is given out once and released by the prefetcher, so it's
+kept no longer than its macro needs it. Files which weren't scanned (e.g.
+macros which are registered additionally) and further uses of the same path
+are read by handlers as before.
+
+With --stream images aren't loaded ahead, only checked to exist: loaded
+images would wait in memory for their macros, while streaming keeps memory
+bounded.
+'''
+
+# Threads of the pool shared by conversions, loading is mostly waiting for I/O
+PREFETCH_WORKERS = 8
+
+KIND_IMAGE = "image"
+KIND_JSON = "json-reader"
+KIND_STYLES = "load-style"
+KIND_DOC = "doc"
+
+def load_image(path: str) -> bytes:
+    with open(path, "rb") as file:
+        blob = file.read()
+    # fails on formats python-docx doesn't know
+    Image.from_blob(blob)
+    return blob
+
+def load_json(path: str) -> None:
+    GdocxData.warm(path)
+
+def load_styles(path: str) -> str:
+    with open(path, "r") as file:
+        return file.read()
+
+def load_doc(path: str) -> None:
+    GdocxDocPool.AppendedDocs.warm(path)
+
+LOADERS = {
+    KIND_IMAGE: load_image,
+    KIND_JSON: load_json,
+    KIND_STYLES: load_styles,
+    KIND_DOC: load_doc,
+}
+
+Executor = None
+ExecutorLock = threading.Lock()
+
+def executor() -> ThreadPoolExecutor:
+    global Executor
+    with ExecutorLock:
+        if Executor is None:
+            Executor = ThreadPoolExecutor(PREFETCH_WORKERS, thread_name_prefix = "gdocx-prefetch")
+    return Executor
+
+# Collects files of macros, missing ones are errors.
+# Files the context doesn't allow are left for conversion to reject
+class Scanner(GdocxCheck.Checker):
+    def __init__(self, cwd: str, allows_path = None):
+        super().__init__(cwd)
+        self.allows_path = allows_path
+        # (kind, absolute path) in order of use, without repeats
+        self.assets: list[tuple[str, str]] = []
+        self.seen: set[tuple[str, str]] = set()
+
+    def check_text(self, node: GdocxTree.TextNode):
+        pass
+
+    def enter_macro(self, node: GdocxTree.MacroNode):
+        if node.name not in LOADERS or len(node.args) == 0:
+            return
+        if not self.allows(node.args[0]):
+            return
+        path = os.path.normpath(os.path.join(self.cwd, node.args[0]))
+        if not os.path.isfile(path):
+            self.error(node.lineno, f"{node.name}: file {node.args[0]} doesn't exist")
+            return
+        asset = (node.name, path)
+        if asset not in self.seen:
+            self.seen.add(asset)
+            self.assets.append(asset)
+
+    # Only chdir matters, unclosed macros aren't errors of conversion
+    def exit_macro(self, node: GdocxTree.MacroNode):
+        if not node.closed:
+            return
+        if node.name == "chdir" and len(node.args) != 0 and not self.allows(node.args[0]):
+            return
+        super().exit_macro(node)
+
+    def allows(self, name: str) -> bool:
+        return self.allows_path is None or self.allows_path(os.path.join(self.cwd, name))
+
+    def scan(self, tree: GdocxTree.Tree) -> list[ParseError]:
+        for segment in tree.segments:
+            self.check_segment(segment)
+        self.errors.sort(key = lambda error: error.lineno)
+        return self.errors
+
+class Prefetcher:
+    def __init__(self, assets: list[tuple[str, str]]):
+        self.futures: dict[tuple[str, str], Future] = {}
+        pool = executor()
+        for kind, path in assets:
+            self.futures[(kind, path)] = pool.submit(LOADERS[kind], path)
+
+    # Loaded file, None if it wasn't scanned or was taken already
+    def take(self, kind: str, path: str) -> object | None:
+        future = self.futures.pop((kind, path), None)
+        if future is None:
+            return None
+        return future.result()
+
+# Scans the tree, returns errors of missing files. If there are none,
+# loading of files starts and ctx.prefetcher is set
+def start(ctx, tree: GdocxTree.Tree) -> list[ParseError]:
+    with GdocxProfile.span(ctx.profiler, "prefetch.scan", GdocxProfile.CAT_PREFETCH):
+        scanner = Scanner(ctx.cwd, ctx.allows_path)
+        errors = scanner.scan(tree)
+    if len(errors) == 0:
+        assets = scanner.assets
+        if ctx.stream:
+            assets = [(kind, path) for kind, path in assets if kind != KIND_IMAGE]
+        # stamped before they're read, as handlers do, so that a file changed
+        # after it's loaded is seen as changed (see GdocxWatch)
+        for kind, path in assets:
+            ctx.use_path(path)
+        ctx.prefetcher = Prefetcher(assets)
+    return errors
+
+def take(ctx, kind: str, path: str) -> object | None:
+    if ctx.prefetcher is None:
+        return None
+    with GdocxProfile.span(ctx.profiler, "prefetch.take", GdocxProfile.CAT_PREFETCH):
+        return ctx.prefetcher.take(kind, path)
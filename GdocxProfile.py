@@ -0,0 +1,148 @@
+import os
+import time
+import json
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Type, Any
+
+'''
+Profiling of a conversion.
+
+Every span is recorded as Chrome trace event ("ph": "X"), so the written
+file can be opened in chrome://tracing or https://ui.perfetto.dev.
+Spans carry the number of the source line being processed when they started.
+
+Spans are also aggregated by name into a table with inclusive (total) and
+exclusive (self) times.
+
+Usage:
+    profiler = Profiler()
+    ctx.profiler = profiler
+    ... conversion with ctx ...
+    print(profiler.format_table())
+    profiler.write_trace("trace.json")
+'''
+
+CAT_HANDLER = "handler"
+CAT_STATE = "state"
+CAT_STYLES = "styles"
+CAT_COMPOSE = "compose"
+CAT_SAVE = "save"
+CAT_PREFETCH = "prefetch"
+
+class SpanStats:
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.self_time = 0.0
+        self.max = 0.0
+
+class Profiler:
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self.stats: dict[str, SpanStats] = {}
+        # stack of [start, time_spent_in_children]
+        self.stack = []
+        self.state = None
+        self.instrumented: dict[Type[Any], Type[Any]] = {}
+
+    def current_line(self) -> int:
+        if self.state is None:
+            return 0
+        return self.state.line_number
+
+    @contextmanager
+    def span(self, name: str, cat: str):
+        line = self.current_line()
+        start = time.perf_counter()
+        self.stack.append([start, 0.0])
+        try:
+            yield
+        finally:
+            _, children = self.stack.pop()
+            elapsed = time.perf_counter() - start
+            if len(self.stack) != 0:
+                self.stack[-1][1] += elapsed
+            self.add(name, cat, line, start, elapsed, children)
+
+    def add(self, name: str, cat: str, line: int, start: float, elapsed: float, children: float):
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = SpanStats()
+        stats.calls += 1
+        stats.total += elapsed
+        stats.self_time += elapsed - children
+        stats.max = max(stats.max, elapsed)
+
+        self.events.append({
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": (start - self.origin) * 1e6,
+            "dur": elapsed * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": {"line": line},
+        })
+
+    # Wraps handle_or_get_new_handler, process_line and finalize of state
+    def instrument_state(self, state: 'GdocxState'):
+        self.state = state
+        for method in ["handle_or_get_new_handler", "process_line", "finalize"]:
+            func = getattr(state, method)
+            setattr(state, method, self.wrap(f"{state.NAME}.{method}", CAT_STATE, func))
+
+    # Returns subclass of handler whose trait methods are timed by NAME
+    def instrument_handler(self, cls: Type[Any]) -> Type[Any]:
+        sub = self.instrumented.get(cls)
+        if sub is not None:
+            return sub
+
+        profiler = self
+        name = cls.NAME
+
+        def __init__(this, state: 'GdocxState', macro_args: list[str]):
+            with profiler.span(f"{name}.__init__", CAT_HANDLER):
+                cls.__init__(this, state, macro_args)
+
+        def process_line(this, line: str, info: 'GdocxParsing.LineInfo'):
+            with profiler.span(f"{name}.process_line", CAT_HANDLER):
+                cls.process_line(this, line, info)
+
+        def finalize(this):
+            with profiler.span(f"{name}.finalize", CAT_HANDLER):
+                cls.finalize(this)
+
+        sub = type(cls.__name__, (cls,), {
+            "__init__": __init__,
+            "process_line": process_line,
+            "finalize": finalize,
+        })
+        self.instrumented[cls] = sub
+        return sub
+
+    def wrap(self, name: str, cat: str, func):
+        profiler = self
+        def wrapped(*args, **kwargs):
+            with profiler.span(name, cat):
+                return func(*args, **kwargs)
+        return wrapped
+
+    def format_table(self) -> str:
+        lines = [f"{'name':<44}{'calls':>8}{'total ms':>12}{'self ms':>12}{'mean ms':>10}{'max ms':>10}"]
+        rows = sorted(self.stats.items(), key = lambda item: item[1].self_time, reverse = True)
+        for name, stats in rows:
+            lines.append(f"{name:<44}{stats.calls:>8}{stats.total * 1e3:>12.2f}"
+                f"{stats.self_time * 1e3:>12.2f}{stats.total / stats.calls * 1e3:>10.3f}{stats.max * 1e3:>10.3f}")
+        return '\n'.join(lines)
+
+    def write_trace(self, path: str):
+        with open(path, "w") as file:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, file)
+
+# Span of the profiler, or no-op if profiling is off (profiler is None)
+def span(profiler: Profiler | None, name: str, cat: str):
+    if profiler is None:
+        return nullcontext()
+    return profiler.span(name, cat)
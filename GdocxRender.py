@@ -0,0 +1,57 @@
+import GdocxTree
+from GdocxState import GdocxState
+
+'''
+Renders segments of GdocxTree into documents with the registered handlers.
+
+Handlers are called in the same order as main.process_with_current_handler
+calls them while reading the source:
+    1. Handler of a macro is created when its node is reached, seeing
+        the enclosing handler as state.handler;
+    2. Text nodes are passed to process_line of the enclosing handler;
+    3. finalize is called after the children of a closed macro.
+'''
+
+def render_segment(state: GdocxState, segment: GdocxTree.Segment):
+    render_nodes(state, segment.children)
+
+# Renders nodes which are children of the handler state.handler
+def render_nodes(state: GdocxState, nodes: list):
+    # stack of (children iterator, macro node, handler to restore)
+    stack = [(iter(nodes), None, None)]
+
+    while len(stack) != 0:
+        children, node, prev_handler = stack[-1]
+        child = next(children, None)
+
+        if child is None:
+            stack.pop()
+            if node is not None:
+                if node.closed:
+                    state.line_number = node.end_lineno
+                    state.handler.finalize()
+                state.indent -= 1
+                state.handler = prev_handler
+            continue
+
+        state.line_number = child.lineno
+        if isinstance(child, GdocxTree.TextNode):
+            try:
+                state.handler.process_line(child.line, child.info)
+            except Exception as e:
+                state.exit_with_error(e)
+            continue
+
+        try:
+            new_handler = state.new_handler(child.name, child.args)
+        except Exception as e:
+            state.exit_with_error(e)
+
+        # new_handler sees old handler as state's current handler
+        old_handler = state.handler
+        state.handler = new_handler
+        if old_handler.NAME == GdocxState.NAME:
+            state.finalize()
+
+        state.indent += 1
+        stack.append((iter(child.children), child, old_handler))
@@ -0,0 +1,337 @@
+import io
+import os
+import json
+import stat
+import time
+import zipfile
+import tempfile
+import threading
+import ipaddress
+import socketserver
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import main
+import GdocxStyle
+import GdocxDocPool
+
+'''
+Conversion daemon.
+
+python-docx, default styles and macro handlers are loaded once at startup,
+blank documents are made in advance (see GdocxDocPool),
+then every request is converted with a new context (see GdocxContext) by
+a pool of worker threads, so there's no cold start per document.
+
+Address is PORT or HOST:PORT of localhost HTTP server, or unix:PATH of
+a Unix socket:
+    python3 main.py --serve 8470 -s -se -j 4
+Hosts which aren't loopback are refused unless --allow-remote is given:
+sources are converted with the daemon's permissions.
+
+Endpoints:
+    GET /health
+        JSON with counters of requests and number of workers.
+
+    POST /convert
+        Body is either the source itself (any content type except zip),
+        or a zip archive (application/zip) with the source and its assets.
+        Returns .docx bytes.
+        Query parameters:
+            source=NAME      path of the source inside zip, default source.txt
+            strip_indent=0|1, skip_empty=0|1, skip_numbering=0|1
+                             override options the daemon was started with
+
+Errors are returned as text/plain:
+    400 bad request, 413 body or extracted archive too large,
+    422 error in the source,
+    503 queue is full, 504 conversion takes longer than timeout.
+
+A request can only use files of its own directory: paths of macros and
+chdir which lead out of it (absolute, .., symlinks) are errors of the
+source (see GdocxContext.root).
+
+At most WORKERS conversions run at once and QUEUE_SIZE more wait for them,
+the rest are rejected with 503. Conversion which exceeds the timeout keeps
+its worker until it ends (threads can't be killed), and its slot in queue too.
+'''
+
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+ZIP_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed"}
+SOURCE_NAME = "source.txt"
+OUTPUT_NAME = "output.docx"
+MAX_BODY_BYTES = 64 * 1024 * 1024
+# Limits of a zip archive, checked before it's extracted
+MAX_EXTRACTED_BYTES = 256 * 1024 * 1024
+MAX_ZIP_ENTRIES = 4096
+BOOL_OPTIONS = ["strip_indent", "skip_empty", "skip_numbering"]
+
+class ServeError(Exception):
+    def __init__(self, status: int, msg: str):
+        super().__init__(msg)
+        self.status = status
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {
+            "queued": 0,
+            "running": 0,
+            "converted": 0,
+            "failed": 0,
+            "rejected": 0,
+            "timed_out": 0,
+        }
+
+    def add(self, name: str, value: int = 1):
+        with self.lock:
+            self.counters[name] += value
+
+    def snapshot(self) -> dict[str, int]:
+        with self.lock:
+            return dict(self.counters)
+
+class Converter:
+    def __init__(self, workers: int, queue_size: int, timeout: float | None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix = "gdocx")
+        # slots of running and waiting conversions
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.stats = Stats()
+
+    # Returns .docx bytes, raises ServeError
+    def submit(self, body: bytes, is_zip: bool, source_name: str, options: dict[str, bool]) -> bytes:
+        if not self.slots.acquire(blocking = False):
+            self.stats.add("rejected")
+            raise ServeError(503, f"Queue is full: {self.workers} conversions are running and {self.queue_size} are waiting")
+
+        self.stats.add("queued")
+        future = self.pool.submit(self.convert, body, is_zip, source_name, options)
+        future.add_done_callback(lambda _: self.slots.release())
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            self.stats.add("timed_out")
+            raise ServeError(504, f"Conversion takes longer than {self.timeout}s")
+
+    def convert(self, body: bytes, is_zip: bool, source_name: str, options: dict[str, bool]) -> bytes:
+        self.stats.add("queued", -1)
+        self.stats.add("running")
+        try:
+            with tempfile.TemporaryDirectory(prefix = "gdocx_serve_") as workdir:
+                result = convert_in(workdir, body, is_zip, source_name, options)
+            self.stats.add("converted")
+            return result
+        except BaseException:
+            self.stats.add("failed")
+            raise
+        finally:
+            self.stats.add("running", -1)
+
+    def health(self) -> dict[str, object]:
+        health = {"status": "ok", "workers": self.workers, "queue_size": self.queue_size}
+        health.update(self.stats.snapshot())
+        return health
+
+    def shutdown(self):
+        self.pool.shutdown(wait = False, cancel_futures = True)
+
+# Unpacks request into workdir and converts it there
+def convert_in(workdir: str, body: bytes, is_zip: bool, source_name: str, options: dict[str, bool]) -> bytes:
+    source_path = inside(workdir, source_name)
+    if is_zip:
+        extract_zip(body, workdir)
+    else:
+        with open(source_path, "wb") as file:
+            file.write(body)
+
+    if not os.path.isfile(source_path):
+        raise ServeError(400, f"There is no {source_name} in the archive")
+
+    output_path = os.path.join(workdir, OUTPUT_NAME)
+    ctx = main.create_context(cwd = workdir, root = workdir, **options)
+    try:
+        main.process_txt(source_path, output_path, ctx)
+    except SystemExit:
+        raise ServeError(422, ctx.error if ctx.error is not None else "Conversion failed")
+    except Exception as e:
+        raise ServeError(422, f"{type(e).__name__}: {e}")
+
+    with open(output_path, "rb") as file:
+        return file.read()
+
+def extract_zip(body: bytes, workdir: str):
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(body))
+    except zipfile.BadZipFile as e:
+        raise ServeError(400, f"Bad zip archive: {e}")
+
+    with archive:
+        infos = archive.infolist()
+        # sizes of the archive's directory, so that nothing is written
+        # before a too large archive is rejected
+        if len(infos) > MAX_ZIP_ENTRIES:
+            raise ServeError(413, f"Archive has more than {MAX_ZIP_ENTRIES} entries")
+        if sum(info.file_size for info in infos) > MAX_EXTRACTED_BYTES:
+            raise ServeError(413, f"Archive is larger than {MAX_EXTRACTED_BYTES} bytes extracted")
+        for info in infos:
+            inside(workdir, info.filename)
+        archive.extractall(workdir)
+
+# Returns path of name in workdir, raises ServeError if it points outside
+def inside(workdir: str, name: str) -> str:
+    root = os.path.realpath(workdir)
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.commonpath([root, path]) != root:
+        raise ServeError(400, f"Path {name} is outside of the request's directory")
+    return path
+
+def parse_options(query: dict[str, list[str]]) -> dict[str, bool]:
+    options = {}
+    for name in BOOL_OPTIONS:
+        values = query.get(name)
+        if values is None:
+            continue
+        if values[-1] not in ("0", "1"):
+            raise ServeError(400, f"{name} must be 0 or 1")
+        options[name] = values[-1] == "1"
+    return options
+
+class RequestHandler(BaseHTTPRequestHandler):
+    server_version = "GostDocx"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            self.send_text(404, "Not found")
+            return
+        self.send_body(200, "application/json", json.dumps(self.server.converter.health()).encode())
+
+    def do_POST(self):
+        start = time.perf_counter()
+        try:
+            url = urlparse(self.path)
+            if url.path != "/convert":
+                raise ServeError(404, "Not found")
+            query = parse_qs(url.query)
+            options = parse_options(query)
+            source_name = query.get("source", [SOURCE_NAME])[-1]
+            body = self.read_body()
+            content_type = self.headers.get("Content-Type", "").split(";")[0].strip()
+
+            result = self.server.converter.submit(body, content_type in ZIP_CONTENT_TYPES, source_name, options)
+        except ServeError as e:
+            self.send_text(e.status, str(e))
+            return
+        self.send_body(200, DOCX_CONTENT_TYPE, result)
+        self.log_message("converted %d bytes in %.3fs", len(body), time.perf_counter() - start)
+
+    def read_body(self) -> bytes:
+        length = self.headers.get("Content-Length")
+        if length is None:
+            raise ServeError(411, "Content-Length is required")
+        try:
+            length = int(length)
+        except ValueError:
+            raise ServeError(400, "Content-Length must be an integer")
+        if length > MAX_BODY_BYTES:
+            raise ServeError(413, f"Body is larger than {MAX_BODY_BYTES} bytes")
+        return self.rfile.read(length)
+
+    # body of failed request may be left unread, so connection isn't reused
+    def send_text(self, status: int, text: str):
+        self.close_connection = True
+        self.send_body(status, "text/plain; charset=utf-8", (text + "\n").encode())
+
+    def send_body(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # client address of Unix socket is empty
+    def address_string(self) -> str:
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "unix"
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    # socket left by a previous daemon is replaced, other files are kept
+    def server_bind(self):
+        try:
+            mode = os.lstat(self.server_address).st_mode
+        except FileNotFoundError:
+            mode = None
+        if mode is not None:
+            if not stat.S_ISSOCK(mode):
+                raise Exception(f"{self.server_address} exists and isn't a socket")
+            os.unlink(self.server_address)
+        super().server_bind()
+
+# Returns (host, port) of PORT or HOST:PORT, raises if host isn't loopback
+# and remote clients aren't allowed
+def parse_address(address: str, allow_remote: bool = False) -> tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    if host == "":
+        host = "127.0.0.1"
+    try:
+        port = int(port)
+    except ValueError:
+        raise Exception(f"Port of {address} must be an integer")
+    if not allow_remote and not is_loopback(host):
+        raise Exception(f"{host} isn't a loopback address, pass --allow-remote to serve other hosts")
+    return host, port
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host.strip("[]")).is_loopback
+    except ValueError:
+        return False
+
+# address is PORT, HOST:PORT or unix:PATH
+def create_server(address: str, converter: Converter, allow_remote: bool = False) -> socketserver.BaseServer:
+    if address.startswith("unix:"):
+        server = UnixHTTPServer(address[len("unix:"):], RequestHandler)
+    else:
+        server = ThreadingHTTPServer(parse_address(address, allow_remote), RequestHandler)
+        server.daemon_threads = True
+    server.converter = converter
+    return server
+
+def init_server(init_kwargs: dict[str, object], default_styles_path: str):
+    main.init_gostdocx(**init_kwargs)
+    if GdocxStyle.DefaultStylesPath != default_styles_path:
+        GdocxStyle.init_default_styles(default_styles_path)
+    # every request would overwrite the same trace
+    main.PROFILE_PATH = None
+
+# Serves until interrupted
+def serve(address: str,
+    workers: int,
+    queue_size: int,
+    timeout: float | None,
+    init_kwargs: dict[str, object],
+    default_styles_path: str,
+    allow_remote: bool = False
+):
+    init_server(init_kwargs, default_styles_path)
+    # every worker may take a blank document made while the daemon was idle
+    GdocxDocPool.set_pool_size(workers)
+    GdocxDocPool.pool_for().fill_in_background()
+    converter = Converter(workers, queue_size, timeout)
+    server = create_server(address, converter, allow_remote)
+    print(f"Serving on {address} with {workers} workers, queue of {queue_size}, timeout {timeout}s")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        converter.shutdown()
@@ -7,6 +7,7 @@ from docx.text.run import Run
 import GdocxHandler
 import GdocxParsing
 import GdocxStyle
+from GdocxContext import GdocxContext
 
 default_handlers: list[Type[Any]] = [
         GdocxHandler.OrderedListHandler,
@@ -20,6 +21,7 @@ default_handlers: list[Type[Any]] = [
         GdocxHandler.PageBreakHandler,
         GdocxHandler.TableHandler,
         GdocxHandler.TableCellHandler,
+        GdocxHandler.TableCsvHandler,
         GdocxHandler.AppendPageHandler,
         GdocxHandler.JsonReaderHandler,
         GdocxHandler.JsonFieldHandler,
@@ -28,6 +30,8 @@ default_handlers: list[Type[Any]] = [
         GdocxHandler.NextImageNumberAsRunHandler,
         GdocxHandler.SpaceHandler,
         GdocxHandler.NumberedHandler,
+        GdocxHandler.EchoHandler,
+        GdocxHandler.ChdirHandler,
 ]
 
 # Document passed to ctor must outlive GdocxState.
@@ -37,19 +41,24 @@ class GdocxState:
 
     def __init__(self, 
         doc: Document, 
-        handlers: list[Type[Any]]
+        handlers: list[Type[Any]],
+        ctx: GdocxContext | None = None
     ):
         self.doc = doc
-        # almost all handlers refer to state.receiver and not state.doc
-        self.receiver = GdocxStateReceiver(self)
+        self.ctx = ctx if ctx is not None else GdocxContext(handlers = handlers)
+        # almost all handlers refer to state.receiver and not state.doc.
+        # doc_receiver is the receiver of state.doc itself, it's the one
+        # which tracks the last paragraph of the document body
+        self.doc_receiver = GdocxStateReceiver(self)
+        self.receiver = self.doc_receiver
         self.paragraph_lines = []
         self.current_style = doc.styles['Normal']
         self.registered_handlers = get_handler_dict(default_handlers + handlers)
         self.reached_macro_end = False
         self.handler = self
         self.indent = 0
-        self.strip_indent = False
-        self.skip_empty = False
+        self.strip_indent = self.ctx.strip_indent
+        self.skip_empty = self.ctx.skip_empty
         self.line_number = 0
 
         self.reached_page_macro = False
@@ -57,15 +66,23 @@ class GdocxState:
 
         self.current_macro_name = None
 
+        if self.ctx.profiler is not None:
+            profiler = self.ctx.profiler
+            self.registered_handlers = {name: profiler.instrument_handler(handler)
+                for name, handler in self.registered_handlers.items()}
+            profiler.instrument_state(self)
+
     # Returns new handler, if macro is encountered;
     # otherwise, returns None
     def handle_or_get_new_handler(self,
-        line: str
+        lineno: int,
+        token: GdocxParsing.Token
     ) -> object | None:
-        self.line_number += 1
+        self.line_number = lineno
         indent = self.indent if self.strip_indent else 0
 
-        rawline, info = GdocxParsing.parse_line(line, indent)
+        rawline = token.line
+        info = token.info_at(indent)
 
         try:
             if info.is_empty and self.skip_empty:
@@ -75,12 +92,16 @@ class GdocxState:
             elif info.type != GdocxParsing.INFO_TYPE_COMMENT:
                 self.handler.process_line(rawline, info)
         except Exception as e:
-            traceback.print_exc()
-            print(f"ERROR, line {self.line_number}: {e}")
-            exit(1)
+            self.exit_with_error(e)
 
         return None
 
+    def exit_with_error(self, e: Exception):
+        traceback.print_exc()
+        self.ctx.error = f"ERROR, line {self.line_number}: {e}"
+        print(self.ctx.error)
+        exit(1)
+
     def process_line(self, line: str, info: GdocxParsing.LineInfo):
         # GdocxParsing.INFO_TYPE_MACRO is handled in caller 'handle_or_get_new_handler'
         self.paragraph_lines.append(info.line_stripped)
@@ -91,36 +112,37 @@ class GdocxState:
         line: str, 
         info: GdocxParsing.LineInfo
     ) -> object | None:
-        macro_type = GdocxParsing.get_macro_type(info.line_stripped)
+        # macro type and args are already parsed by tokenizer
+        macro_type = info.macro_type
         new_handler = None
 
         try:
             if macro_type == GdocxParsing.MACRO_TYPE_START or macro_type == GdocxParsing.MACRO_TYPE_ONE_LINE:
-                args = GdocxParsing.parse_macro_args(info.line_stripped)
+                args = info.args
                 if len(args) == 0:
                     raise Exception("Empty macro")
-                macro_name = args[0]
-                if macro_name not in self.registered_handlers:
-                    raise Exception("Couldn't find macro: %s" % macro_name)
-                else:
-                    self.current_macro_name = macro_name
-                    new_handler = self.registered_handlers[macro_name](self, args[1:])
+                new_handler = self.new_handler(args[0], args[1:])
         except Exception as e:
-            traceback.print_exc()
-            print(f"ERROR, line {self.line_number}: {e}")
-            exit(1)
+            self.exit_with_error(e)
 
         self.reached_macro_end = (macro_type == GdocxParsing.MACRO_TYPE_END or macro_type == GdocxParsing.MACRO_TYPE_ONE_LINE)
 
         return new_handler
     
+    def new_handler(self, macro_name: str, macro_args: list[str]) -> object:
+        if macro_name not in self.registered_handlers:
+            raise Exception("Couldn't find macro: %s" % macro_name)
+        self.current_macro_name = macro_name
+        return self.registered_handlers[macro_name](self, macro_args)
+
     def process_header(self, line: str, info: GdocxParsing.LineInfo):
-        self.doc.add_heading(GdocxParsing.get_header_string(line), 0)
+        par = self.doc.add_heading(GdocxParsing.get_header_string(line), 0)
+        self.doc_receiver.set_last_paragraph(par)
 
     def finalize(self):
         if len(self.paragraph_lines) != 0:
             par_content = '\n'.join(self.paragraph_lines)
-            self.doc.add_paragraph(par_content, style = self.STYLE)
+            self.doc_receiver.add_paragraph(par_content, style = self.STYLE)
             self.paragraph_lines = []
 
     def __enter__(self):
@@ -142,12 +164,31 @@ class GdocxStateReceiver:
 
     def __init__(self, state: GdocxState):
         self.state = state
+        # doc.paragraphs is rebuilt from the whole body on every call,
+        # so the last paragraph is remembered instead
+        self.last = None
 
     def add_paragraph(self, text: str = '', style: str | ParagraphStyle | None = None) -> Paragraph:
-        return self.state.doc.add_paragraph(text, style)
+        self.last = self.state.doc.add_paragraph(text, style)
+        return self.last
 
     def add_run(self, text: str = '', style: str | CharacterStyle | None = None) -> Run:
-        return self.get_paragraphs()[-1].add_run(text, style)
+        par = self.last_paragraph()
+        if par is None:
+            raise Exception("There is no paragraph to add run to")
+        return par.add_run(text, style)
 
     def get_paragraphs(self):
         return self.state.doc.paragraphs
+
+    def last_paragraph(self) -> Paragraph | None:
+        if self.last is None:
+            # only paragraphs which were in the document before the state
+            paragraphs = self.state.doc.paragraphs
+            if len(paragraphs) != 0:
+                self.last = paragraphs[-1]
+        return self.last
+
+    # For paragraphs appended to state.doc bypassing the receiver
+    def set_last_paragraph(self, par: Paragraph):
+        self.last = par
@@ -0,0 +1,165 @@
+import tempfile
+from lxml import etree
+from docx.oxml.ns import qn
+from docx.package import ImageParts
+from docx.parts.image import ImagePart
+from docx.opc.pkgwriter import PackageWriter
+import GdocxZip
+
+'''
+Streaming output: .docx is written while the source is converted.
+
+Whenever the body has more than FLUSH_ELEMENTS elements and no macro is open,
+elements up to the last paragraph (which macros like image-caption may still
+change) are serialized into a temporary file and removed from the tree.
+Images are written into the archive (see GdocxZip) as soon as they are
+added, and their bytes are released. On finish, the rest of the package is
+written as python-docx would write it, with word/document.xml assembled from the
+temporary file and the rest of the body. So memory used by a conversion
+doesn't grow with the length of the document.
+
+Drawing ids are given by python-docx as max id in the document + 1, so max
+id of flushed elements is kept on a marker element, which isn't written.
+
+A serialized element declares all namespaces in scope, so declarations
+which w:document already has are removed from it. Output has the same parts
+as the one of a usual conversion.
+
+doc macro isn't supported, since Composer needs whole documents.
+'''
+
+FLUSH_ELEMENTS = 512
+
+MARKER_TAG = "{urn:gostdocx:stream}flushed"
+BODY_START_TAG = b"<w:body>"
+
+# Image parts which are written into the archive as soon as they're added.
+# Duplicates are found by sha1 kept here, since blobs are released
+class StreamedImageParts(ImageParts):
+    def __init__(self, writer: 'StreamWriter', image_parts: ImageParts):
+        super().__init__()
+        self.writer = writer
+        self.by_sha1 = {}
+        for part in image_parts._image_parts:
+            self.append(part)
+            self.by_sha1.setdefault(part.sha1, part)
+
+    def _get_by_sha1(self, sha1: str) -> ImagePart | None:
+        return self.by_sha1.get(sha1)
+
+    def _add_image_part(self, image) -> ImagePart:
+        part = super()._add_image_part(image)
+        self.by_sha1[image.sha1] = part
+        self.writer.write_image(part)
+        return part
+
+class StreamWriter:
+    def __init__(self, doc, filepath: str, compression: str = GdocxZip.DEFAULT, flush_elements: int = FLUSH_ELEMENTS):
+        self.doc = doc
+        self.flush_elements = flush_elements
+        self.archive = GdocxZip.ZipWriter(filepath, compression)
+        # serialized body elements, in order
+        self.body_file = tempfile.TemporaryFile()
+        self.written = set()
+        self.flushed = 0
+
+        package = doc.part.package
+        package.__dict__['image_parts'] = StreamedImageParts(self, package.image_parts)
+
+        # namespaces of w:document, which flushed elements inherit
+        self.declarations = [f' xmlns:{prefix}="{uri}"'.encode()
+            for prefix, uri in doc.element.nsmap.items() if prefix is not None]
+
+        self.marker = etree.Element(MARKER_TAG, id = "0")
+        doc.element.body.insert(0, self.marker)
+
+    def write_image(self, part: ImagePart):
+        self.archive.add(part.partname.membername, part.blob)
+        self.written.add(part.partname)
+        part._blob = b""
+        if part._image is not None:
+            part._image._blob = b""
+
+    # Called between top-level lines, receiver is state.doc_receiver
+    def flush(self, receiver):
+        body = self.doc.element.body
+        if len(body) <= self.flush_elements:
+            return
+
+        elements = list(body)
+        keep = keep_from(elements, body, receiver.last)
+        max_id = int(self.marker.get("id"))
+        for element in elements[1:keep]:
+            for value in element.xpath('.//@id'):
+                if value.isdigit():
+                    max_id = max(max_id, int(value))
+            self.body_file.write(self.serialize(element))
+            body.remove(element)
+            self.flushed += 1
+        self.marker.set("id", str(max_id))
+
+    # XML of a body element without namespace declarations of w:document
+    def serialize(self, element) -> bytes:
+        xml = etree.tostring(element, encoding = "UTF-8")
+        # '>' is escaped in values of attributes, so it ends the start tag
+        end = xml.index(b">")
+        start_tag = xml[:end]
+        for declaration in self.declarations:
+            start_tag = start_tag.replace(declaration, b"", 1)
+        return start_tag + xml[end:]
+
+    # Writes the rest of the package and closes it
+    def finish(self):
+        self.doc.element.body.remove(self.marker)
+        package = self.doc.part.package
+        for part in package.parts:
+            part.before_marshal()
+        PackageWriter._write_content_types_stream(self, package.parts)
+        PackageWriter._write_pkg_rels(self, package.rels)
+        PackageWriter._write_parts(self, package.parts)
+        self.close()
+
+    def close(self):
+        self.archive.close()
+        self.body_file.close()
+
+    # Interface of python-docx's PhysPkgWriter
+    def write(self, pack_uri, blob: bytes):
+        if pack_uri in self.written:
+            return
+        if pack_uri != self.doc.part.partname:
+            self.archive.add(pack_uri.membername, blob)
+            return
+
+        start = blob.index(BODY_START_TAG) + len(BODY_START_TAG)
+        self.body_file.seek(0)
+        with self.archive.open(pack_uri.membername) as stream:
+            stream.write(blob[:start])
+            while True:
+                chunk = self.body_file.read(1024 * 1024)
+                if len(chunk) == 0:
+                    break
+                stream.write(chunk)
+            stream.write(blob[start:])
+
+# Index of the first element to keep: the last paragraph of the body
+# and the element containing receiver's last paragraph are kept
+def keep_from(elements: list, body, last) -> int:
+    # sectPr ends the body
+    end = len(elements)
+    if elements[-1].tag == qn('w:sectPr'):
+        end -= 1
+
+    keep = end
+    for index in range(end - 1, 0, -1):
+        if elements[index].tag == qn('w:p'):
+            keep = index
+            break
+
+    if last is not None:
+        element = last._p
+        while element is not None and element.getparent() is not body:
+            element = element.getparent()
+        if element is not None:
+            keep = min(keep, elements.index(element))
+    return keep
@@ -1,12 +1,22 @@
+import os
 import copy
 import json
+import hashlib
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
 import docx
+from lxml import etree
+from docx.oxml import parse_xml
+from docx.oxml.ns import qn
+from docx.styles import BabelFish
 from docx.styles.style import BaseStyle, ParagraphStyle, CharacterStyle
 from docx.enum.text import WD_LINE_SPACING, WD_PARAGRAPH_ALIGNMENT, WD_COLOR_INDEX, WD_UNDERLINE
 from docx.enum.style import WD_STYLE_TYPE
 from docx.shared import Pt, Inches, Cm, RGBColor, Length
 from docx import Document
 from docx.text.run import Run, Font
+import GdocxCommon
 
 '''
 Guidelines for styles:
@@ -54,6 +64,9 @@ FIELD_IMAGE_CAPTION_INFIX = "image_caption_infix"
 
 # You can change it
 # Don't forget to add new default styles in set_defaults_if_not_set()
+#
+# Class attributes hold values of default styles. Every conversion has
+# its own instance in GdocxContext.style, load-style macro changes that one
 class Style:
     UNORDERED_LIST_PREFIX = None
     IMAGE_CAPTION_PREFIX = None
@@ -67,35 +80,51 @@ def create_default_par_style(style_name: str, doc: Document) -> ParagraphStyle:
     fmt.line_spacing_rule = WD_LINE_SPACING.ONE_POINT_FIVE
     return style
 
-def use_styles_from_file(filepath: str, doc: Document, to_override: bool = False):
-    file = open(filepath, "r")
-    json_string = file.read()
-    parse_raw_styles(json_string, doc, to_override)
+# style_values is where element values are put: Style class or its instance
+def use_styles_from_file(filepath: str, doc: Document, to_override: bool = False, style_values: Style = Style):
+    with open(filepath, "r") as file:
+        json_string = file.read()
+    use_raw_styles(json_string, doc, to_override, style_values)
+
+# Same as parse_raw_styles, but takes the result from compiled styles cache
+# if the same json was already applied to the same styles
+def use_raw_styles(json_string: str, doc: Document, to_override: bool, style_values: Style = Style):
+    key = compiled_styles_key(json_string, doc, to_override)
+    compiled = CompiledStylesCache.get(key)
+    if compiled is None:
+        values = SimpleNamespace()
+        parse_raw_styles(json_string, doc, to_override, values)
+        compiled = CompiledStyles(etree.tostring(doc.styles.element), vars(values))
+        CompiledStylesCache.put(key, compiled)
+    else:
+        compiled.apply(doc)
+
+    for name, value in compiled.values.items():
+        setattr(style_values, name, value)
 
-def parse_raw_styles(json_string: str, doc: Document, to_override: bool):
+def parse_raw_styles(json_string: str, doc: Document, to_override: bool, style_values: Style = Style):
     raw_styles = json.loads(json_string)
 
     for style_name in raw_styles:
         if style_name == FIELD_UNORDERED_LIST_PREFIX:
-            Style.UNORDERED_LIST_PREFIX = raw_styles[style_name]
+            style_values.UNORDERED_LIST_PREFIX = raw_styles[style_name]
             continue
         if style_name == FIELD_IMAGE_CAPTION_PREFIX:
-            Style.IMAGE_CAPTION_PREFIX = raw_styles[style_name]
+            style_values.IMAGE_CAPTION_PREFIX = raw_styles[style_name]
             continue
         if style_name == FIELD_IMAGE_CAPTION_INFIX:
-            Style.IMAGE_CAPTION_INFIX = raw_styles[style_name]
+            style_values.IMAGE_CAPTION_INFIX = raw_styles[style_name]
             continue
         if style_name in doc.styles and not to_override:
             raise Exception(f"Style {style_name} encountered twice")
         raw_style = raw_styles[style_name]
         style = parse_raw_style(style_name, raw_style, doc)
 
+# json_dict is not changed
 def parse_raw_style(style_name: str, json_dict: dict[str, object], doc: Document) -> BaseStyle:
-    if json_dict['is_paragraph']:
-        del json_dict[FIELD_IS_PAR]
+    if json_dict[FIELD_IS_PAR]:
         style = parse_raw_par_style(style_name, json_dict, doc)
     else:
-        del json_dict[FIELD_IS_PAR]
         style = parse_raw_char_style(style_name, json_dict, doc)
     return style
 
@@ -108,7 +137,9 @@ def parse_raw_par_style(style_name: str, json_dict: dict[str, object], doc: Docu
 
     for name in json_dict:
         value = json_dict[name]
-        if name == "font":
+        if name == FIELD_IS_PAR:
+            continue
+        elif name == "font":
             parse_raw_font(style, value)
         elif name == "base_style":
             style.base_style = doc.styles[value]
@@ -123,7 +154,9 @@ def parse_raw_par_style(style_name: str, json_dict: dict[str, object], doc: Docu
 def parse_raw_char_style(style_name: str, json_dict: dict[str, object], doc: Document) -> BaseStyle:
     for name in json_dict:
         value = json_dict[name]
-        if name == "font":
+        if name == FIELD_IS_PAR:
+            continue
+        elif name == "font":
             parse_raw_font(style, value)
         else:
             raise Exception("Can't put in character style anything except 'font'")
@@ -146,10 +179,127 @@ def parse_raw_font(style: BaseStyle, font_dict: dict[str, object]):
         else:
             setattr(style.font, name, value)
 
-DefaultStylesDoc = Document()
+##########################   Compiled styles cache   ##########################
+
+# Result of applying styles json to a document: its styles.xml and values
+# of Style fields which the json sets
+class CompiledStyles:
+    def __init__(self, styles_xml: bytes, values: dict[str, object]):
+        self.styles_xml = styles_xml
+        self.values = values
+        # parsed once, every document gets its copy
+        self.element = None
+
+    # Replaces styles part's element, which is cheaper than
+    # moving its children one by one
+    def apply(self, doc: Document):
+        if self.element is None:
+            self.element = parse_xml(self.styles_xml)
+        doc.part._styles_part._element = copy.deepcopy(self.element)
+
+# Increment when parsing of styles changes, so that stale entries are not used
+COMPILED_STYLES_VERSION = 1
+
+# Result depends on the json and on the styles it's applied to
+def compiled_styles_key(json_string: str, doc: Document, to_override: bool) -> str:
+    h = hashlib.sha1()
+    h.update(f"{COMPILED_STYLES_VERSION}\0{docx.__version__}\0{to_override}\0".encode())
+    h.update(hashlib.sha1(json_string.encode()).digest())
+    h.update(hashlib.sha1(etree.tostring(doc.styles.element)).digest())
+    return h.hexdigest()
+
+def default_compiled_styles_dir() -> str:
+    return GdocxCommon.user_cache_dir("styles")
+
+# LRU of compiled styles in memory, backed by files in dirpath (if not None)
+class CompiledStylesLRU:
+    def __init__(self, capacity: int = 32, dirpath: str | None = None):
+        self.capacity = capacity
+        self.dirpath = dirpath
+        self.entries: OrderedDict[str, CompiledStyles] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> CompiledStyles | None:
+        with self.lock:
+            compiled = self.entries.get(key)
+            if compiled is not None:
+                self.entries.move_to_end(key)
+                return compiled
+        compiled = self.load(key)
+        if compiled is not None:
+            self.remember(key, compiled)
+        return compiled
+
+    def put(self, key: str, compiled: CompiledStyles):
+        self.remember(key, compiled)
+        self.store(key, compiled)
+
+    def remember(self, key: str, compiled: CompiledStyles):
+        with self.lock:
+            self.entries[key] = compiled
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last = False)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.dirpath, key + ".json")
+
+    def load(self, key: str) -> CompiledStyles | None:
+        if self.dirpath is None:
+            return None
+        try:
+            with open(self.path(key), "r") as file:
+                entry = json.load(file)
+            return CompiledStyles(entry["styles_xml"].encode(), entry["values"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    # Cache on disk is optional, conversion goes on if it can't be written
+    def store(self, key: str, compiled: CompiledStyles):
+        if self.dirpath is None:
+            return
+        entry = {"styles_xml": compiled.styles_xml.decode(), "values": compiled.values}
+        try:
+            os.makedirs(self.dirpath, exist_ok = True)
+            GdocxCommon.write_atomic(self.path(key), json.dumps(entry).encode())
+        except OSError:
+            pass
+
+# kept on disk only if a dir is set, see main.init_gostdocx
+CompiledStylesCache = CompiledStylesLRU()
+
+# dirpath None turns off the cache on disk
+def set_compiled_styles_dir(dirpath: str | None):
+    CompiledStylesCache.dirpath = dirpath
+
+################################################################################
+
+# Made by default_styles_doc() on first use, not at import:
+# Document() is slow and runs which don't render don't need it
+DefaultStylesDoc = None
+DefaultStylesLock = threading.Lock()
+# Path of default styles loaded into DefaultStylesDoc
+DefaultStylesPath = None
+DefaultStylesDigest = None
+# Values of Style after init_default_styles, every conversion starts with them
+DefaultStyleValues: dict[str, object] = {}
+
+def default_styles_doc() -> Document:
+    global DefaultStylesDoc
+    with DefaultStylesLock:
+        if DefaultStylesDoc is None:
+            DefaultStylesDoc = Document()
+    return DefaultStylesDoc
 
 def init_default_styles(filepath: str):
-    use_styles_from_file(filepath, DefaultStylesDoc)
+    global DefaultStylesPath, DefaultStylesDigest
+    DefaultStylesDigest = None
+    use_styles_from_file(filepath, default_styles_doc())
+    DefaultStylesPath = filepath
+    DefaultStylesDigest = styles_digest(DefaultStylesDoc)
+    for name in vars(Style):
+        if not name.startswith('_'):
+            DefaultStyleValues[name] = getattr(Style, name)
 
 # Slightly rewritten code from https://stackoverflow.com/questions/78733174/how-can-i-use-styles-from-an-existing-docx-file-in-my-new-document
 #
@@ -167,8 +317,42 @@ def copy_styles(dest: Document, src: Document):
             dest.styles[name].delete()
         copy_style(dest, src, name)
 
-def use_default_styles(doc: Document):
-    copy_styles(doc, DefaultStylesDoc)
+# Styles of dest after copy_styles(dest, src) in one pass: styles of src
+# replace styles of dest with the same names and are appended in src order
+def merge_styles(dest_element, src_element):
+    src_styles = src_element.style_lst
+    src_names = {style_key(style) for style in src_styles}
+    merged = copy.copy(dest_element)
+    for child in list(merged):
+        if child.tag == qn('w:style') and style_key(child) in src_names:
+            merged.remove(child)
+    for style in src_styles:
+        merged.append(copy.copy(style))
+    return merged
+
+def style_key(style) -> str | None:
+    return BabelFish.internal2ui(style.name_val)
+
+# Default styles change only in init_default_styles, so their digest is kept
+def styles_digest(doc: Document) -> str:
+    if doc is DefaultStylesDoc and DefaultStylesDigest is not None:
+        return DefaultStylesDigest
+    return hashlib.sha1(etree.tostring(doc.styles.element)).hexdigest()
+
+# Merged styles by digests of (dest, src). New documents have the same
+# styles, so merge is done once and then only copied
+PreparedStylesCache = CompiledStylesLRU(capacity = 8)
+
+def use_default_styles(doc: Document, src: 'Document | None' = None):
+    if src is None:
+        src = default_styles_doc()
+    key = styles_digest(doc) + styles_digest(src)
+    prepared = PreparedStylesCache.get(key)
+    if prepared is None:
+        prepared = CompiledStyles(None, {})
+        prepared.element = merge_styles(doc.styles.element, src.styles.element)
+        PreparedStylesCache.put(key, prepared)
+    prepared.apply(doc)
 
 ###############################   Serialization   ##############################
 
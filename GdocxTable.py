@@ -0,0 +1,84 @@
+import os
+import csv
+import itertools
+from copy import deepcopy
+from docx.enum.style import WD_STYLE_TYPE
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+
+'''
+Tables filled from CSV files (table-csv macro).
+
+    (table-csv measurements.csv paragraph 1)
+
+Rows are read one at a time and w:tr elements are built right away from
+copies of template elements, without python-docx objects per row or cell:
+the table is created by python-docx with one row, which becomes the template.
+A cell with a value has one paragraph of the given style with the value as
+its run, as table-cell makes it. Empty values leave the cell's paragraph
+empty. The first header-rows rows are repeated on every page.
+
+Number of columns is given by the first row, shorter rows are padded with
+empty cells.
+'''
+
+# Characters python-docx turns into w:tab and w:br elements of a run
+RUN_CONTROL_CHARS = frozenset("\t\r\n")
+XML_SPACE = qn("xml:space")
+
+# Copies of w:tc of a new table, filled with a value
+class CellTemplates:
+    def __init__(self, empty, style_id: str | None):
+        self.empty = empty
+        self.styled = deepcopy(empty)
+        self.styled.p_lst[0].style = style_id
+        self.text = deepcopy(self.styled)
+        self.text.p_lst[0].add_r().add_t("")
+
+    def cell(self, value: str):
+        if value == "":
+            return deepcopy(self.empty)
+        if not RUN_CONTROL_CHARS.isdisjoint(value):
+            # breaks and tabs are added as table-cell adds them
+            tc = deepcopy(self.styled)
+            tc[-1].add_r().text = value.replace("\r\n", "\n")
+            return tc
+        tc = deepcopy(self.text)
+        t = tc[-1][-1][0]
+        t.text = value
+        if len(value.strip()) < len(value):
+            t.set(XML_SPACE, "preserve")
+        return tc
+
+def add_csv_table(doc, path: str, style: str, header_rows: int = 0) -> int:
+    name = os.path.basename(path)
+    with open(path, "r", newline = "", encoding = "utf-8-sig") as file:
+        rows = csv.reader(file)
+        first = next(rows, None)
+        if first is None or len(first) == 0:
+            raise Exception(f"{name} has no rows")
+        cols = len(first)
+
+        table = doc.add_table(rows = 1, cols = cols)
+        tbl = table._tbl
+        row_template = tbl.tr_lst[0]
+        tbl.remove(row_template)
+        # cells of a new table are the same
+        cells = CellTemplates(row_template.tc_lst[0], doc.part.get_style_id(style, WD_STYLE_TYPE.PARAGRAPH))
+        for tc in row_template.tc_lst:
+            row_template.remove(tc)
+        header_template = deepcopy(row_template)
+        header_template.get_or_add_trPr().append(OxmlElement("w:tblHeader"))
+
+        count = 0
+        for values in itertools.chain([first], rows):
+            if len(values) > cols:
+                raise Exception(f"{name}: row {count + 1} has {len(values)} fields, the first one has {cols}")
+            tr = deepcopy(header_template if count < header_rows else row_template)
+            for value in values:
+                tr.append(cells.cell(value))
+            for _ in range(cols - len(values)):
+                tr.append(deepcopy(cells.empty))
+            tbl.append(tr)
+            count += 1
+    return count
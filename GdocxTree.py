@@ -0,0 +1,160 @@
+import hashlib
+import GdocxParsing
+
+'''
+Intermediate representation of a source.
+
+parse() turns source text into a Tree without touching python-docx.
+The tree follows the same rules as main.process_with_current_handler:
+    1. Indents of a line are stripped up to the nesting depth of macros
+        (if strip_indent), so the same lines are macros, comments and text;
+    2. Tree is split into segments by page macros (doc). Every segment is
+        rendered into its own document. A segment ends right after the page
+        macro or the first macro nested in it closes, leaving the enclosing
+        macros unclosed;
+    3. Unclosed macros (at segment end or end of file) are not finalized;
+    4. End macro outside of any macro stops processing of the source.
+
+Every node carries line numbers and content hash of its subtree, so that
+results can be cached and compared without rendering.
+'''
+
+# Must agree with NAME of GdocxHandler.AppendPageHandler, this module
+# is not allowed to import handlers (and python-docx with them)
+PAGE_MACRO_NAMES = {"doc"}
+
+class TextNode:
+    __slots__ = ('lineno', 'line', 'info', 'hash')
+
+    def __init__(self, lineno: int, line: str, info: 'GdocxParsing.LineInfo'):
+        self.lineno = lineno
+        self.line = line
+        self.info = info
+        self.hash = hashlib.sha1(info.line_stripped.encode()).digest()
+
+class MacroNode:
+    __slots__ = ('lineno', 'end_lineno', 'name', 'args', 'children', 'closed', 'hash')
+
+    def __init__(self, lineno: int, name: str, args: list[str]):
+        self.lineno = lineno
+        self.end_lineno = None
+        self.name = name
+        self.args = args
+        self.children = []
+        self.closed = False
+        self.hash = None
+
+    def compute_hash(self):
+        h = hashlib.sha1()
+        h.update(self.name.encode())
+        for arg in self.args:
+            h.update(b'\0' + arg.encode())
+        h.update(b'\1' if self.closed else b'\2')
+        for child in self.children:
+            h.update(child.hash)
+        self.hash = h.digest()
+
+class Segment:
+    def __init__(self):
+        self.children = []
+        # page macro which ended the segment
+        self.page_node = None
+
+class ParseError:
+    FMT = "ERROR, line %d: %s"
+
+    def __init__(self, lineno: int, msg: str):
+        self.lineno = lineno
+        self.msg = msg
+
+    def __str__(self):
+        return self.FMT % (self.lineno, self.msg)
+
+class Tree:
+    def __init__(self):
+        self.segments = [Segment()]
+        self.errors: list[ParseError] = []
+        # line of end macro which stopped processing, or None
+        self.stopped_at = None
+
+def parse(text: str,
+    strip_indent: bool = False,
+    skip_empty: bool = False,
+    indent_string: str | None = None
+) -> Tree:
+    tree = Tree()
+    segment = tree.segments[0]
+    # open macros of the current segment
+    stack: list[MacroNode] = []
+    page_macro_open = False
+
+    for lineno, token in GdocxParsing.tokenize(text, indent_string):
+        info = token.info_at(len(stack) if strip_indent else 0)
+
+        if info.type == GdocxParsing.INFO_TYPE_COMMENT:
+            continue
+        if info.is_empty and skip_empty:
+            continue
+
+        children = stack[-1].children if len(stack) != 0 else segment.children
+        if info.type != GdocxParsing.INFO_TYPE_MACRO:
+            children.append(TextNode(lineno, token.line, info))
+            continue
+
+        closed = None
+        if info.macro_type == GdocxParsing.MACRO_TYPE_END:
+            if len(stack) == 0:
+                tree.stopped_at = lineno
+                break
+            closed = stack.pop()
+            closed.end_lineno = lineno
+        else:
+            if len(info.args) == 0:
+                tree.errors.append(ParseError(lineno, "Empty macro"))
+                continue
+            node = MacroNode(lineno, info.args[0], info.args[1:])
+            children.append(node)
+            if node.name in PAGE_MACRO_NAMES:
+                page_macro_open = True
+                segment.page_node = node
+
+            if info.macro_type == GdocxParsing.MACRO_TYPE_ONE_LINE:
+                closed = node
+                closed.end_lineno = lineno
+            else:
+                stack.append(node)
+
+        if closed is None:
+            continue
+        closed.closed = True
+        closed.compute_hash()
+
+        if page_macro_open:
+            page_macro_open = False
+            for node in reversed(stack):
+                node.compute_hash()
+            stack = []
+            segment = Segment()
+            tree.segments.append(segment)
+
+    for node in reversed(stack):
+        node.compute_hash()
+    return tree
+
+def segment_hash(segment: Segment) -> bytes:
+    h = hashlib.sha1()
+    for child in segment.children:
+        h.update(child.hash)
+    return h.digest()
+
+# Yields (node, depth) of the subtree in source order
+def walk(children: list):
+    stack = [iter(children)]
+    while len(stack) != 0:
+        node = next(stack[-1], None)
+        if node is None:
+            stack.pop()
+            continue
+        yield node, len(stack) - 1
+        if isinstance(node, MacroNode):
+            stack.append(iter(node.children))
@@ -0,0 +1,62 @@
+import os
+import time
+import traceback
+import main
+from GdocxContext import file_stamp
+
+'''
+Watch mode: converts the source and converts it again whenever any file it
+depends on changes.
+
+Dependencies are recorded by the conversion itself (see
+GdocxContext.use_path): the source, files of image, json-reader, table-csv,
+load-style and doc macros and dirs of chdir macros, each with its stamp
+taken before it was read, so a file saved during a build triggers the next
+one. They are polled every INTERVAL seconds, so it works with editors which
+replace the file on save.
+Rebuilds happen in the same process: python-docx and default styles are
+loaded once.
+
+    python3 main.py -i YOUR_FILE.txt -o YOUR_OUTPUT.docx -s -se --watch
+'''
+
+INTERVAL = 0.2
+
+def changed_paths(stamps: dict[str, tuple[int, int, int] | None]) -> list[str]:
+    return [path for path, stamp in stamps.items() if file_stamp(path) != stamp]
+
+# Converts once, returns stamps of files the conversion depends on.
+# Errors are printed, the source is still watched
+def build(inpath: str, outpath: str, create_context = main.create_context) -> dict[str, tuple[int, int, int] | None]:
+    ctx = create_context()
+    source = os.path.normpath(ctx.abspath(inpath))
+    source_stamp = file_stamp(source)
+    start = time.perf_counter()
+    try:
+        main.process_txt(inpath, outpath, ctx)
+        print(f"\'{outpath}\' created in {time.perf_counter() - start:.2f}s")
+    except SystemExit:
+        # error is already printed by GdocxState
+        pass
+    except Exception:
+        traceback.print_exc()
+
+    dependencies = ctx.dependencies
+    dependencies.setdefault(source, source_stamp)
+    return dependencies
+
+# Rebuilds outpath until interrupted
+def watch(inpath: str, outpath: str, create_context = main.create_context, interval: float = INTERVAL):
+    try:
+        while True:
+            stamps = build(inpath, outpath, create_context)
+            print(f"Watching {len(stamps)} files, press Ctrl+C to stop")
+
+            changed = []
+            while len(changed) == 0:
+                time.sleep(interval)
+                changed = changed_paths(stamps)
+            for path in changed:
+                print(f"Changed: {path}")
+    except KeyboardInterrupt:
+        pass
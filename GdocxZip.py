@@ -0,0 +1,211 @@
+import os
+import time
+import zlib
+import zipfile
+import threading
+from collections import deque
+
+'''
+Writing of .docx archives with configurable compression.
+
+Levels of compression (--compression):
+    store    parts aren't compressed, for fast intermediate builds;
+    fast     zlib level 1;
+    default  zlib default level, as python-docx compresses;
+    max      zlib level 9, for archival.
+
+Parts which are compressed already (JPEG and PNG images and other media,
+see STORED_EXTENSIONS) are always stored: deflating them takes most of the
+time of saving image-heavy documents and makes them no smaller.
+
+Parts are deflated on a thread pool (zlib releases the GIL) while python-docx
+serializes the next ones, and are written into the archive in the order
+python-docx writes them. Parts larger than CHUNK_SIZE are split into chunks
+which are deflated in parallel into one deflate stream: every chunk but the
+last ends with a sync flush and is primed with the last 32 KB of the
+previous one, as pigz does, so the ratio stays about the same.
+
+zipfile has no public way to write data which is deflated already, so
+ZipWriter writes it with internals of ZipFile, as writestr does, if they're
+there (see has_raw_write). Otherwise, and with RAW_WRITE off, parts are
+written with ZipFile.writestr, which deflates them on the calling thread.
+'''
+
+STORE = "store"
+FAST = "fast"
+DEFAULT = "default"
+MAX = "max"
+
+# zlib level by level of compression, None stores parts
+LEVELS = {
+    STORE: None,
+    FAST: 1,
+    DEFAULT: zlib.Z_DEFAULT_COMPRESSION,
+    MAX: 9,
+}
+
+STORED_EXTENSIONS = {
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".jp2",
+    ".mp3", ".mp4", ".m4a", ".wma", ".wmv", ".avi",
+    ".zip", ".docx", ".xlsx", ".pptx",
+}
+
+# Smaller parts are deflated right away, a task would cost more
+PARALLEL_MIN_BYTES = 64 * 1024
+CHUNK_SIZE = 1024 * 1024
+# Window of deflate, primes the next chunk
+WINDOW_SIZE = 32 * 1024
+COMPRESS_WORKERS = os.cpu_count() or 1
+# Parts being deflated before write waits for the first of them,
+# so that memory of a streamed document stays bounded
+MAX_PENDING = 4 * COMPRESS_WORKERS
+# Write deflated data with internals of ZipFile if they're there
+RAW_WRITE = True
+# Internals of ZipFile used by ZipWriter.write_entry
+RAW_WRITE_ATTRS = ("fp", "start_dir", "filelist", "NameToInfo", "_writecheck", "_didModify")
+
+Executor = None
+ExecutorLock = threading.Lock()
+
+def executor():
+    global Executor
+    with ExecutorLock:
+        if Executor is None:
+            # imported here: it isn't needed for the command line to start
+            from concurrent.futures import ThreadPoolExecutor
+            Executor = ThreadPoolExecutor(COMPRESS_WORKERS, thread_name_prefix = "gdocx-zip")
+    return Executor
+
+def check_compression(compression: str):
+    if compression not in LEVELS:
+        raise Exception(f"Unknown compression {compression}, must be one of: {', '.join(LEVELS)}")
+
+def has_raw_write(archive: zipfile.ZipFile) -> bool:
+    return all(hasattr(archive, name) for name in RAW_WRITE_ATTRS)
+
+def zip_info(name: str, compress_type: int) -> zipfile.ZipInfo:
+    zinfo = zipfile.ZipInfo(name, time.localtime(time.time())[:6])
+    zinfo.compress_type = compress_type
+    zinfo.external_attr = 0o600 << 16
+    return zinfo
+
+# zlib level of a part, None if it's stored
+def part_level(name: str, compression: str) -> int | None:
+    if os.path.splitext(name)[1].lower() in STORED_EXTENSIONS:
+        return None
+    return LEVELS[compression]
+
+def deflate(data: memoryview, level: int, zdict: memoryview | None, last: bool) -> bytes:
+    if zdict is None:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY, zdict)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+# Part which is written into the archive when its data is ready
+class Entry:
+    def __init__(self, name: str, blob: bytes, level: int | None):
+        self.name = name
+        self.size = len(blob)
+        self.compress_type = zipfile.ZIP_STORED if level is None else zipfile.ZIP_DEFLATED
+        # CRC and chunks of data are futures if they're computed on the pool
+        self.parallel = level is not None and self.size >= PARALLEL_MIN_BYTES
+
+        if not self.parallel:
+            self.crc = zlib.crc32(blob)
+            self.chunks = [blob if level is None else deflate(blob, level, None, True)]
+            return
+
+        pool = executor()
+        self.crc = pool.submit(zlib.crc32, blob)
+        self.chunks = []
+        view = memoryview(blob)
+        for start in range(0, self.size, CHUNK_SIZE):
+            zdict = view[start - WINDOW_SIZE:start] if start > 0 else None
+            last = start + CHUNK_SIZE >= self.size
+            self.chunks.append(pool.submit(deflate, view[start:start + CHUNK_SIZE], level, zdict, last))
+
+    def ready(self) -> bool:
+        return not self.parallel or all(future.done() for future in [self.crc] + self.chunks)
+
+    def result(self) -> (int, list[bytes]):
+        if not self.parallel:
+            return self.crc, self.chunks
+        return self.crc.result(), [future.result() for future in self.chunks]
+
+# Interface of python-docx's PhysPkgWriter
+class ZipWriter:
+    def __init__(self, filepath: str, compression: str = DEFAULT):
+        check_compression(compression)
+        self.compression = compression
+        level = LEVELS[compression]
+        if level is None:
+            self.archive = zipfile.ZipFile(filepath, "w", compression = zipfile.ZIP_STORED)
+        else:
+            self.archive = zipfile.ZipFile(filepath, "w", compression = zipfile.ZIP_DEFLATED, compresslevel = level)
+        self.raw = RAW_WRITE and has_raw_write(self.archive)
+        self.pending: deque[Entry] = deque()
+
+    def write(self, pack_uri, blob: bytes):
+        self.add(pack_uri.membername, blob)
+
+    def add(self, name: str, blob: bytes):
+        level = part_level(name, self.compression)
+        if not self.raw:
+            compress_type = zipfile.ZIP_STORED if level is None else zipfile.ZIP_DEFLATED
+            self.archive.writestr(zip_info(name, compress_type), blob, compresslevel = level)
+            return
+        self.pending.append(Entry(name, blob, level))
+        while len(self.pending) != 0 and (self.pending[0].ready() or len(self.pending) > MAX_PENDING):
+            self.write_entry(self.pending.popleft())
+
+    # Stream of a part written by parts, deflated as the archive is.
+    # Parts added before are written first
+    def open(self, name: str):
+        self.flush()
+        return self.archive.open(name, "w", force_zip64 = True)
+
+    def flush(self):
+        while len(self.pending) != 0:
+            self.write_entry(self.pending.popleft())
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.archive.close()
+
+    # Writes deflated data as ZipFile.writestr would write the part
+    def write_entry(self, entry: Entry):
+        crc, chunks = entry.result()
+        archive = self.archive
+        zinfo = zip_info(entry.name, entry.compress_type)
+        zinfo.file_size = entry.size
+        zinfo.compress_size = sum(len(chunk) for chunk in chunks)
+        zinfo.CRC = crc
+
+        archive.fp.seek(archive.start_dir)
+        zinfo.header_offset = archive.fp.tell()
+        archive._writecheck(zinfo)
+        archive._didModify = True
+        archive.fp.write(zinfo.FileHeader())
+        for chunk in chunks:
+            archive.fp.write(chunk)
+        archive.filelist.append(zinfo)
+        archive.NameToInfo[zinfo.filename] = zinfo
+        archive.start_dir = archive.fp.tell()
+
+# Writes the package of doc as python-docx's Document.save does
+def save(doc, filepath: str, compression: str = DEFAULT):
+    from docx.opc.pkgwriter import PackageWriter
+    package = doc.part.package
+    parts = package.parts
+    for part in parts:
+        part.before_marshal()
+    writer = ZipWriter(filepath, compression)
+    try:
+        PackageWriter._write_content_types_stream(writer, parts)
+        PackageWriter._write_pkg_rels(writer, package.rels)
+        PackageWriter._write_parts(writer, parts)
+    finally:
+        writer.close()
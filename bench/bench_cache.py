@@ -0,0 +1,67 @@
+'''
+Benchmark of incremental rendering (GdocxCache).
+
+Converts a synthetic source without cache, with empty cache, then again
+after an edit of one block in the middle, and checks that the output of
+the last run is the same as the output of a conversion without cache.
+
+Usage:
+    python3 bench/bench_cache.py -b 200
+'''
+
+import os
+import sys
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import main
+import GdocxStyle
+import GdocxCache
+from gen_source import add_mix_args, mix_from_args, generate
+from common import convert, read_parts
+
+def edit_middle_block(source_path: str, blocks: int):
+    with open(source_path, "r") as file:
+        text = file.read()
+    marker = f"Block {blocks // 2} "
+    text = text.replace(marker, marker + "edited ", 1)
+    with open(source_path, "w") as file:
+        file.write(text)
+
+if __name__ == "__main__":
+    prs = argparse.ArgumentParser(prog = "bench_cache", description = "Benchmarks incremental rendering")
+    add_mix_args(prs)
+    prs.add_argument('--workdir', help="Directory for source, outputs and cache, temporary if not given", type=str)
+    args = prs.parse_args()
+
+    workdir = args.workdir
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix = "gdocx_cache_bench_")
+    workdir = os.path.abspath(workdir)
+    mix = mix_from_args(args)
+    source_path = generate(workdir, mix)
+
+    main.init_gostdocx(strip_indent = True, skip_empty = True)
+    GdocxStyle.init_default_styles(os.path.join(ROOT_DIR, main.PATH_DEFAULT_STYLES))
+    cache = GdocxCache.FragmentCache(os.path.join(workdir, "cache"))
+
+    plain, _ = convert(source_path, os.path.join(workdir, "plain.docx"))
+    cold, cold_ctx = convert(source_path, os.path.join(workdir, "cold.docx"), cache = cache)
+    edit_middle_block(source_path, mix.blocks)
+    warm, warm_ctx = convert(source_path, os.path.join(workdir, "warm.docx"), cache = cache)
+    edited, _ = convert(source_path, os.path.join(workdir, "edited.docx"))
+
+    print(f"source: {mix.blocks} blocks in '{workdir}'")
+    print(f"{'no cache':<24}{plain * 1e3:>10.1f} ms")
+    print(f"{'empty cache':<24}{cold * 1e3:>10.1f} ms  {GdocxCache.format_stats(cold_ctx.cache_stats)}")
+    print(f"{'one block edited':<24}{warm * 1e3:>10.1f} ms  {GdocxCache.format_stats(warm_ctx.cache_stats)}")
+
+    if read_parts(os.path.join(workdir, "warm.docx")) != read_parts(os.path.join(workdir, "edited.docx")):
+        print("FAIL: output with cache differs from output without it")
+        exit(1)
+    print("OK: output with cache is the same as without it")
@@ -0,0 +1,102 @@
+'''
+Benchmark of writing the output archive (GdocxZip).
+
+Generates a source with many distinct PNG images and converts it, then saves
+the resulting document with python-docx's Document.save and with GdocxZip at
+every level of compression, reporting median time and size of the archive.
+The default level is also saved with RAW_WRITE off, as when ZipFile doesn't
+have the internals GdocxZip writes deflated parts with (writestr fallback).
+Checks that all archives have the same parts.
+
+Usage:
+    python3 bench/bench_compression.py -b 100 --distinct-images 20 --image-size 800 -n 3
+'''
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import main
+import GdocxZip
+import GdocxStyle
+from docx import Document
+from gen_source import add_mix_args, mix_from_args, generate, gen_png
+from common import convert, read_parts
+
+# Adds distinct images to the source, so that the package has many media parts
+def add_images(source_path: str, count: int, size: int):
+    workdir = os.path.dirname(source_path)
+    lines = []
+    for i in range(count):
+        name = f"distinct{i}.png"
+        with open(os.path.join(workdir, name), "wb") as file:
+            file.write(gen_png(size + i))
+        lines.append(f"(image {name} 8)")
+    with open(source_path, "a") as file:
+        file.write('\n'.join(lines) + '\n')
+
+# GdocxZip.save through ZipFile.writestr
+def save_writestr(doc, path: str, compression: str):
+    GdocxZip.RAW_WRITE = False
+    try:
+        GdocxZip.save(doc, path, compression)
+    finally:
+        GdocxZip.RAW_WRITE = True
+
+def timed_save(save, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        save()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+if __name__ == "__main__":
+    prs = argparse.ArgumentParser(prog = "bench_compression", description = "Benchmarks writing the output archive")
+    add_mix_args(prs)
+    prs.add_argument('--distinct-images', help="Distinct images added to the source", type=int, default=20)
+    prs.add_argument('-n', '--runs', help="Saves of every kind", type=int, default=3)
+    prs.add_argument('--workdir', help="Directory for source and outputs, temporary if not given", type=str)
+    prs.set_defaults(blocks = 100, image_size = 800)
+    args = prs.parse_args()
+
+    workdir = args.workdir
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix = "gdocx_compression_bench_")
+    workdir = os.path.abspath(workdir)
+    source_path = generate(workdir, mix_from_args(args))
+    add_images(source_path, args.distinct_images, args.image_size)
+
+    main.init_gostdocx(strip_indent = True, skip_empty = True, image_dpi = 0)
+    GdocxStyle.init_default_styles(os.path.join(ROOT_DIR, main.PATH_DEFAULT_STYLES))
+    converted_path = os.path.join(workdir, "converted.docx")
+    convert(source_path, converted_path)
+    doc = Document(converted_path)
+
+    saves = [("python-docx", lambda path: doc.save(path))]
+    for compression in GdocxZip.LEVELS:
+        saves.append((compression, lambda path, compression = compression: GdocxZip.save(doc, path, compression)))
+    saves.append(("writestr", lambda path: save_writestr(doc, path, GdocxZip.DEFAULT)))
+
+    print(f"'{source_path}', {GdocxZip.COMPRESS_WORKERS} workers, median of {args.runs}")
+    print(f"{'save':<14}{'seconds':>10}{'MB':>10}")
+    outputs = []
+    for name, save in saves:
+        out_path = os.path.join(workdir, f"{name}.docx")
+        seconds = timed_save(lambda: save(out_path), args.runs)
+        print(f"{name:<14}{seconds:>10.3f}{os.path.getsize(out_path) / 1024 / 1024:>10.2f}")
+        outputs.append(out_path)
+
+    expected = read_parts(outputs[0])
+    if any(read_parts(path) != expected for path in outputs[1:]):
+        print("FAIL: parts of archives differ")
+        exit(1)
+    print("OK: parts of archives are the same")
@@ -0,0 +1,90 @@
+'''
+Benchmark of creation of blank documents with default styles (GdocxDocPool).
+
+Compares Document() with use_default_styles, a copy of the pool's template
+and taking a document from a pool filled in advance. Checks that all of
+them are saved into the same parts. Time of a bare Document(), without
+default styles, is printed for reference.
+
+With --append, also compares Document(PATH) with a copy from the cache of
+appended documents (GdocxDocPool.open_document).
+
+Usage:
+    python3 bench/bench_docpool.py -n 50 --append title.docx
+'''
+
+import io
+import os
+import sys
+import time
+import argparse
+from docx import Document
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import main
+import GdocxStyle
+import GdocxDocPool
+from common import read_parts
+
+def from_template() -> Document:
+    doc = Document()
+    GdocxStyle.use_default_styles(doc)
+    return doc
+
+def timed(count: int, create) -> (float, Document):
+    total = 0.0
+    for _ in range(count):
+        start = time.perf_counter()
+        doc = create()
+        total += time.perf_counter() - start
+    return total / count, doc
+
+def parts(doc: Document) -> dict[str, bytes]:
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return read_parts(buffer)
+
+if __name__ == "__main__":
+    prs = argparse.ArgumentParser(prog = "bench_docpool", description = "Benchmarks creation of blank documents")
+    prs.add_argument('-n', '--count', help="Number of documents per case", type=int, default=50)
+    prs.add_argument('--append', help="Document to be appended by doc macro", type=str)
+    args = prs.parse_args()
+
+    GdocxStyle.init_default_styles(os.path.join(ROOT_DIR, main.PATH_DEFAULT_STYLES))
+    pool = GdocxDocPool.pool_for()
+
+    bare, _ = timed(args.count, Document)
+    plain, expected = timed(args.count, from_template)
+    copied, from_copy = timed(args.count, pool.clone)
+
+    # pool is full, as after idle time of the daemon
+    pool.size = args.count
+    pool.fill()
+    taken, from_pool = timed(args.count, pool.get)
+
+    print(f"{args.count} documents per case")
+    print(f"{'Document()':<24}{bare * 1e3:>10.3f} ms")
+    print(f"{'Document() + styles':<24}{plain * 1e3:>10.3f} ms")
+    print(f"{'copy of template':<24}{copied * 1e3:>10.3f} ms")
+    print(f"{'filled pool':<24}{taken * 1e3:>10.3f} ms")
+
+    if parts(from_copy) != parts(expected) or parts(from_pool) != parts(expected):
+        print("FAIL: documents from the pool differ from new ones")
+        exit(1)
+    print("OK: documents from the pool are the same as new ones")
+
+    if args.append is not None:
+        path = os.path.abspath(args.append)
+        parsed, expected = timed(args.count, lambda: Document(path))
+        GdocxDocPool.open_document(path)
+        cached, from_cache = timed(args.count, lambda: GdocxDocPool.open_document(path))
+        print(f"{'Document(append)':<24}{parsed * 1e3:>10.3f} ms")
+        print(f"{'cached append':<24}{cached * 1e3:>10.3f} ms")
+        if parts(from_cache) != parts(expected):
+            print("FAIL: cached appended document differs from parsed one")
+            exit(1)
+        print("OK: cached appended document is the same as parsed one")
@@ -0,0 +1,95 @@
+'''
+Benchmark of main.process_with_current_handler on macro-dense sources
+against the previous recursive driver (kept below as reference).
+
+Sources consist of unordered-list macros nested DEPTH levels deep, whose
+handlers do nothing, so the driver itself is measured. The recursive driver
+fails when DEPTH is close to the recursion limit.
+
+Usage:
+    python3 bench/bench_driver.py -d 50 -n 2000
+    python3 bench/bench_driver.py -d 5000 -n 1
+'''
+
+import os
+import sys
+import time
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from docx import Document
+import main
+import GdocxParsing
+from GdocxState import GdocxState
+
+def recursive_driver(tokens, state: GdocxState):
+    if state.reached_macro_end:
+        state.handler.finalize()
+        state.reached_macro_end = False
+        return
+
+    item = next(tokens, None)
+    while(item is not None):
+        new_handler = state.handle_or_get_new_handler(*item)
+
+        if new_handler is not None:
+            old_handler = state.handler
+            state.handler = new_handler
+
+            if old_handler.NAME == GdocxState.NAME:
+                state.finalize()
+
+            state.indent += 1
+            recursive_driver(tokens, state)
+
+            state.indent -= 1
+            state.handler = old_handler
+
+            if state.reached_page_macro:
+                return
+
+        if state.reached_macro_end:
+            state.handler.finalize()
+            state.reached_macro_end = False
+            return
+
+        item = next(tokens, None)
+
+def gen_nested(depth: int, count: int) -> str:
+    lines = []
+    for _ in range(count):
+        lines += ["(unordered-list"] * depth
+        lines += [")"] * depth
+        lines.append("(unordered-list)")
+    return '\n'.join(lines) + '\n'
+
+def run(driver, text: str, doc: Document) -> float:
+    tokens = GdocxParsing.tokenize(text)
+    state = GdocxState(doc, main.registered_macro_handlers)
+
+    start = time.perf_counter()
+    driver(tokens, state)
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    prs = argparse.ArgumentParser(prog = "bench_driver", description = "Benchmarks driver on nested macros")
+    prs.add_argument('-d', '--depth', help="Nesting depth", type=int, default=50)
+    prs.add_argument('-n', '--count', help="Number of nested groups", type=int, default=2000)
+    prs.add_argument('-r', '--repeat', help="Report the fastest of N runs", type=int, default=3)
+    args = prs.parse_args()
+
+    GdocxParsing.INDENT_STRING = "    "
+    text = gen_nested(args.depth, args.count)
+    macros = args.count * (args.depth * 2 + 1)
+    doc = Document()
+
+    print(f"source: {macros} macro lines, depth {args.depth}")
+    for name, driver in [("recursive", recursive_driver), ("stack", main.process_with_current_handler)]:
+        try:
+            best = min(run(driver, text, doc) for _ in range(args.repeat))
+        except RecursionError:
+            print(f"{name:<12} RecursionError")
+            continue
+        print(f"{name:<12}{best * 1e3:>10.2f} ms{macros / best:>14.0f} macros/s")
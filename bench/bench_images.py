@@ -0,0 +1,73 @@
+'''
+Benchmark of downscaling of images (GdocxImage).
+
+Generates a source with large images shown at 8 cm and converts it with
+images kept as they are (--image-dpi 0), downscaled with an empty cache
+and downscaled again with the cache filled by the previous run. Reports
+time, size of the output and bytes saved. Checks that sizes of images in
+the document don't change.
+
+Needs Pillow, without it images are kept as they are.
+
+Usage:
+    python3 bench/bench_images.py -b 10 --image-size 1200 --dpi 150
+'''
+
+import os
+import re
+import sys
+import zipfile
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import main
+import GdocxStyle
+import GdocxImage
+from gen_source import add_mix_args, mix_from_args, generate
+from common import convert
+
+EXTENT_PATTERN = re.compile(rb'<wp:extent [^>]*>')
+
+def extents(path: str) -> list[bytes]:
+    with zipfile.ZipFile(path) as archive:
+        return EXTENT_PATTERN.findall(archive.read("word/document.xml"))
+
+if __name__ == "__main__":
+    prs = argparse.ArgumentParser(prog = "bench_images", description = "Benchmarks downscaling of images")
+    add_mix_args(prs)
+    prs.add_argument('--dpi', help="Pixels per inch to downscale to", type=int, default=300)
+    prs.add_argument('--workdir', help="Directory for source, outputs and cache, temporary if not given", type=str)
+    prs.set_defaults(blocks = 10, image_size = 1200, plain_lines = 5)
+    args = prs.parse_args()
+
+    workdir = args.workdir
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix = "gdocx_images_bench_")
+    workdir = os.path.abspath(workdir)
+    source_path = generate(workdir, mix_from_args(args))
+
+    main.init_gostdocx(strip_indent = True, skip_empty = True, image_cache = os.path.join(workdir, "cache"))
+    GdocxStyle.init_default_styles(os.path.join(ROOT_DIR, main.PATH_DEFAULT_STYLES))
+    if not GdocxImage.PILLOW_INSTALLED:
+        print("Pillow isn't installed, images are kept as they are")
+
+    runs = [("kept", 0), ("downscaled", args.dpi), ("cached", args.dpi)]
+    outputs = []
+    print(f"{'images':<12}{'seconds':>10}{'output MB':>12}{'saved MB':>10}")
+    for name, dpi in runs:
+        out_path = os.path.join(workdir, f"{name}.docx")
+        seconds, ctx = convert(source_path, out_path, image_dpi = dpi)
+        stats = ctx.image_stats
+        saved = (stats["bytes_in"] - stats["bytes_out"]) / 1024 / 1024
+        print(f"{name:<12}{seconds:>10.2f}{os.path.getsize(out_path) / 1024 / 1024:>12.2f}{saved:>10.2f}")
+        outputs.append(out_path)
+
+    if any(extents(path) != extents(outputs[0]) for path in outputs[1:]):
+        print("FAIL: sizes of images in the document differ")
+        exit(1)
+    print("OK: sizes of images in the document are the same")
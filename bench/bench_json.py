@@ -0,0 +1,102 @@
+'''
+Benchmark of data sources of json-reader macros (GdocxData).
+
+Generates a large json file and a JSON Lines file with the same number of
+records, then compares:
+    1. parsing the json file for every json-reader macro, as before, with
+        taking it from GdocxData for every macro of a conversion;
+    2. parsing the whole JSON Lines file with reading one record through
+        the index, cold (index is built) and warm.
+Checks that the same values are read.
+
+Usage:
+    python3 bench/bench_json.py --records 50000 --readers 40
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import GdocxData
+from GdocxContext import GdocxContext
+
+def gen_record(index: int) -> dict[str, object]:
+    return {
+        "id": index,
+        "name": f"Record {index}",
+        "authors": [{"name": f"Author {index}.{i}", "role": "editor"} for i in range(3)],
+        "tags": [f"tag{index % 17}", f"tag{index % 31}"],
+    }
+
+def generate(workdir: str, records: int) -> (str, str):
+    json_path = os.path.join(workdir, "data.json")
+    with open(json_path, "w") as file:
+        json.dump({"project": {"title": "Benchmark"}, "records": [gen_record(i) for i in range(records)]}, file)
+    jsonl_path = os.path.join(workdir, "data.jsonl")
+    with open(jsonl_path, "w") as file:
+        for i in range(records):
+            file.write(json.dumps(gen_record(i)) + "\n")
+    return json_path, jsonl_path
+
+def timed(function) -> (float, object):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+def parse_every_time(path: str, readers: int) -> list[object]:
+    values = []
+    for _ in range(readers):
+        with open(path, "r") as file:
+            data = json.loads(file.read())
+        values.append(data["records"][readers]["authors"][1]["name"])
+    return values
+
+def read_cached(path: str, readers: int, field: str) -> list[object]:
+    ctx = GdocxContext()
+    return [GdocxData.get_field(GdocxData.read(ctx, path), field) for _ in range(readers)]
+
+def parse_all_lines(path: str, record: int) -> object:
+    with open(path, "r") as file:
+        return [json.loads(line) for line in file][record]
+
+if __name__ == "__main__":
+    prs = argparse.ArgumentParser(prog = "bench_json", description = "Benchmarks data sources of json-reader macros")
+    prs.add_argument('--records', help="Records in generated files", type=int, default=50000)
+    prs.add_argument('--readers', help="json-reader macros of one conversion", type=int, default=40)
+    prs.add_argument('--workdir', help="Directory for generated files, temporary if not given", type=str)
+    args = prs.parse_args()
+
+    workdir = args.workdir
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix = "gdocx_json_bench_")
+    json_path, jsonl_path = generate(os.path.abspath(workdir), args.records)
+    record = args.records // 2
+    field = f"records.{args.readers}.authors.1.name"
+
+    print(f"'{json_path}': {os.path.getsize(json_path) / 1024 / 1024:.1f} MB, {args.readers} json-reader macros")
+    before, expected = timed(lambda: parse_every_time(json_path, args.readers))
+    cold, values = timed(lambda: read_cached(json_path, args.readers, field))
+    warm, _ = timed(lambda: read_cached(json_path, args.readers, field))
+    print(f"{'parse every time':<28}{before * 1000:>10.1f} ms")
+    print(f"{'GdocxData, new process':<28}{cold * 1000:>10.1f} ms")
+    print(f"{'GdocxData, next conversion':<28}{warm * 1000:>10.1f} ms")
+
+    print(f"'{jsonl_path}': record {record}")
+    whole, expected_record = timed(lambda: parse_all_lines(jsonl_path, record))
+    indexed, record_value = timed(lambda: GdocxData.load(jsonl_path, record))
+    again, _ = timed(lambda: GdocxData.load(jsonl_path, record))
+    print(f"{'parse all lines':<28}{whole * 1000:>10.1f} ms")
+    print(f"{'index and read record':<28}{indexed * 1000:>10.1f} ms")
+    print(f"{'read record':<28}{again * 1000:>10.1f} ms")
+
+    if values != expected or record_value != expected_record:
+        print("FAIL: GdocxData read different values")
+        exit(1)
+    print("OK: GdocxData read the same values")
@@ -0,0 +1,90 @@
+'''
+Benchmark of merge of segments (GdocxMerge) against docxcompose's Composer.
+
+Generates a source where a doc macro follows every block, renders its
+segments once and merges copies of them with Composer only and with
+GdocxMerge.Merger. The appended .docx is either made from the same template
+as segments (--styled-append, then everything is merged natively) or by
+plain Document() (then it goes through Composer). Checks that both merges
+give the same parts.
+
+Usage:
+    python3 bench/bench_merge.py -b 25 --plain-lines 5 --styled-append
+'''
+
+import io
+import os
+import sys
+import copy
+import time
+import argparse
+import tempfile
+from contextlib import redirect_stdout
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import main
+import GdocxStyle
+import GdocxMerge
+import GdocxParsing
+import GdocxDocPool
+from gen_source import APPEND_DOC_NAME, IMAGE_NAME, add_mix_args, mix_from_args, generate
+from common import read_parts
+
+def render_segments(source_path: str) -> list:
+    ctx = main.create_context(cwd = os.path.dirname(source_path))
+    with open(source_path, "r") as file:
+        tokens = GdocxParsing.tokenize(file.read(), ctx.indent_string)
+    with redirect_stdout(io.StringIO()):
+        docs = main.process_segments(ctx, lambda state: main.process_with_current_handler(tokens, state))
+    main.add_footer_with_page_number(docs[0])
+    return docs
+
+def merge(docs: list, native: bool, out_path: str) -> (float, dict[str, int]):
+    docs = [copy.deepcopy(doc) for doc in docs]
+    start = time.perf_counter()
+    merger = GdocxMerge.Merger(docs[0], native)
+    for doc in docs[1:]:
+        merger.append(doc)
+    merger.save(out_path)
+    return time.perf_counter() - start, merger.stats
+
+if __name__ == "__main__":
+    prs = argparse.ArgumentParser(prog = "bench_merge", description = "Benchmarks merge of segments")
+    add_mix_args(prs)
+    prs.add_argument('--styled-append', help="Make appended .docx from the template of segments", action="store_true")
+    prs.add_argument('--workdir', help="Directory for source and outputs, temporary if not given", type=str)
+    prs.set_defaults(doc_every = 1)
+    args = prs.parse_args()
+
+    workdir = args.workdir
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix = "gdocx_merge_bench_")
+    workdir = os.path.abspath(workdir)
+    source_path = generate(workdir, mix_from_args(args))
+
+    main.init_gostdocx(strip_indent = True, skip_empty = True)
+    GdocxStyle.init_default_styles(os.path.join(ROOT_DIR, main.PATH_DEFAULT_STYLES))
+    if args.styled_append:
+        doc = GdocxDocPool.new_document()
+        doc.add_paragraph("Appended document")
+        doc.add_picture(os.path.join(workdir, IMAGE_NAME))
+        doc.save(os.path.join(workdir, APPEND_DOC_NAME))
+
+    docs = render_segments(source_path)
+    composer_path = os.path.join(workdir, "composer.docx")
+    merger_path = os.path.join(workdir, "merger.docx")
+    composer, _ = merge(docs, False, composer_path)
+    merger, stats = merge(docs, True, merger_path)
+
+    print(f"{len(docs)} documents in '{workdir}'")
+    print(f"{'Composer':<24}{composer:>10.2f} s")
+    print(f"{'Merger':<24}{merger:>10.2f} s  {stats['native']} native, {stats['composer']} with Composer")
+
+    if read_parts(composer_path) != read_parts(merger_path):
+        print("FAIL: output of Merger differs from output of Composer")
+        exit(1)
+    print("OK: output of Merger is the same as output of Composer")
@@ -0,0 +1,188 @@
+'''
+End-to-end benchmark of main.process_txt on a synthetic source.
+
+Reports wall time, lines/sec and peak RSS for each stage:
+    parse            GdocxState.handle_or_get_new_handler (reading, macro
+                     dispatch, handler constructors and process_line)
+    finalize         finalize() of every handler and of GdocxState
+    default-styles   GdocxDocPool.new_document (blank document with
+                     default styles)
+    compose          GdocxMerge.Merger.append (natively or with Composer)
+    save             GdocxMerge.Merger.save
+    other            everything else inside process_txt
+
+Stage times are exclusive: time spent in a nested stage (e.g. finalize called
+from a handler constructor) is not counted twice.
+
+Usage:
+    python3 bench/bench_pipeline.py -b 200 --doc-every 20
+    python3 bench/bench_pipeline.py -b 200 --json baseline.json
+'''
+
+import os
+import sys
+import json
+import time
+import resource
+import tempfile
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import gen_source
+import main
+import GdocxState
+import GdocxStyle
+import GdocxDocPool
+import GdocxMerge
+
+STAGE_PARSE = "parse"
+STAGE_FINALIZE = "finalize"
+STAGE_DEFAULT_STYLES = "default-styles"
+STAGE_COMPOSE = "compose"
+STAGE_SAVE = "save"
+STAGE_OTHER = "other"
+STAGE_TOTAL = "total"
+
+STAGES = [STAGE_PARSE, STAGE_FINALIZE, STAGE_DEFAULT_STYLES, STAGE_COMPOSE, STAGE_SAVE, STAGE_OTHER]
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class StageTimer:
+    def __init__(self):
+        self.seconds = {name: 0.0 for name in STAGES}
+        self.calls = {name: 0 for name in STAGES}
+        self.peak_rss = {name: 0.0 for name in STAGES}
+        # stack of [stage_name, start, time_spent_in_children]
+        self.stack = []
+
+    def enter(self, name: str):
+        self.stack.append([name, time.perf_counter(), 0.0])
+
+    def exit(self):
+        name, start, children = self.stack.pop()
+        elapsed = time.perf_counter() - start
+        self.seconds[name] += elapsed - children
+        self.calls[name] += 1
+        self.peak_rss[name] = max(self.peak_rss[name], peak_rss_mb())
+        if len(self.stack) != 0:
+            self.stack[-1][2] += elapsed
+
+    def wrap(self, name: str, func):
+        timer = self
+        def wrapped(*args, **kwargs):
+            timer.enter(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timer.exit()
+        return wrapped
+
+# Replaces attributes with timed wrappers, remembers originals to restore them
+class Patcher:
+    def __init__(self, timer: StageTimer):
+        self.timer = timer
+        self.patched = []
+
+    def patch(self, owner, attr: str, stage: str):
+        original = owner.__dict__[attr]
+        self.patched.append((owner, attr, original))
+        setattr(owner, attr, self.timer.wrap(stage, original))
+
+    def restore(self):
+        for owner, attr, original in reversed(self.patched):
+            setattr(owner, attr, original)
+        self.patched = []
+
+def instrument(timer: StageTimer) -> Patcher:
+    patcher = Patcher(timer)
+    patcher.patch(GdocxState.GdocxState, 'handle_or_get_new_handler', STAGE_PARSE)
+    patcher.patch(GdocxState.GdocxState, 'finalize', STAGE_FINALIZE)
+
+    handlers = GdocxState.default_handlers + main.registered_macro_handlers
+    for handler in handlers:
+        if 'finalize' in handler.__dict__:
+            patcher.patch(handler, 'finalize', STAGE_FINALIZE)
+
+    patcher.patch(GdocxDocPool, 'new_document', STAGE_DEFAULT_STYLES)
+    patcher.patch(GdocxMerge.Merger, 'append', STAGE_COMPOSE)
+    patcher.patch(GdocxMerge.Merger, 'save', STAGE_SAVE)
+    return patcher
+
+def count_lines(path: str) -> int:
+    with open(path, "r") as file:
+        return sum(1 for _ in file)
+
+def run_once(source_path: str, out_path: str) -> dict[str, object]:
+    timer = StageTimer()
+    patcher = instrument(timer)
+    try:
+        start = time.perf_counter()
+        main.process_txt(source_path, out_path)
+        total = time.perf_counter() - start
+    finally:
+        patcher.restore()
+
+    timer.seconds[STAGE_OTHER] = max(total - sum(timer.seconds.values()), 0.0)
+    timer.peak_rss[STAGE_OTHER] = peak_rss_mb()
+
+    return {
+        STAGE_TOTAL: total,
+        "seconds": timer.seconds,
+        "calls": timer.calls,
+        "peak_rss_mb": timer.peak_rss,
+    }
+
+def report(result: dict[str, object], lines: int):
+    total = result[STAGE_TOTAL]
+    print(f"{'stage':<16}{'seconds':>10}{'share':>8}{'lines/s':>14}{'calls':>10}{'peak MB':>10}")
+    for name in STAGES:
+        seconds = result["seconds"][name]
+        share = seconds / total * 100 if total > 0 else 0
+        lps = lines / seconds if seconds > 0 else float('inf')
+        print(f"{name:<16}{seconds:>10.3f}{share:>7.1f}%{lps:>14.0f}"
+            f"{result['calls'][name]:>10}{result['peak_rss_mb'][name]:>10.1f}")
+    print(f"{STAGE_TOTAL:<16}{total:>10.3f}{100:>7.1f}%{lines / total:>14.0f}{'':>10}{peak_rss_mb():>10.1f}")
+
+if __name__ == "__main__":
+    prs = argparse.ArgumentParser(prog = "bench_pipeline", description = "Benchmarks main.process_txt per stage")
+    gen_source.add_mix_args(prs)
+    prs.add_argument('-r', '--repeat', help="Run N times and report the fastest run", type=int, default=1)
+    prs.add_argument('-w', '--workdir', help="Directory for generated files, temporary if not set", type=str)
+    prs.add_argument('--json', help="Also write results into this .json file", type=str)
+    args = prs.parse_args()
+
+    workdir = args.workdir
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix = "gostdocx-bench-")
+    workdir = os.path.abspath(workdir)
+    json_path = os.path.abspath(args.json) if args.json is not None else None
+
+    mix = gen_source.mix_from_args(args)
+    source_path = gen_source.generate(workdir, mix)
+    out_path = os.path.join(workdir, "out.docx")
+    lines = count_lines(source_path)
+
+    main.init_gostdocx(strip_indent = True, skip_empty = True)
+    GdocxStyle.init_default_styles(os.path.join(os.path.dirname(BENCH_DIR), main.PATH_DEFAULT_STYLES))
+    # relative paths in the source are resolved against cwd
+    os.chdir(workdir)
+
+    best = None
+    for _ in range(args.repeat):
+        result = run_once(source_path, out_path)
+        if best is None or result[STAGE_TOTAL] < best[STAGE_TOTAL]:
+            best = result
+
+    print(f"source: {source_path}, {lines} lines, {mix.blocks} blocks")
+    report(best, lines)
+
+    if json_path is not None:
+        best["lines"] = lines
+        best["mix"] = vars(mix)
+        with open(json_path, "w") as file:
+            json.dump(best, file, indent = 4)
+        print(f"'{json_path}' created")
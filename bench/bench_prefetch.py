@@ -0,0 +1,81 @@
+'''
+Benchmark of loading files of macros ahead of rendering (GdocxPrefetch).
+
+Generates a source with images, json-reader and doc macros and converts it
+with and without prefetch. Slow storage (e.g. a network mount) is simulated
+by a delay of every opening of a file in the generated directory, so the
+difference shows how much of the build is spent waiting for files. Checks
+that both outputs have the same parts.
+
+Usage:
+    python3 bench/bench_prefetch.py -b 20 --doc-every 5 --latency 20
+'''
+
+import io
+import os
+import sys
+import time
+import argparse
+import builtins
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import main
+import GdocxStyle
+import GdocxDocPool
+from gen_source import add_mix_args, mix_from_args, generate
+import common
+from common import read_parts
+
+# Makes every opening of a file under dirpath wait for latency seconds
+def slow_open(dirpath: str, latency: float):
+    real_open = builtins.open
+    def open_with_latency(file, *args, **kwargs):
+        if isinstance(file, str) and os.path.abspath(file).startswith(dirpath):
+            time.sleep(latency)
+        return real_open(file, *args, **kwargs)
+    builtins.open = open_with_latency
+    # zipfile opens files through io.open
+    io.open = open_with_latency
+
+def convert(source_path: str, out_path: str, prefetch: bool) -> float:
+    # documents of doc macros are read again, as in a new process
+    GdocxDocPool.AppendedDocs.clear()
+    return common.convert(source_path, out_path, prefetch = prefetch)[0]
+
+if __name__ == "__main__":
+    prs = argparse.ArgumentParser(prog = "bench_prefetch", description = "Benchmarks loading files of macros ahead of rendering")
+    add_mix_args(prs)
+    prs.add_argument('--latency', help="Milliseconds every opening of a file waits", type=float, default=20.0)
+    prs.add_argument('--workdir', help="Directory for source and outputs, temporary if not given", type=str)
+    prs.set_defaults(blocks = 20, doc_every = 5, plain_lines = 5)
+    args = prs.parse_args()
+
+    workdir = args.workdir
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix = "gdocx_prefetch_bench_")
+    workdir = os.path.abspath(workdir)
+    source_path = generate(workdir, mix_from_args(args))
+
+    main.init_gostdocx(strip_indent = True, skip_empty = True)
+    GdocxStyle.init_default_styles(os.path.join(ROOT_DIR, main.PATH_DEFAULT_STYLES))
+    source_dir = os.path.join(workdir, "")
+    slow_open(source_dir, args.latency / 1000)
+
+    without_path = os.path.join(workdir, "without.docx")
+    with_path = os.path.join(workdir, "with.docx")
+    without = convert(source_path, without_path, False)
+    with_prefetch = convert(source_path, with_path, True)
+
+    print(f"'{source_path}', {args.latency:.0f} ms per opened file")
+    print(f"{'without prefetch':<20}{without:>10.2f} s")
+    print(f"{'with prefetch':<20}{with_prefetch:>10.2f} s")
+
+    if read_parts(without_path) != read_parts(with_path):
+        print("FAIL: outputs with and without prefetch differ")
+        exit(1)
+    print("OK: outputs with and without prefetch are the same")
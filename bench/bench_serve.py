@@ -0,0 +1,179 @@
+'''
+Benchmark of the conversion daemon (GdocxServe) against cold runs of main.py.
+
+Starts the daemon in this process on a free localhost port, sends it
+REQUESTS zipped sources from CLIENTS threads and reports latency, then
+converts a few of the same sources with 'python3 main.py' in a subprocess.
+Afterwards floods a daemon with 1 worker and no queue to check that extra
+requests are rejected with 503, and /health counters, and checks that
+sources which use files out of their archive are rejected with 422, and
+archives with too many entries or too large extracted with 413.
+
+Usage:
+    python3 bench/bench_serve.py -b 5 -n 64 -c 8 -j 4
+'''
+
+import io
+import os
+import sys
+import json
+import time
+import zipfile
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import main
+import GdocxServe
+from gen_source import add_mix_args, mix_from_args, generate, IMAGE_NAME, JSON_NAME
+
+# Sources which reach out of the request's directory
+ESCAPING_SOURCES = {
+    "absolute path": "(image {path})\n",
+    "parent dir": "(json-reader ../{dir}/{json}\n)\n",
+    "chdir": "(chdir ..\n)\nText\n",
+}
+
+def zip_source(source: str) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr(GdocxServe.SOURCE_NAME, source)
+    return buffer.getvalue()
+
+def zip_dir(path: str) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name in os.listdir(path):
+            archive.write(os.path.join(path, name), name)
+    return buffer.getvalue()
+
+# Archives over GdocxServe limits: many entries, and entries which are
+# larger extracted than limit set by the benchmark
+def oversized_archives(max_bytes: int) -> dict[str, bytes]:
+    entries = io.BytesIO()
+    with zipfile.ZipFile(entries, "w") as archive:
+        for i in range(GdocxServe.MAX_ZIP_ENTRIES + 1):
+            archive.writestr(f"{i}.txt", "")
+    extracted = io.BytesIO()
+    with zipfile.ZipFile(extracted, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(GdocxServe.SOURCE_NAME, "Text\n")
+        archive.writestr("zeros.bin", bytes(max_bytes + 1))
+    return {"entries": entries.getvalue(), "extracted size": extracted.getvalue()}
+
+def start_server(workers: int, queue_size: int, timeout: float | None):
+    converter = GdocxServe.Converter(workers, queue_size, timeout)
+    server = GdocxServe.create_server("127.0.0.1:0", converter)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server
+
+def request(port: int, method: str, path: str, body: bytes | None = None) -> (int, bytes):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout = 600)
+    headers = {}
+    if body is not None:
+        headers["Content-Type"] = "application/zip"
+    conn.request(method, path, body, headers)
+    response = conn.getresponse()
+    result = (response.status, response.read())
+    conn.close()
+    return result
+
+def timed_convert(port: int, body: bytes) -> (int, float):
+    start = time.perf_counter()
+    status, data = request(port, "POST", "/convert", body)
+    if status == 200 and not data.startswith(b"PK"):
+        status = -1
+    return status, time.perf_counter() - start
+
+def percentile(values: list[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def cold_run(source_dir: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(ROOT_DIR, "main.py"),
+        "-i", "source.txt", "-o", "cold.docx", "-s", "-se"],
+        cwd = source_dir, check = True, stdout = subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    prs = argparse.ArgumentParser(prog = "bench_serve", description = "Benchmarks conversion daemon")
+    add_mix_args(prs)
+    prs.add_argument('-n', '--requests', help="Number of requests", type=int, default=64)
+    prs.add_argument('-c', '--clients', help="Number of concurrent clients", type=int, default=8)
+    prs.add_argument('-j', '--jobs', help="Number of worker threads of the daemon", type=int, default=4)
+    prs.add_argument('--cold', help="Number of cold runs of main.py", type=int, default=3)
+    args = prs.parse_args()
+
+    source_dir = tempfile.mkdtemp(prefix = "gdocx_serve_bench_")
+    generate(source_dir, mix_from_args(args))
+    body = zip_dir(source_dir)
+
+    # access log of every request
+    GdocxServe.RequestHandler.log_message = lambda *args: None
+    GdocxServe.init_server({"strip_indent": True, "skip_empty": True},
+        os.path.join(ROOT_DIR, main.PATH_DEFAULT_STYLES))
+    server = start_server(args.jobs, args.requests, None)
+    port = server.server_address[1]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.clients) as pool:
+        results = list(pool.map(lambda _: timed_convert(port, body), range(args.requests)))
+    total = time.perf_counter() - start
+    server.shutdown()
+
+    failed = [status for status, _ in results if status != 200]
+    latencies = [seconds for _, seconds in results]
+    print(f"daemon: {args.requests} requests, {args.clients} clients, {args.jobs} workers")
+    print(f"    {args.requests / total:8.2f} docs/s, latency p50 {percentile(latencies, 0.5) * 1e3:.1f} ms,"
+        f" p95 {percentile(latencies, 0.95) * 1e3:.1f} ms, failed {len(failed)}")
+
+    if args.cold > 0:
+        cold = [cold_run(source_dir) for _ in range(args.cold)]
+        print(f"cold main.py: {sum(cold) / len(cold) * 1e3:.1f} ms per doc")
+
+    # one worker, no queue: requests sent at once are mostly rejected
+    server = start_server(1, 0, None)
+    port = server.server_address[1]
+    with ThreadPoolExecutor(8) as pool:
+        statuses = [status for status, _ in pool.map(lambda _: timed_convert(port, body), range(8))]
+    _, health = request(port, "GET", "/health")
+    server.shutdown()
+    print(f"overload: statuses {sorted(statuses)}")
+    print(f"health: {json.loads(health)}")
+
+    server = start_server(1, len(ESCAPING_SOURCES), None)
+    port = server.server_address[1]
+    escaping = {}
+    for name, source in ESCAPING_SOURCES.items():
+        source = source.format(path = os.path.join(source_dir, IMAGE_NAME),
+            dir = os.path.basename(source_dir), json = JSON_NAME)
+        escaping[name], _ = request(port, "POST", "/convert", zip_source(source))
+    server.shutdown()
+    print(f"out of directory: statuses {escaping}")
+
+    max_bytes = 1024 * 1024
+    default_max_bytes = GdocxServe.MAX_EXTRACTED_BYTES
+    GdocxServe.MAX_EXTRACTED_BYTES = max_bytes
+    server = start_server(1, 2, None)
+    port = server.server_address[1]
+    oversized = {}
+    for name, body in oversized_archives(max_bytes).items():
+        oversized[name], _ = request(port, "POST", "/convert", body)
+    server.shutdown()
+    GdocxServe.MAX_EXTRACTED_BYTES = default_max_bytes
+    print(f"oversized archives: statuses {oversized}")
+
+    if len(failed) != 0 or 503 not in statuses or 200 not in statuses:
+        exit(1)
+    if any(status != 422 for status in escaping.values()):
+        exit(1)
+    if any(status != 413 for status in oversized.values()):
+        exit(1)
@@ -0,0 +1,97 @@
+'''
+Benchmark of startup of main.py.
+
+Runs main.py in new processes for invocations which don't render (--help,
+wrong arguments, --check) and for conversion of a short generated source,
+reporting median wall time of every one. Then runs each of them once with
+python -X importtime and prints the slowest top-level imports, so it's seen
+what a run waits for before it does anything.
+
+With --root, main.py of another checkout is measured, e.g. to compare
+with an older revision.
+
+Usage:
+    python3 bench/bench_startup.py -b 5 -n 10
+'''
+
+import os
+import sys
+import argparse
+import statistics
+import tempfile
+import subprocess
+import time
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from gen_source import add_mix_args, mix_from_args, generate
+
+IMPORT_TIME_PREFIX = "import time:"
+
+def invocations(source_path: str, out_path: str) -> list[tuple[str, list[str]]]:
+    return [
+        ("--help", ["--help"]),
+        ("wrong arguments", ["-i", source_path]),
+        ("--check", ["-i", source_path, "-c", "-s", "-se"]),
+        ("convert", ["-i", source_path, "-o", out_path, "-s", "-se"]),
+    ]
+
+def run(main_path: str, args: list[str], importtime: bool = False) -> (float, str):
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    start = time.perf_counter()
+    result = subprocess.run(command + [main_path] + args, capture_output = True, text = True)
+    return time.perf_counter() - start, result.stderr
+
+# Top-level imports with their cumulative microseconds, slowest first
+def top_imports(stderr: str) -> list[tuple[str, int]]:
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith(IMPORT_TIME_PREFIX):
+            continue
+        fields = line[len(IMPORT_TIME_PREFIX):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2]
+        # nested imports are indented
+        if name.startswith("  "):
+            continue
+        imports.append((name.strip(), int(fields[1])))
+    return sorted(imports, key = lambda item: item[1], reverse = True)
+
+if __name__ == "__main__":
+    prs = argparse.ArgumentParser(prog = "bench_startup", description = "Benchmarks startup of main.py")
+    add_mix_args(prs)
+    prs.add_argument('-n', '--runs', help="Runs of every invocation", type=int, default=10)
+    prs.add_argument('--top', help="Number of slowest imports to print", type=int, default=8)
+    prs.add_argument('--root', help="Checkout whose main.py is measured, this one by default", type=str, default=ROOT_DIR)
+    prs.add_argument('--workdir', help="Directory for source and output, temporary if not given", type=str)
+    prs.set_defaults(blocks = 5, doc_every = 0)
+    args = prs.parse_args()
+
+    workdir = args.workdir
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix = "gdocx_startup_bench_")
+    workdir = os.path.abspath(workdir)
+    source_path = generate(workdir, mix_from_args(args))
+    out_path = os.path.join(workdir, "out.docx")
+    main_path = os.path.join(os.path.abspath(args.root), "main.py")
+
+    baseline = statistics.median(run("-c", ["pass"])[0] for _ in range(args.runs))
+    print(f"'{main_path}', {args.runs} runs, median")
+    print(f"{'python -c pass':<20}{baseline * 1000:>10.1f} ms")
+
+    breakdowns = []
+    for name, main_args in invocations(source_path, out_path):
+        seconds = statistics.median(run(main_path, main_args)[0] for _ in range(args.runs))
+        print(f"{name:<20}{seconds * 1000:>10.1f} ms")
+        breakdowns.append((name, top_imports(run(main_path, main_args, importtime = True)[1])))
+
+    for name, imports in breakdowns:
+        total = sum(microseconds for _, microseconds in imports)
+        print(f"\nimports of {name}: {total / 1000:.1f} ms")
+        for module, microseconds in imports[:args.top]:
+            print(f"    {module:<32}{microseconds / 1000:>8.1f} ms")
@@ -0,0 +1,101 @@
+'''
+Benchmark of peak memory of streaming output (GdocxStream).
+
+Generates sources of growing length and converts each of them in a separate
+process, as usual and with --stream, reporting time and peak RSS. With
+--stream peak RSS should stay roughly the same as the source grows. Checks
+that both outputs have the same parts and that streamed document.xml is
+no larger than the usual one.
+
+Usage:
+    python3 bench/bench_stream.py -b 50 --sizes 1,4,16
+'''
+
+import os
+import sys
+import json
+import zipfile
+import argparse
+import resource
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from gen_source import add_mix_args, mix_from_args, generate
+from common import convert, read_parts
+
+DOCUMENT_PART = "word/document.xml"
+# streamed document.xml may be this much larger than the usual one,
+# e.g. flushed elements mustn't repeat namespace declarations
+DOCUMENT_SIZE_TOLERANCE = 1.01
+
+# Runs in a child process, prints JSON with seconds and peak RSS in MB
+def child(source_path: str, out_path: str, stream: bool):
+    import main
+    import GdocxStyle
+    main.init_gostdocx(strip_indent = True, skip_empty = True, stream = stream)
+    GdocxStyle.init_default_styles(os.path.join(ROOT_DIR, main.PATH_DEFAULT_STYLES))
+    seconds, _ = convert(source_path, out_path)
+    print(json.dumps({"seconds": seconds, "peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+
+def run(source_path: str, out_path: str, stream: bool) -> dict[str, float]:
+    args = [sys.executable, os.path.realpath(__file__), "--child", source_path, out_path]
+    if stream:
+        args.append("--stream")
+    result = subprocess.run(args, check = True, capture_output = True, text = True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+def document_size(path: str) -> int:
+    with zipfile.ZipFile(path) as archive:
+        return archive.getinfo(DOCUMENT_PART).file_size
+
+if __name__ == "__main__":
+    prs = argparse.ArgumentParser(prog = "bench_stream", description = "Benchmarks peak memory of streaming output")
+    add_mix_args(prs)
+    prs.add_argument('--sizes', help="Multipliers of the number of blocks", type=str, default="1,4,16")
+    prs.add_argument('--workdir', help="Directory for sources and outputs, temporary if not given", type=str)
+    prs.add_argument('--child', help=argparse.SUPPRESS, nargs=2)
+    prs.add_argument('--stream', help=argparse.SUPPRESS, action="store_true")
+    args = prs.parse_args()
+
+    if args.child is not None:
+        child(args.child[0], args.child[1], args.stream)
+        exit(0)
+
+    workdir = args.workdir
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix = "gdocx_stream_bench_")
+    workdir = os.path.abspath(workdir)
+    # doc macro isn't supported by --stream
+    args.doc_every = 0
+    blocks = args.blocks
+
+    print(f"{'blocks':>8}{'usual s':>10}{'usual MB':>10}{'stream s':>10}{'stream MB':>11}{'xml ratio':>11}")
+    mismatched = []
+    oversized = []
+    for size in [int(size) for size in args.sizes.split(",")]:
+        args.blocks = blocks * size
+        source_dir = os.path.join(workdir, f"b{args.blocks}")
+        source_path = generate(source_dir, mix_from_args(args))
+        usual_path = os.path.join(source_dir, "usual.docx")
+        stream_path = os.path.join(source_dir, "stream.docx")
+        usual = run(source_path, usual_path, False)
+        stream = run(source_path, stream_path, True)
+        ratio = document_size(stream_path) / document_size(usual_path)
+        print(f"{args.blocks:>8}{usual['seconds']:>10.2f}{usual['peak_mb']:>10.1f}{stream['seconds']:>10.2f}{stream['peak_mb']:>11.1f}{ratio:>11.3f}")
+        if ratio > DOCUMENT_SIZE_TOLERANCE:
+            oversized.append(source_path)
+        if read_parts(usual_path) != read_parts(stream_path):
+            mismatched.append(source_path)
+
+    for path in oversized:
+        print(f"FAIL: streamed {DOCUMENT_PART} of '{path}' is larger than the usual one")
+    for path in mismatched:
+        print(f"FAIL: outputs of '{path}' differ")
+    if len(oversized) != 0 or len(mismatched) != 0:
+        exit(1)
+    print("OK: streamed outputs have the same content")
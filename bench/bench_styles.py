@@ -0,0 +1,73 @@
+'''
+Benchmark of compiled styles cache (GdocxStyle.CompiledStylesCache).
+
+Applies styles json (default.json if not given) to new documents: parsing
+it every time, taking it from the cache in memory and from the cache on
+disk only. Checks that styles and Style values are the same in all cases.
+
+Usage:
+    python3 bench/bench_styles.py -n 50
+'''
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from types import SimpleNamespace
+from docx import Document
+from lxml import etree
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import main
+import GdocxStyle
+
+def apply(doc, json_string: str, use_cache: bool) -> (bytes, dict[str, object]):
+    values = SimpleNamespace()
+    if use_cache:
+        GdocxStyle.use_raw_styles(json_string, doc, False, values)
+    else:
+        GdocxStyle.parse_raw_styles(json_string, doc, False, values)
+    return etree.tostring(doc.styles.element), vars(values)
+
+def timed(count: int, json_string: str, use_cache: bool, before = None) -> (float, tuple):
+    total = 0.0
+    for _ in range(count):
+        if before is not None:
+            before()
+        # creation of the document itself isn't measured
+        doc = Document()
+        start = time.perf_counter()
+        result = apply(doc, json_string, use_cache)
+        total += time.perf_counter() - start
+    return total / count, result
+
+if __name__ == "__main__":
+    prs = argparse.ArgumentParser(prog = "bench_styles", description = "Benchmarks compiled styles cache")
+    prs.add_argument('-n', '--count', help="Number of documents per case", type=int, default=50)
+    prs.add_argument('--styles', help="Styles json", type=str, default=os.path.join(ROOT_DIR, main.PATH_DEFAULT_STYLES))
+    args = prs.parse_args()
+
+    with open(args.styles, "r") as file:
+        json_string = file.read()
+
+    cache = GdocxStyle.CompiledStylesCache
+    cache.dirpath = tempfile.mkdtemp(prefix = "gdocx_styles_bench_")
+
+    parsed, expected = timed(args.count, json_string, False)
+    # first call compiles and stores, the rest are hits in memory
+    memory, from_memory = timed(args.count, json_string, True)
+    disk, from_disk = timed(args.count, json_string, True, cache.entries.clear)
+
+    print(f"styles: '{args.styles}', {args.count} documents per case")
+    print(f"{'parse json':<24}{parsed * 1e3:>10.2f} ms")
+    print(f"{'cache in memory':<24}{memory * 1e3:>10.2f} ms")
+    print(f"{'cache on disk':<24}{disk * 1e3:>10.2f} ms")
+
+    if from_memory != expected or from_disk != expected:
+        print("FAIL: compiled styles differ from parsed ones")
+        exit(1)
+    print("OK: compiled styles are the same as parsed ones")
@@ -0,0 +1,98 @@
+'''
+Benchmark of table-csv macro against the same table made of table-cell macros.
+
+Generates a CSV file of measurements and two sources: one with a table-csv
+macro of the file and one with a table macro with a table-cell macro per
+non-empty value. Converts both, reporting size of the source and time.
+Checks that both outputs have the same parts.
+
+Usage:
+    python3 bench/bench_table_csv.py --rows 2000 --cols 8
+'''
+
+import os
+import sys
+import csv
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import main
+import GdocxStyle
+from common import convert, read_parts
+
+CSV_NAME = "measurements.csv"
+INDENT = "    "
+
+def gen_rows(rows: int, cols: int) -> list[list[str]]:
+    table = [[f"Column {c}" for c in range(cols)]]
+    for r in range(1, rows):
+        # some measurements are missing
+        table.append(["" if (r * cols + c) % 11 == 0 else f"{r * 0.37 + c:.3f}" for c in range(cols)])
+    return table
+
+def gen_csv_source(style: str) -> str:
+    return f"(table-csv {CSV_NAME} {style})\n"
+
+def gen_cells_source(table: list[list[str]]) -> str:
+    lines = [f"(table {len(table)} {len(table[0])}"]
+    for r, values in enumerate(table):
+        for c, value in enumerate(values):
+            if value == "":
+                continue
+            lines += [
+                f"{INDENT}(table-cell {r} {c}",
+                f"{INDENT * 2}{value}",
+                f"{INDENT})",
+            ]
+    lines.append(")")
+    return '\n'.join(lines) + '\n'
+
+def write(path: str, content: str) -> str:
+    with open(path, "w") as file:
+        file.write(content)
+    return path
+
+if __name__ == "__main__":
+    prs = argparse.ArgumentParser(prog = "bench_table_csv", description = "Benchmarks table-csv against table-cell macros")
+    prs.add_argument('--rows', help="Rows of the table, with the header", type=int, default=2000)
+    prs.add_argument('--cols', help="Columns of the table", type=int, default=8)
+    prs.add_argument('--style', help="Paragraph style of cells", type=str, default="paragraph")
+    prs.add_argument('--workdir', help="Directory for sources and outputs, temporary if not given", type=str)
+    args = prs.parse_args()
+
+    workdir = args.workdir
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix = "gdocx_table_csv_bench_")
+    workdir = os.path.abspath(workdir)
+    os.makedirs(workdir, exist_ok = True)
+
+    table = gen_rows(args.rows, args.cols)
+    with open(os.path.join(workdir, CSV_NAME), "w", newline = "") as file:
+        csv.writer(file).writerows(table)
+    sources = [
+        ("table-cell", write(os.path.join(workdir, "cells.txt"), gen_cells_source(table))),
+        ("table-csv", write(os.path.join(workdir, "csv.txt"), gen_csv_source(args.style))),
+    ]
+
+    main.init_gostdocx(strip_indent = True, skip_empty = True)
+    GdocxStyle.init_default_styles(os.path.join(ROOT_DIR, main.PATH_DEFAULT_STYLES))
+
+    print(f"{args.rows}x{args.cols} table")
+    print(f"{'macros':<12}{'source KB':>12}{'seconds':>10}")
+    outputs = []
+    for name, source_path in sources:
+        out_path = os.path.join(workdir, f"{name}.docx")
+        seconds, _ = convert(source_path, out_path)
+        source_kb = (os.path.getsize(source_path) + (os.path.getsize(os.path.join(workdir, CSV_NAME)) if name == "table-csv" else 0)) / 1024
+        print(f"{name:<12}{source_kb:>12.1f}{seconds:>10.2f}")
+        outputs.append(out_path)
+
+    if read_parts(outputs[0]) != read_parts(outputs[1]):
+        print("FAIL: outputs of table-csv and table-cell differ")
+        exit(1)
+    print("OK: outputs of table-csv and table-cell are the same")
@@ -0,0 +1,57 @@
+'''
+Benchmark of filling tables with table-cell macros.
+
+Generates sources with one table of growing number of rows and converts
+each of them with main.py in a new process, reporting wall time and time per
+cell. Time per cell should stay roughly the same as the table grows.
+
+With --root, main.py of another checkout is measured, e.g. to compare
+with an older revision.
+
+Usage:
+    python3 bench/bench_tables.py --rows 125,250,500 --table-cols 10
+'''
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from gen_source import add_mix_args, mix_from_args, generate
+
+def run(main_path: str, source_path: str, out_path: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, main_path, "-i", source_path, "-o", out_path, "-s", "-se"],
+        check = True, capture_output = True)
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    prs = argparse.ArgumentParser(prog = "bench_tables", description = "Benchmarks filling tables with table-cell macros")
+    add_mix_args(prs)
+    prs.add_argument('--rows', help="Comma separated numbers of rows of the table", type=str, default="125,250,500")
+    prs.add_argument('--root', help="Checkout whose main.py is measured, this one by default", type=str, default=ROOT_DIR)
+    prs.add_argument('--workdir', help="Directory for sources and outputs, temporary if not given", type=str)
+    prs.set_defaults(blocks = 1, plain_lines = 0, list_items = 0, images = 0, json_fields = 0, numbered = 0, table_cols = 10)
+    args = prs.parse_args()
+
+    workdir = args.workdir
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix = "gdocx_tables_bench_")
+    workdir = os.path.abspath(workdir)
+    main_path = os.path.join(os.path.abspath(args.root), "main.py")
+
+    print(f"'{main_path}'")
+    print(f"{'table':<12}{'seconds':>10}{'ms per cell':>14}")
+    for rows in [int(size) for size in args.rows.split(",")]:
+        args.table_rows = rows
+        rundir = os.path.join(workdir, f"rows{rows}")
+        source_path = generate(rundir, mix_from_args(args))
+        seconds = run(main_path, source_path, os.path.join(rundir, "out.docx"))
+        cells = rows * args.table_cols
+        print(f"{f'{rows}x{args.table_cols}':<12}{seconds:>10.2f}{seconds * 1000 / cells:>14.3f}")
@@ -0,0 +1,83 @@
+'''
+Microbenchmark of tokenizing a source: line-by-line GdocxParsing.parse_line
+(LineInfo + macro args parsing) against single-pass GdocxParsing.tokenize.
+
+Both paths track nesting of macros like the driver does, so that indents are
+stripped the same way as during conversion. Both modes of the driver are
+measured: with --strip-indent, and without it (the default), when every
+line is seen at indent 0.
+
+Usage:
+    python3 bench/bench_tokenizer.py -b 1000
+'''
+
+import os
+import sys
+import time
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import gen_source
+import GdocxParsing
+
+def run_line_by_line(text: str, strip_indent: bool) -> int:
+    indent = 0
+    macros = 0
+    for line in text.splitlines(keepends = True):
+        rawline, info = GdocxParsing.parse_line(line, indent if strip_indent else 0)
+        if info.type == GdocxParsing.INFO_TYPE_MACRO:
+            macros += 1
+            if info.macro_type == GdocxParsing.MACRO_TYPE_START:
+                indent += 1
+            elif info.macro_type == GdocxParsing.MACRO_TYPE_END:
+                indent -= 1
+    return macros
+
+def run_tokenize(text: str, strip_indent: bool) -> int:
+    indent = 0
+    macros = 0
+    for lineno, token in GdocxParsing.tokenize(text):
+        info = token.info_at(indent if strip_indent else 0)
+        if info.type == GdocxParsing.INFO_TYPE_MACRO:
+            macros += 1
+            if info.macro_type == GdocxParsing.MACRO_TYPE_START:
+                indent += 1
+            elif info.macro_type == GdocxParsing.MACRO_TYPE_END:
+                indent -= 1
+    return macros
+
+def best_of(func, text: str, strip_indent: bool, repeat: int) -> (float, int):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(text, strip_indent)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+if __name__ == "__main__":
+    prs = argparse.ArgumentParser(prog = "bench_tokenizer", description = "Benchmarks tokenizing of a source")
+    gen_source.add_mix_args(prs)
+    prs.add_argument('-r', '--repeat', help="Report the fastest of N runs", type=int, default=5)
+    args = prs.parse_args()
+
+    GdocxParsing.INDENT_STRING = gen_source.INDENT
+    text = gen_source.gen_source(gen_source.mix_from_args(args))
+    lines = text.count('\n')
+
+    print(f"source: {lines} lines")
+    for mode, strip_indent in (("strip indent", True), ("no strip", False)):
+        old_time, old_macros = best_of(run_line_by_line, text, strip_indent, args.repeat)
+        new_time, new_macros = best_of(run_tokenize, text, strip_indent, args.repeat)
+        if old_macros != new_macros:
+            print(f"ERROR: {mode}: macro count differs: {old_macros} != {new_macros}")
+            exit(1)
+
+        print(f"{mode}: {new_macros} macros")
+        print(f"{'parse_line':<12}{old_time * 1e3:>10.2f} ms{lines / old_time:>14.0f} lines/s")
+        print(f"{'tokenize':<12}{new_time * 1e3:>10.2f} ms{lines / new_time:>14.0f} lines/s")
+        print(f"speedup: {old_time / new_time:.1f}x")
@@ -0,0 +1,31 @@
+'''
+Helpers shared by benchmarks: converting a source in this process and
+reading parts of an output to compare it with another one.
+
+Benchmarks put the repository root on sys.path before importing this module.
+'''
+
+import io
+import os
+import time
+import zipfile
+from contextlib import redirect_stdout
+
+# parts which differ between two conversions of the same source
+VOLATILE_PARTS = {"docProps/core.xml"}
+
+# Parts of .docx (path or file object) by name, without volatile ones
+def read_parts(file) -> dict[str, bytes]:
+    with zipfile.ZipFile(file) as archive:
+        return {name: archive.read(name) for name in archive.namelist() if name not in VOLATILE_PARTS}
+
+# Converts the source with its dir as cwd, overrides are passed to
+# main.create_context. Returns seconds and the context, for its stats
+def convert(source_path: str, out_path: str, **overrides) -> (float, 'GdocxContext'):
+    # imported here: bench_stream imports main only in its children
+    import main
+    ctx = main.create_context(cwd = os.path.dirname(source_path), **overrides)
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        main.process_txt(source_path, out_path, ctx)
+    return time.perf_counter() - start, ctx
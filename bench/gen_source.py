@@ -0,0 +1,213 @@
+'''
+Generates synthetic GOST sources of controlled size and mix for benchmarks.
+
+The source is built out of "blocks", each of which uses the same constructs
+as example.py: plain lines, nested ordered/unordered lists, tables with
+table-cell grids, images with captions, json-reader/json-field, numbered
+headings. Every DOC_EVERY blocks a doc macro appends a prebuilt .docx.
+
+Usage:
+    python3 bench/gen_source.py -o OUT_DIR -b 100
+'''
+
+import os
+import json
+import zlib
+import struct
+import argparse
+
+SOURCE_NAME = "source.txt"
+IMAGE_NAME = "image.png"
+JSON_NAME = "data.json"
+APPEND_DOC_NAME = "append.docx"
+
+INDENT = "    "
+
+class Mix:
+    def __init__(self, **kwargs):
+        self.blocks = kwargs.get('blocks', 10)
+        self.plain_lines = kwargs.get('plain_lines', 20)
+        self.list_items = kwargs.get('list_items', 5)
+        self.table_rows = kwargs.get('table_rows', 4)
+        self.table_cols = kwargs.get('table_cols', 3)
+        self.images = kwargs.get('images', 1)
+        self.json_fields = kwargs.get('json_fields', 2)
+        self.numbered = kwargs.get('numbered', 2)
+        # 0 means never append a doc
+        self.doc_every = kwargs.get('doc_every', 0)
+        self.image_size = kwargs.get('image_size', 64)
+
+def indent(depth: int, line: str) -> str:
+    return INDENT * depth + line
+
+def gen_plain(mix: Mix, block: int) -> list[str]:
+    return [f"Block {block} plain line {i}: Lorem ipsum dolor sit amet, consectetur adipiscing elit."
+        for i in range(mix.plain_lines)]
+
+def gen_lists(mix: Mix, block: int) -> list[str]:
+    lines = ["(ordered-list"]
+    for i in range(mix.list_items):
+        lines += [
+            indent(1, "(ordered-list-item"),
+            indent(2, f"Block {block} ordered item {i}"),
+            indent(1, ")"),
+        ]
+    lines.append(indent(1, "(unordered-list"))
+    for i in range(mix.list_items):
+        lines += [
+            indent(2, "(unordered-list-item"),
+            indent(3, f"Block {block} nested unordered item {i}"),
+            indent(2, ")"),
+        ]
+    lines += [indent(1, ")"), ")"]
+    return lines
+
+def gen_table(mix: Mix, block: int) -> list[str]:
+    lines = [f"(table {mix.table_rows} {mix.table_cols}"]
+    for r in range(mix.table_rows):
+        for c in range(mix.table_cols):
+            lines += [
+                indent(1, f"(table-cell {r} {c}"),
+                indent(2, f"b{block} r{r} c{c}"),
+                indent(1, ")"),
+            ]
+    lines.append(")")
+    return lines
+
+def gen_images(mix: Mix, block: int) -> list[str]:
+    lines = []
+    for i in range(mix.images):
+        lines += [
+            f"(image {IMAGE_NAME} 8)",
+            "(image-caption",
+            indent(1, f"Block {block} image {i}"),
+            ")",
+        ]
+    return lines
+
+def gen_json(mix: Mix, block: int) -> list[str]:
+    if mix.json_fields == 0:
+        return []
+    lines = [f"(json-reader {JSON_NAME}"]
+    for i in range(mix.json_fields):
+        lines += [
+            indent(1, "(paragraph-styled paragraph"),
+            indent(2, f"Field {i}: "),
+            indent(1, ")"),
+            indent(1, f"(json-field field{i})"),
+        ]
+    lines.append(")")
+    return lines
+
+def gen_numbered(mix: Mix, block: int) -> list[str]:
+    lines = []
+    for i in range(mix.numbered):
+        lines += [
+            "(numbered",
+            indent(1, "(paragraph-styled heading-2"),
+            indent(2, f"Block {block} numbered heading {i}"),
+            indent(1, ")"),
+            ")",
+        ]
+    return lines
+
+def gen_block(mix: Mix, block: int) -> list[str]:
+    lines = [
+        "(paragraph-styled heading-1",
+        indent(1, f"Block {block}"),
+        ")",
+    ]
+    lines += gen_plain(mix, block)
+    lines += gen_lists(mix, block)
+    lines += gen_table(mix, block)
+    lines += gen_images(mix, block)
+    lines += gen_json(mix, block)
+    lines += gen_numbered(mix, block)
+    if mix.doc_every > 0 and (block + 1) % mix.doc_every == 0:
+        lines.append(f"(doc {APPEND_DOC_NAME})")
+    return lines
+
+def gen_source(mix: Mix) -> str:
+    lines = []
+    for block in range(mix.blocks):
+        lines += gen_block(mix, block)
+    return '\n'.join(lines) + '\n'
+
+# Minimal RGB PNG writer, so that the generator doesn't depend on Pillow
+def gen_png(size: int) -> bytes:
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    rows = []
+    for y in range(size):
+        row = bytearray([0])
+        for x in range(size):
+            row += bytes(((x * 7 + y) % 256, (y * 5) % 256, (x * y) % 256))
+        rows.append(bytes(row))
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(b''.join(rows)))
+        + chunk(b"IEND", b""))
+
+def gen_json_data(mix: Mix) -> dict[str, object]:
+    return {f"field{i}": f"value {i}" for i in range(max(mix.json_fields, 1))}
+
+def gen_append_doc(path: str):
+    from docx import Document
+    doc = Document()
+    doc.add_paragraph("Appended document")
+    doc.save(path)
+
+# Writes source and its assets into outdir, returns path to the source
+def generate(outdir: str, mix: Mix) -> str:
+    os.makedirs(outdir, exist_ok = True)
+
+    with open(os.path.join(outdir, IMAGE_NAME), "wb") as file:
+        file.write(gen_png(mix.image_size))
+    with open(os.path.join(outdir, JSON_NAME), "w") as file:
+        json.dump(gen_json_data(mix), file)
+    if mix.doc_every > 0:
+        gen_append_doc(os.path.join(outdir, APPEND_DOC_NAME))
+
+    source_path = os.path.join(outdir, SOURCE_NAME)
+    with open(source_path, "w") as file:
+        file.write(gen_source(mix))
+    return source_path
+
+def add_mix_args(prs: argparse.ArgumentParser):
+    prs.add_argument('-b', '--blocks', help="Number of blocks", type=int, default=10)
+    prs.add_argument('--plain-lines', help="Plain lines per block", type=int, default=20)
+    prs.add_argument('--list-items', help="Items per (nested) list", type=int, default=5)
+    prs.add_argument('--table-rows', type=int, default=4)
+    prs.add_argument('--table-cols', type=int, default=3)
+    prs.add_argument('--images', help="Images per block", type=int, default=1)
+    prs.add_argument('--json-fields', help="json-field macros per block", type=int, default=2)
+    prs.add_argument('--numbered', help="numbered macros per block", type=int, default=2)
+    prs.add_argument('--doc-every', help="Append a doc every N blocks, 0 to disable", type=int, default=0)
+    prs.add_argument('--image-size', help="Side of generated image in pixels", type=int, default=64)
+
+def mix_from_args(args) -> Mix:
+    return Mix(
+        blocks = args.blocks,
+        plain_lines = args.plain_lines,
+        list_items = args.list_items,
+        table_rows = args.table_rows,
+        table_cols = args.table_cols,
+        images = args.images,
+        json_fields = args.json_fields,
+        numbered = args.numbered,
+        doc_every = args.doc_every,
+        image_size = args.image_size,
+    )
+
+if __name__ == "__main__":
+    prs = argparse.ArgumentParser(prog = "gen_source", description = "Generates synthetic GOST source")
+    prs.add_argument('-o', '--outdir', help="Output directory", type=str, required=True)
+    add_mix_args(prs)
+    args = prs.parse_args()
+
+    path = generate(args.outdir, mix_from_args(args))
+    print(f"'{path}' created")
@@ -0,0 +1,104 @@
+'''
+Stress test of concurrent conversions in one process.
+
+Generates N different sources (see gen_source.py), each of which changes
+state that used to be global: it moves into its own dir with chdir, loads
+its own image caption prefix with load-style, numbers images and numbered
+macros. Sources are converted one by one, then all at once on a thread pool,
+every conversion with its own GdocxContext. Outputs of both runs must be
+the same.
+
+Usage:
+    python3 bench/stress_concurrent.py -n 32 -t 32
+'''
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import main
+import GdocxStyle
+from gen_source import Mix, generate
+from common import read_parts
+
+SUB_DIR = "assets"
+STYLE_NAME = "style.json"
+
+# Source in jobdir which moves to jobdir/assets with generated source in it
+def make_job(jobdir: str, index: int) -> str:
+    mix = Mix(blocks = 2 + index % 5, images = 1 + index % 3, numbered = 1 + index % 2,
+        doc_every = 3 if index % 4 == 0 else 0)
+    subdir = os.path.join(jobdir, SUB_DIR)
+    os.makedirs(subdir, exist_ok = True)
+    generated = generate(subdir, mix)
+
+    with open(os.path.join(subdir, STYLE_NAME), "w") as file:
+        json.dump({GdocxStyle.FIELD_IMAGE_CAPTION_PREFIX: f"Рисунок {index}."}, file)
+
+    with open(generated, "r") as file:
+        text = file.read()
+    path = os.path.join(jobdir, "source.txt")
+    with open(path, "w") as file:
+        file.write(f"(chdir {SUB_DIR})\n(load-style {STYLE_NAME})\n" + text)
+    return path
+
+def convert(inpath: str, outpath: str):
+    ctx = main.create_context(cwd = os.path.dirname(inpath))
+    main.process_txt(inpath, outpath, ctx)
+
+if __name__ == "__main__":
+    prs = argparse.ArgumentParser(prog = "stress_concurrent", description = "Converts many sources concurrently and compares with sequential outputs")
+    prs.add_argument('-n', '--count', help="Number of sources", type=int, default=32)
+    prs.add_argument('-t', '--threads', help="Number of threads", type=int, default=32)
+    prs.add_argument('--workdir', help="Directory for sources and outputs, temporary if not given", type=str)
+    args = prs.parse_args()
+
+    workdir = args.workdir
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix = "gdocx_stress_")
+    workdir = os.path.abspath(workdir)
+
+    main.init_gostdocx(strip_indent = True, skip_empty = True)
+    GdocxStyle.init_default_styles(os.path.join(os.path.dirname(BENCH_DIR), main.PATH_DEFAULT_STYLES))
+
+    inpaths = [make_job(os.path.join(workdir, f"job{i}"), i) for i in range(args.count)]
+    startup_dir = os.getcwd()
+
+    # chdir macros print every change of dir. sys.stdout is shared by
+    # threads, so it's redirected once and not by every conversion
+    with redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for inpath in inpaths:
+            convert(inpath, inpath + ".seq.docx")
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as pool:
+            futures = [pool.submit(convert, inpath, inpath + ".conc.docx") for inpath in inpaths]
+            for future in futures:
+                future.result()
+        concurrent = time.perf_counter() - start
+
+    mismatched = [inpath for inpath in inpaths
+        if read_parts(inpath + ".seq.docx") != read_parts(inpath + ".conc.docx")]
+
+    print(f"{args.count} sources in '{workdir}'")
+    print(f"sequential {sequential:8.2f}s, {args.threads} threads {concurrent:8.2f}s")
+    if os.getcwd() != startup_dir:
+        print(f"FAIL: current dir of the process changed to '{os.getcwd()}'")
+        exit(1)
+    if len(mismatched) != 0:
+        for inpath in mismatched:
+            print(f"FAIL: outputs of '{inpath}' differ")
+        exit(1)
+    print("OK: concurrent outputs are the same as sequential ones")
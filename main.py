@@ -3,47 +3,85 @@ You can use the script as... a script. An example is in example.py and README.
 
 Also, use it as a library! Just use init_gostdocx(**kwargs) to pass arguments
 to the module (as if through command line) and then process_txt(inpath, outpath)
+
+Every conversion gets its own GdocxContext (see create_context), so
+conversions may run concurrently in threads of one process.
+
+python-docx and modules which need it are imported by functions which use
+them, so --help, wrong arguments and --check don't wait for that import.
 '''
 
 import os
 import sys
+import time
 import argparse
-from docx import Document
-from GdocxState import GdocxState
+from GdocxContext import GdocxContext
 from typing import Type, Any
 import GdocxParsing
-import GdocxHandler
-import GdocxStyle
 import GdocxCommon
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-from docx.oxml import OxmlElement, ns
-from docxcompose.composer import Composer
+import GdocxProfile
+import GdocxTree
+import GdocxCheck
 
-STARTUP_INPUT_DIR = "."
+# Directory against which paths in sources are resolved,
+# None for current dir of the process at the time of conversion
+STARTUP_INPUT_DIR = None
 # Relative path is resolved against the script's path,
 # as the default styles are intended to be in its directory.
 PATH_DEFAULT_STYLES = "styles/default.json"
 SKIP_NUMBERING = False
 CONVERT_DOCX_TO_TXT = False
 DOCX_TO_TXT_OUTDIR = "."
+# If set, conversion is profiled and Chrome trace is written there
+PROFILE_PATH = None
+# Only validate the source, don't build a document
+CHECK_ONLY = False
+# Glob or manifest of sources to convert in batch, see GdocxBatch
+BATCH = None
+BATCH_JOBS = os.cpu_count()
+# Directory of fragment cache for incremental rendering, see GdocxCache
+CACHE_DIR = None
+# Write the document while it's rendered, see GdocxStream
+STREAM = False
+# Level of compression of the output, see GdocxZip
+COMPRESSION = "default"
+# Pixels per inch images are downscaled to, 0 to keep them, see GdocxImage
+IMAGE_DPI = 0
+# Load files of macros ahead of rendering, see GdocxPrefetch
+PREFETCH = True
+# Convert again whenever the source or files it uses change, see GdocxWatch
+WATCH = False
+# Address of conversion daemon, see GdocxServe
+SERVE = None
+SERVE_QUEUE_SIZE = 16
+# Seconds, None for no timeout
+SERVE_TIMEOUT = 60.0
+# Serve hosts which aren't loopback
+SERVE_ALLOW_REMOTE = False
+# Arguments of the last init_gostdocx, with absolute paths
+INIT_KWARGS: dict[str, object] = {}
 
 # ! You can add something here !
 # Will be added to GdocxState's registered_handlers
-registered_macro_handlers: list[Type[Any]] = [
-    GdocxHandler.EchoHandler,
-    GdocxHandler.ChdirHandler,
-]
-
-def process_with_current_handler(file, state: GdocxState):
-    # this is for one-line macro
-    if state.reached_macro_end:
-        state.handler.finalize()
-        state.reached_macro_end = False
-        return
-
-    line = file.readline()
-    while(line != ""):
-        new_handler = state.handle_or_get_new_handler(line)
+registered_macro_handlers: list[Type[Any]] = []
+
+# Reads tokens until the end of file, end macro outside of any macro or
+# page macro. Handlers of nested macros are kept in explicit stack, so
+# there's no limit on nesting depth.
+def process_with_current_handler(tokens, state: 'GdocxState'):
+    from GdocxState import GdocxState
+    # handlers to restore when macros end, the last one is of enclosing macro
+    prev_handlers = []
+    stream_writer = state.ctx.stream_writer
+
+    # tokens yield pairs of line number and token.
+    # After return or break the rest of tokens is left for the next state
+    for lineno, token in tokens:
+        # no macro is open, so no handler holds elements of the body
+        if stream_writer is not None and len(prev_handlers) == 0:
+            stream_writer.flush(state.doc_receiver)
+
+        new_handler = state.handle_or_get_new_handler(lineno, token)
 
         if new_handler is not None:
             # new_handler sees old_handler as state's current handler.
@@ -55,29 +93,38 @@ def process_with_current_handler(file, state: GdocxState):
                 state.finalize()
 
             state.indent += 1
-            process_with_current_handler(file, state)
+            prev_handlers.append(old_handler)
 
-            state.indent -= 1
-            state.handler = old_handler
+        # one-line macro ends right away, others read following lines
+        # until end macro
+        if not state.reached_macro_end:
+            continue
 
-            if state.reached_page_macro:
-                return
-
-        # this is for end macro.
-        # page macro is one-liner, so it ends immediately and we can return something
-        if state.reached_macro_end:
-            state.handler.finalize()
-            state.reached_macro_end = False
+        state.handler.finalize()
+        state.reached_macro_end = False
+        # end macro outside of any macro ends processing
+        if len(prev_handlers) == 0:
             return
 
-        line = file.readline()
-    return
+        state.indent -= 1
+        state.handler = prev_handlers.pop()
+
+        # page macro ends processing, enclosing macros are not finalized
+        if state.reached_page_macro:
+            break
+
+    # unclosed macros are not finalized either
+    if len(prev_handlers) != 0:
+        state.indent -= len(prev_handlers)
+        state.handler = prev_handlers[0]
 
 # Copied from https://stackoverflow.com/questions/56658872/add-page-number-using-python-docx
 def create_element(name):
+    from docx.oxml import OxmlElement
     return OxmlElement(name)
 
 def create_attribute(element, name, value):
+    from docx.oxml import ns
     element.set(ns.qn(name), value)
 
 
@@ -97,41 +144,207 @@ def add_page_number(run):
     run._r.append(fldChar2)
 # end copied
 
-def add_footer_with_page_number(doc: Document):
+def add_footer_with_page_number(doc: 'Document'):
+    from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
     add_page_number(doc.sections[0].footer.paragraphs[0].add_run())
     doc.sections[0].footer.paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
 
-def process_txt(filepath: str, filepath_out: str):
-    file = open(filepath, "r")
-    doc = Document()
-    GdocxStyle.use_default_styles(doc)
+# Context of a new conversion with options given to init_gostdocx
+def create_context(**kwargs) -> GdocxContext:
+    options = {
+        'indent_string': GdocxParsing.INDENT_STRING,
+        'strip_indent': GdocxParsing.STRIP_INDENT,
+        'skip_empty': GdocxParsing.SKIP_EMPTY,
+        'skip_numbering': SKIP_NUMBERING,
+        'handlers': registered_macro_handlers,
+        'cwd': STARTUP_INPUT_DIR if STARTUP_INPUT_DIR is not None else os.getcwd(),
+        'profile_path': PROFILE_PATH,
+        'stream': STREAM,
+        'compression': COMPRESSION,
+        'image_dpi': IMAGE_DPI,
+        'prefetch': PREFETCH,
+    }
+    if CACHE_DIR is not None:
+        import GdocxCache
+        options['cache'] = GdocxCache.FragmentCache(CACHE_DIR)
+    options.update(kwargs)
+    ctx = GdocxContext(**options)
+    if ctx.profile_path is not None:
+        ctx.profiler = GdocxProfile.Profiler()
+    return ctx
+
+# Relative paths are resolved against ctx.cwd
+def process_txt(filepath: str, filepath_out: str, ctx: GdocxContext | None = None):
+    if ctx is None:
+        ctx = create_context()
+    filepath = ctx.use_path(filepath)
+    filepath_out = ctx.abspath(filepath_out)
+
+    with open(filepath, "r") as file:
+        text = file.read()
+    if ctx.stream:
+        stream_txt(ctx, text, filepath_out)
+        print_image_stats(ctx)
+        write_profile(ctx)
+        return
+    if ctx.cache is None:
+        prefetch_txt(ctx, text)
+        tokens = GdocxParsing.tokenize(text, ctx.indent_string)
+        docs = process_segments(ctx, lambda state: process_with_current_handler(tokens, state))
+    else:
+        docs = render_cached(ctx, text)
+    save_docs(ctx, docs, filepath_out)
+    print_image_stats(ctx)
+    write_profile(ctx)
+
+# Writes filepath_out while the source is rendered, see GdocxStream
+def stream_txt(ctx: GdocxContext, text: str, filepath_out: str):
+    import GdocxDocPool
+    import GdocxStream
+    from GdocxState import GdocxState
+    prefetch_txt(ctx, text)
+    tokens = GdocxParsing.tokenize(text, ctx.indent_string)
+    doc = GdocxDocPool.new_document(ctx.default_styles_doc)
+    ctx.stream_writer = GdocxStream.StreamWriter(doc, filepath_out, ctx.compression)
+    try:
+        with GdocxState(doc, ctx.handlers, ctx) as state:
+            process_with_current_handler(tokens, state)
+        if not ctx.skip_numbering:
+            add_footer_with_page_number(doc)
+        ctx.stream_writer.finish()
+    except BaseException:
+        # output is left only if it's complete
+        ctx.stream_writer.close()
+        os.remove(filepath_out)
+        raise
+    finally:
+        ctx.stream_writer = None
+
+# Renders through the tree, taking unchanged fragments from ctx.cache
+def render_cached(ctx: GdocxContext, text: str) -> list['Document']:
+    import GdocxCache
+    tree = GdocxTree.parse(text, ctx.strip_indent, ctx.skip_empty, ctx.indent_string)
+    exit_on_parse_errors(ctx, tree)
+    start_prefetch(ctx, tree)
+
+    segments = iter(tree.segments)
+    docs = process_segments(ctx, lambda state: GdocxCache.render_segment(state, next(segments), ctx.cache))
+    print(GdocxCache.format_stats(ctx.cache_stats))
+    ctx.cache.prune()
+    return docs
+
+def exit_on_parse_errors(ctx: GdocxContext, tree: GdocxTree.Tree):
+    exit_on_errors(ctx, tree.errors)
+
+def exit_on_errors(ctx: GdocxContext, errors: list[GdocxTree.ParseError]):
+    if len(errors) == 0:
+        return
+    for error in errors:
+        print(error)
+    ctx.error = str(errors[0])
+    exit(1)
+
+# Starts loading files of macros of the source, exits if some are missing.
+# See GdocxPrefetch
+def start_prefetch(ctx: GdocxContext, tree: GdocxTree.Tree):
+    if not ctx.prefetch:
+        return
+    import GdocxPrefetch
+    exit_on_errors(ctx, GdocxPrefetch.start(ctx, tree))
+
+def prefetch_txt(ctx: GdocxContext, text: str):
+    if ctx.prefetch:
+        start_prefetch(ctx, GdocxTree.parse(text, ctx.strip_indent, ctx.skip_empty, ctx.indent_string))
+
+def print_image_stats(ctx: GdocxContext):
+    stats = ctx.image_stats
+    if stats["downscaled"] == 0 and stats["oversized"] == 0:
+        return
+    import GdocxImage
+    print(GdocxImage.format_stats(stats))
+
+def write_profile(ctx: GdocxContext):
+    if ctx.profiler is None or ctx.profile_path is None:
+        return
+    print(ctx.profiler.format_table())
+    ctx.profiler.write_trace(ctx.profile_path)
+    print(f"\'{ctx.profile_path}\' created")
+
+# Parse stage of the two-phase pipeline, doesn't build any document
+def parse_txt(filepath: str, ctx: GdocxContext | None = None) -> GdocxTree.Tree:
+    if ctx is None:
+        ctx = create_context()
+    with open(ctx.abspath(filepath), "r") as file:
+        return GdocxTree.parse(file.read(),
+            ctx.strip_indent, ctx.skip_empty, ctx.indent_string)
+
+# Render stage of the two-phase pipeline
+def render_tree(tree: GdocxTree.Tree, filepath_out: str, ctx: GdocxContext | None = None):
+    import GdocxRender
+    if ctx is None:
+        ctx = create_context()
+    exit_on_parse_errors(ctx, tree)
+    start_prefetch(ctx, tree)
+
+    segments = iter(tree.segments)
+    docs = process_segments(ctx, lambda state: GdocxRender.render_segment(state, next(segments)))
+    save_docs(ctx, docs, ctx.abspath(filepath_out))
+    print_image_stats(ctx)
+    write_profile(ctx)
+
+# Validates the source without building a document.
+# Returns all errors found, see GdocxCheck
+def check_txt(filepath: str, ctx: GdocxContext | None = None) -> list[GdocxTree.ParseError]:
+    if ctx is None:
+        ctx = create_context()
+    extra_macro_names = [handler.NAME for handler in ctx.handlers]
+    return GdocxCheck.check_txt(ctx.abspath(filepath),
+        ctx.strip_indent, ctx.skip_empty,
+        ctx.indent_string, extra_macro_names, ctx.cwd)
+
+# Calls process_segment with new state until it doesn't reach page macro.
+# Returns documents to be composed, including appended ones
+def process_segments(ctx: GdocxContext, process_segment) -> list['Document']:
+    import GdocxDocPool
+    from GdocxState import GdocxState
+    with GdocxProfile.span(ctx.profiler, "new_document", GdocxProfile.CAT_STYLES):
+        doc = GdocxDocPool.new_document(ctx.default_styles_doc)
     docs = []
 
     while True:
-        with GdocxState(doc, registered_macro_handlers) as state:
-            state.strip_indent = GdocxParsing.STRIP_INDENT
-            state.skip_empty = GdocxParsing.SKIP_EMPTY
+        with GdocxState(doc, ctx.handlers, ctx) as state:
             # here state is primary handler
-            process_with_current_handler(file, state)
+            process_segment(state)
             to_append = state.reached_page_macro
 
             docs.append(doc)
             if to_append:
-                docs.append(Document(state.append_filepath))
-                doc = Document()
-                GdocxStyle.use_default_styles(doc)
+                with GdocxProfile.span(ctx.profiler, "open_document", GdocxProfile.CAT_COMPOSE):
+                    wait_for_prefetch(ctx, state.append_filepath)
+                    docs.append(GdocxDocPool.open_document(state.append_filepath))
+                with GdocxProfile.span(ctx.profiler, "new_document", GdocxProfile.CAT_STYLES):
+                    doc = GdocxDocPool.new_document(ctx.default_styles_doc)
             else:
                 break
+    return docs
 
-    file.close()
+# Waits until the document is parsed into GdocxDocPool.AppendedDocs
+def wait_for_prefetch(ctx: GdocxContext, filepath: str):
+    if ctx.prefetcher is not None:
+        import GdocxPrefetch
+        GdocxPrefetch.take(ctx, GdocxPrefetch.KIND_DOC, filepath)
 
-    if not SKIP_NUMBERING:
+def save_docs(ctx: GdocxContext, docs: list['Document'], filepath_out: str):
+    import GdocxMerge
+    if not ctx.skip_numbering:
         add_footer_with_page_number(docs[0])
 
-    composer = Composer(docs[0])
+    merger = GdocxMerge.Merger(docs[0])
     for doc in docs[1:]:
-        composer.append(doc)
-    composer.save(filepath_out)
+        with GdocxProfile.span(ctx.profiler, "Merger.append", GdocxProfile.CAT_COMPOSE):
+            merger.append(doc)
+    with GdocxProfile.span(ctx.profiler, "Merger.save", GdocxProfile.CAT_SAVE):
+        merger.save(filepath_out, ctx.compression)
 
 
 def process_args() -> (str, str):
@@ -157,16 +370,35 @@ Converts .txt files into .docx
     prs.add_argument('-n', '--skip-numbering', help="Don't put page number in footers of pages", action="store_true")
     prs.add_argument('-d', '--docx_to_txt', help="Convert .docx file .txt", action="store_true")
     prs.add_argument('-od', '--docx_to_txt_outdir', help="If -d flag is provided, specifies output dir for style and output files", type=str)
+    prs.add_argument('-p', '--profile', help="Profile conversion: print time per macro and write Chrome trace (chrome://tracing) to this .json file", type=str)
+    prs.add_argument('-b', '--batch', help="Convert many files: glob of .txt files (quote it) or manifest file with 'INPUT [OUTPUT]' lines. -o is then optional output dir", type=str)
+    prs.add_argument('-j', '--jobs', help="Number of worker processes for --batch or worker threads for --serve, defaults to number of CPUs", type=int)
+    prs.add_argument('--cache', help="Directory of cache of rendered fragments: only changed parts of the source are rendered again", type=str)
+    prs.add_argument('--style-cache', help="Keep compiled styles on disk in DIR, ~/.cache/gostdocx/styles if DIR isn't given", type=str, nargs='?', const=True, metavar='DIR')
+    prs.add_argument('--no-style-cache', help="Don't keep compiled styles on disk (default)", action="store_true")
+    prs.add_argument('--image-dpi', help="Downscale images to this many pixels per inch of their size in the document, e.g. 300. Needs Pillow. Defaults to 0, images are kept as they are", type=int)
+    prs.add_argument('--image-cache', help="Keep downscaled images on disk in DIR, ~/.cache/gostdocx/images if DIR isn't given", type=str, nargs='?', const=True, metavar='DIR')
+    prs.add_argument('--no-image-cache', help="Don't keep downscaled images on disk (default)", action="store_true")
+    prs.add_argument('--no-prefetch', help="Don't load images, json, styles and .docx files of macros ahead of rendering", action="store_true")
+    prs.add_argument('--stream', help="Write the document while it's converted, so that memory doesn't grow with its length. doc macro isn't supported", action="store_true")
+    # levels of GdocxZip.LEVELS, listed here so that --help doesn't import zipfile
+    prs.add_argument('--compression', help="Compression of the output: store (fastest), fast, default or max (smallest). Images and other compressed media are always stored", type=str, choices=["store", "fast", "default", "max"])
+    prs.add_argument('-w', '--watch', help="Keep running and convert again when the source or any file it uses changes", action="store_true")
+    prs.add_argument('--serve', help="Run conversion daemon on localhost: PORT, HOST:PORT or unix:SOCKET_PATH", type=str)
+    prs.add_argument('--queue-size', help="Number of --serve requests which may wait for a worker, the rest are rejected", type=int)
+    prs.add_argument('--timeout', help="Seconds after which --serve request fails, 0 for no timeout", type=float)
+    prs.add_argument('--allow-remote', help="Let --serve listen on hosts which aren't loopback. Sources are converted with your permissions", action="store_true")
+    prs.add_argument('-c', '--check', help="Only check the source for errors, don't create .docx", action="store_true")
     prs.add_argument('-id', '--input_dir', help="Program moves to specified directory before processing txt's. If not specified, uses current working dir. Paths passed via -i and -o are resolved before moving", type=str)
 
     args = prs.parse_args()
     inpath = args.input
     outpath = args.output
 
-    if inpath == None:
+    if inpath == None and args.batch == None and args.serve == None:
         print("ERROR: must provide path to in file .txt")
         exit(1)
-    elif outpath == None:
+    elif outpath == None and not args.check and args.batch == None and args.serve == None:
         print("ERROR: must provide path to out file .docx")
         exit(1)
 
@@ -178,7 +410,25 @@ Converts .txt files into .docx
         skip_empty = args.skip_empty,
         skip_numbering = args.skip_numbering,
         docx_to_txt_outdir = args.docx_to_txt_outdir,
-        docx_to_txt = args.docx_to_txt
+        docx_to_txt = args.docx_to_txt,
+        profile = args.profile,
+        check = args.check,
+        batch = args.batch,
+        jobs = args.jobs,
+        cache = args.cache,
+        style_cache = args.style_cache,
+        no_style_cache = args.no_style_cache,
+        image_dpi = args.image_dpi,
+        image_cache = args.image_cache,
+        no_image_cache = args.no_image_cache,
+        no_prefetch = args.no_prefetch,
+        stream = args.stream,
+        compression = args.compression,
+        watch = args.watch,
+        serve = args.serve,
+        queue_size = args.queue_size,
+        timeout = args.timeout,
+        allow_remote = args.allow_remote
     )
 
     return (inpath, outpath)
@@ -194,13 +444,97 @@ def init_gostdocx(**kwargs):
         il = GdocxParsing.INDENT_DEFAULT_LENGTH
     GdocxParsing.INDENT_STRING = ic * il
     
+    global STARTUP_INPUT_DIR
+    STARTUP_INPUT_DIR = None
     if input_dir is not None:
-        global STARTUP_INPUT_DIR
         STARTUP_INPUT_DIR = GdocxCommon.AbsPath(input_dir)
 
     GdocxParsing.STRIP_INDENT = kwargs.get('strip_indent')
     GdocxParsing.SKIP_EMPTY = kwargs.get('skip_empty')
-    SKIP_NUMBERING = kwargs.get('skip_numbering')
+    global SKIP_NUMBERING
+    SKIP_NUMBERING = bool(kwargs.get('skip_numbering'))
+
+    global PROFILE_PATH
+    PROFILE_PATH = None
+    if kwargs.get('profile') is not None:
+        PROFILE_PATH = GdocxCommon.AbsPath(kwargs.get('profile'))
+
+    global CHECK_ONLY
+    CHECK_ONLY = bool(kwargs.get('check'))
+
+    global BATCH, BATCH_JOBS
+    BATCH = kwargs.get('batch')
+    if kwargs.get('jobs') is not None:
+        BATCH_JOBS = kwargs.get('jobs')
+
+    global CACHE_DIR
+    CACHE_DIR = None
+    if kwargs.get('cache') is not None:
+        CACHE_DIR = GdocxCommon.AbsPath(kwargs.get('cache'))
+
+    # compiled styles of default.json and load-style files, see GdocxStyle.
+    # They're kept on disk only if style_cache is given, True for the default dir.
+    # Checking doesn't use styles, so GdocxStyle isn't imported for it
+    style_cache = None
+    if not CHECK_ONLY:
+        import GdocxStyle
+        if kwargs.get('no_style_cache'):
+            style_cache = None
+        elif kwargs.get('style_cache') is True:
+            style_cache = GdocxStyle.default_compiled_styles_dir()
+        elif kwargs.get('style_cache') is not None:
+            style_cache = GdocxCommon.AbsPath(kwargs.get('style_cache'))
+        GdocxStyle.set_compiled_styles_dir(style_cache)
+
+    # downscaled images, see GdocxImage. Kept on disk as compiled styles are
+    global IMAGE_DPI
+    IMAGE_DPI = 0
+    if kwargs.get('image_dpi') is not None:
+        IMAGE_DPI = kwargs.get('image_dpi')
+    image_cache = None
+    if not CHECK_ONLY:
+        import GdocxImage
+        if kwargs.get('no_image_cache'):
+            image_cache = None
+        elif kwargs.get('image_cache') is True:
+            image_cache = GdocxImage.default_image_cache_dir()
+        elif kwargs.get('image_cache') is not None:
+            image_cache = GdocxCommon.AbsPath(kwargs.get('image_cache'))
+        GdocxImage.set_image_cache_dir(image_cache)
+
+    global PREFETCH
+    PREFETCH = not kwargs.get('no_prefetch')
+
+    global STREAM
+    STREAM = bool(kwargs.get('stream'))
+    if STREAM and CACHE_DIR is not None:
+        print("ERROR: --stream can't be used with --cache")
+        exit(1)
+
+    global COMPRESSION
+    if kwargs.get('compression') is not None:
+        COMPRESSION = kwargs.get('compression')
+
+    global WATCH
+    WATCH = bool(kwargs.get('watch'))
+
+    global SERVE, SERVE_QUEUE_SIZE, SERVE_TIMEOUT, SERVE_ALLOW_REMOTE
+    SERVE = kwargs.get('serve')
+    SERVE_ALLOW_REMOTE = bool(kwargs.get('allow_remote'))
+    if kwargs.get('queue_size') is not None:
+        SERVE_QUEUE_SIZE = kwargs.get('queue_size')
+    if kwargs.get('timeout') is not None:
+        SERVE_TIMEOUT = kwargs.get('timeout') if kwargs.get('timeout') > 0 else None
+
+    global INIT_KWARGS
+    INIT_KWARGS = dict(kwargs)
+    INIT_KWARGS['input_dir'] = STARTUP_INPUT_DIR
+    INIT_KWARGS['profile'] = PROFILE_PATH
+    INIT_KWARGS['cache'] = CACHE_DIR
+    INIT_KWARGS['style_cache'] = style_cache
+    INIT_KWARGS['no_style_cache'] = style_cache is None
+    INIT_KWARGS['image_cache'] = image_cache
+    INIT_KWARGS['no_image_cache'] = image_cache is None
 
     CONVERT_DOCX_TO_TXT = kwargs.get('docx_to_txt')
     if CONVERT_DOCX_TO_TXT:
@@ -215,20 +549,61 @@ def init_gostdocx(**kwargs):
 if __name__ == "__main__":
     inpath, outpath = process_args()
 
-    # resolve abs paths before switching to STARTUP_INPUT_DIR
-    inpath = GdocxCommon.AbsPath(inpath)
-    outpath = GdocxCommon.AbsPath(outpath)
-
     # init default styles, which is in a sibling file to the script
     absScriptPath = os.path.dirname(os.path.realpath(__file__))
     absDefaultStylesPath = os.path.join(absScriptPath, PATH_DEFAULT_STYLES)
+
+    if BATCH is not None:
+        import GdocxBatch
+        try:
+            jobs = GdocxBatch.collect_jobs(BATCH, outpath)
+        except Exception as e:
+            print(f"ERROR: {e}")
+            exit(1)
+        failed = 0
+        start = time.perf_counter()
+        for result in GdocxBatch.run_batch(jobs, BATCH_JOBS, INIT_KWARGS, absDefaultStylesPath):
+            print(result)
+            if not result.ok:
+                failed += 1
+        print(f"{len(jobs) - failed} converted, {failed} failed in {time.perf_counter() - start:.2f}s")
+        exit(1 if failed != 0 else 0)
+
+    if SERVE is not None:
+        import GdocxServe
+        if not SERVE.startswith("unix:"):
+            try:
+                GdocxServe.parse_address(SERVE, SERVE_ALLOW_REMOTE)
+            except Exception as e:
+                print(f"ERROR: {e}")
+                exit(1)
+        GdocxServe.serve(SERVE, BATCH_JOBS, SERVE_QUEUE_SIZE, SERVE_TIMEOUT, INIT_KWARGS, absDefaultStylesPath, SERVE_ALLOW_REMOTE)
+        exit(0)
+
+    # resolve abs paths against the caller's dir, not STARTUP_INPUT_DIR
+    inpath = GdocxCommon.AbsPath(inpath)
+
+    if CHECK_ONLY:
+        errors = check_txt(inpath)
+        for error in errors:
+            print(error)
+        if len(errors) != 0:
+            exit(1)
+        print(f"\'{inpath}\': no errors found")
+        exit(0)
+
+    outpath = GdocxCommon.AbsPath(outpath)
+    import GdocxStyle
     GdocxStyle.init_default_styles(absDefaultStylesPath)
 
-    # if was specified in args, change to it.
-    # otherwise, just stays in the directory of the caller
-    os.chdir(STARTUP_INPUT_DIR)
+    # paths in the source are resolved against STARTUP_INPUT_DIR
+    # by the context of conversion, the process stays in the caller's dir
 
-    if not CONVERT_DOCX_TO_TXT:
+    if WATCH:
+        import GdocxWatch
+        # contexts get options of this module, which is __main__, not main
+        GdocxWatch.watch(inpath, outpath, create_context)
+    elif not CONVERT_DOCX_TO_TXT:
         process_txt(inpath, outpath)
         print(f"\'{outpath}\' created")
     else: